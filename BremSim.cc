@@ -3,7 +3,7 @@
 //G4 built in files we want to include
 #include "G4UImanager.hh"
 #include "G4UIExecutive.hh"
-#include "G4RunManagerFactory.hh" 
+#include "G4RunManagerFactory.hh"
 #include "G4VisExecutive.hh"
 #include "G4SteppingVerbose.hh"
 #include "G4Threading.hh"
@@ -17,25 +17,86 @@ using namespace BremSim;
 
 // for printing (debugging)
 #include <iostream>
+#include <filesystem>
+#include <string>
+#include <stdexcept>
 using namespace std;
 
+namespace
+{
+	void PrintUsage()
+	{
+		G4cerr << " Usage: " << G4endl;
+		G4cerr << " BremSim [macro] [-m macro] [-t nThreads] [-r MT|tasking|serial] [-s seed] [-o outputDir]" << G4endl;
+		G4cerr << "   macro / -m : run the macro in batch mode (no macro: interactive session with visualization)" << G4endl;
+		G4cerr << "   -t         : number of worker threads (default: all cores)" << G4endl;
+		G4cerr << "   -r         : run manager type (default: MT)" << G4endl;
+		G4cerr << "   -s         : random seed (default: 42)" << G4endl;
+		G4cerr << "   -o         : directory for the output files (default: working directory)" << G4endl;
+	}
+}
+
 int main(int argc, char** argv)
 {
+	// parse the command line
+	G4String macro;
+	G4String outputDir;
+	G4String runManagerName = "MT";
+	G4int nThreads = 0; // 0 = all cores
+	long seed = 42; //meaning of life
+
+	for (G4int i = 1; i < argc; i++)
+	{
+		G4String arg = argv[i];
+		G4bool hasValue = (i + 1 < argc);
+
+		try
+		{
+			if (arg == "-m" && hasValue) { macro = argv[++i]; }
+			else if (arg == "-t" && hasValue) { nThreads = std::stoi(argv[++i]); }
+			else if (arg == "-r" && hasValue) { runManagerName = argv[++i]; }
+			else if (arg == "-s" && hasValue) { seed = std::stol(argv[++i]); }
+			else if (arg == "-o" && hasValue) { outputDir = argv[++i]; }
+			else if (arg[0] != '-' && macro.empty()) { macro = arg; } // positional macro, as before
+			else
+			{
+				PrintUsage();
+				return 1;
+			}
+		}
+		// std::invalid_argument / std::out_of_range from std::stoi and std::stol (e.g. -t abc)
+		catch (const std::logic_error&)
+		{
+			G4cerr << " Invalid value for " << arg << ": " << argv[i] << G4endl;
+			PrintUsage();
+			return 1;
+		}
+	}
+
+	G4RunManagerType runManagerType = G4RunManagerType::MT;
+	if (runManagerName == "tasking") { runManagerType = G4RunManagerType::Tasking; }
+	else if (runManagerName == "serial") { runManagerType = G4RunManagerType::Serial; }
+	else if (runManagerName != "MT")
+	{
+		PrintUsage();
+		return 1;
+	}
+
 	// initialize (or don't) a UI
-	G4UIExecutive* ui = nullptr; 
-	if (argc == 1) 
-	{ 
+	G4UIExecutive* ui = nullptr;
+	if (macro.empty())
+	{
 		ui = new G4UIExecutive(argc, argv);
 	}
 
 	// create run manager
-	auto* runManager = G4RunManagerFactory::CreateRunManager(G4RunManagerType::MT);
+	auto* runManager = G4RunManagerFactory::CreateRunManager(runManagerType);
 
 	// Check and set MultiThreading
 	if (runManager->GetRunManagerType() == G4RunManager::masterRM) {
-		G4int nThreads = G4Threading::G4GetNumberOfCores();
+		if (nThreads <= 0) { nThreads = G4Threading::G4GetNumberOfCores(); }
 		runManager->SetNumberOfThreads(nThreads);
-		G4cout << "### RunManager type is MT. Setting number of threads to: " << nThreads << G4endl;
+		G4cout << "### RunManager type is " << runManagerName << ". Setting number of threads to: " << nThreads << G4endl;
 	} else {
 		G4cout << "### RunManager type is Serial." << G4endl;
 	}
@@ -45,25 +106,34 @@ int main(int argc, char** argv)
 	runManager->SetUserInitialization(new PhysicsList());
 	runManager->SetUserInitialization(new ActionInitialization());
 
-	//Initialize visualization
-	G4VisManager* visManager = new G4VisExecutive;
-	visManager->Initialize();
+	//Initialize visualization, only needed for the interactive session
+	G4VisManager* visManager = nullptr;
+	if (ui)
+	{
+		visManager = new G4VisExecutive;
+		visManager->Initialize();
+	}
 
 	// random seed
-	long seed = 42; //meaning of life
 	CLHEP::HepRandom::setTheSeed(seed);
 	G4Random::setTheSeed(seed);
 
-	
+
 	//Start the UI
 	G4UImanager* UImanager = G4UImanager::GetUIpointer();
 
+	// output directory, used by the run action for every output file
+	if (!outputDir.empty())
+	{
+		std::filesystem::create_directories(std::string(outputDir));
+		UImanager->ApplyCommand("/BremSim/output/directory " + outputDir);
+	}
+
 
 	if (!ui) //batch mode
 	{
 		G4String command = "/control/execute ";
-		G4String fileName = argv[1];
-		UImanager->ApplyCommand(command + fileName);
+		UImanager->ApplyCommand(command + macro);
 	}
 	else //interactive mode
 	{
@@ -77,4 +147,4 @@ int main(int argc, char** argv)
 	delete runManager;
 
 	return 0;
-}
\ No newline at end of file
+}
@@ -17,6 +17,7 @@ namespace BremSim
 		G4VPhysicalVolume* Construct() override;
 
 		G4LogicalVolume* GetBremsVolume() const { return fBremsVolume; };
+		G4double GetFoilThickness() const { return fFoilThickness; };
 
 	private:
 		void DefineCommands();
@@ -24,6 +25,8 @@ namespace BremSim
 		G4LogicalVolume* fBremsVolume = nullptr;
 		class G4GenericMessenger* fMessenger = nullptr;
 		G4double fFoilThickness = 0.05; // default value, unit will be handled by messenger or explicit multiplication
+		G4double fFoilMaxStep = 0.; // no step limit in the foil unless set
+		class G4UserLimits* fFoilLimits = nullptr;
 	};
 }
 
@@ -0,0 +1,23 @@
+#ifndef BREMSIM_EVENTACTION_H
+#define BREMSIM_EVENTACTION_H 1
+
+#include "G4UserEventAction.hh"
+
+#include "RunAction.hh"
+
+
+namespace BremSim
+{
+	class EventAction : public G4UserEventAction
+	{
+		public:
+			EventAction(RunAction* runAction);
+			~EventAction() override = default;
+
+			void EndOfEventAction(const G4Event* event) override;
+
+		private:
+			RunAction* fRunAction = nullptr; // convergence check of this thread
+	};
+}
+#endif
@@ -0,0 +1,70 @@
+#ifndef BREMSIM_PHASESPACE_H
+#define BREMSIM_PHASESPACE_H 1
+
+#include "globals.hh"
+#include "G4Threading.hh"
+
+#include <cstdint>
+#include <fstream>
+#include <vector>
+
+
+namespace BremSim
+{
+	// one particle crossing the foil exit face (MeV, mm), read by post_process/phase_space.py
+	struct PhaseSpaceRecord
+	{
+		std::int32_t species; // 0 gamma, 1 e-, 2 e+
+		float energy;
+		float x, y, z;
+		float dx, dy, dz;
+		float weight;
+	};
+	static_assert(sizeof(PhaseSpaceRecord) == 36, "phase-space records must stay packed");
+
+	// file header, the number of primaries is written when the file is closed
+	struct PhaseSpaceHeader
+	{
+		char magic[4] = {'B', 'S', 'P', 'S'};
+		std::int32_t version = 1;
+		std::int32_t recordSize = sizeof(PhaseSpaceRecord);
+		std::int32_t reserved = 0;
+		std::int64_t primaries = 0;
+	};
+	static_assert(sizeof(PhaseSpaceHeader) == 24, "phase-space header must stay packed");
+
+
+	// shared by all worker threads, records are appended in blocks
+	class PhaseSpaceWriter
+	{
+		public:
+			void Open(const G4String& fileName);
+			void Write(const std::vector<PhaseSpaceRecord>& records);
+			void Close(G4long primaries);
+
+			G4bool IsOpen() const { return fFile.is_open(); };
+
+		private:
+			std::ofstream fFile;
+			G4Mutex fMutex;
+	};
+
+
+	// shared by all worker threads, every record is handed out once
+	class PhaseSpaceReader
+	{
+		public:
+			void Open(const G4String& fileName);
+			G4bool Next(PhaseSpaceRecord& record);
+
+			G4String GetFileName() const { return fFileName; };
+			G4long GetPrimaries() const { return fHeader.primaries; };
+
+		private:
+			std::ifstream fFile;
+			G4String fFileName = "";
+			PhaseSpaceHeader fHeader;
+			G4Mutex fMutex;
+	};
+}
+#endif
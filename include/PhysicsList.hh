@@ -2,6 +2,7 @@
 #define BREMSIM_PHYSICSLIST_H 1
 
 #include "G4VModularPhysicsList.hh"
+#include "G4GenericMessenger.hh"
 
 
 namespace BremSim
@@ -10,12 +11,29 @@ namespace BremSim
 	{
 		public:
 			PhysicsList();
-			virtual ~PhysicsList() override = default;
+			virtual ~PhysicsList() override;
 
 			// mandatory methods to override
 			virtual void ConstructParticle() override;
 			virtual void ConstructProcess() override;
-			
+
+			// bremsstrahlung splitting factor, 1 when unbiased (photons then all have weight 1)
+			G4int GetBremSplittingFactor() const { return fBremSplittingFactor; };
+
+			const G4String& GetEmPhysicsName() const { return fEmPhysicsName; };
+
+		private:
+			void DefineCommands();
+			void SetEmPhysics(G4String name);
+
+			// EM constructor selected with /BremSim/phys/emPhysics
+			G4String fEmPhysicsName = "standard";
+
+			G4GenericMessenger* fMessenger = nullptr;
+
+			// bremsstrahlung splitting (secondary biasing of eBrem)
+			G4int fBremSplittingFactor = 1;
+			G4double fBremSplittingEnergyLimit = 100.; // MeV, set in the constructor
 	};
 }
 #endif
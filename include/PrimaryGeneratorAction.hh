@@ -8,6 +8,9 @@
 #include "globals.hh"
 #include "G4SystemOfUnits.hh"
 #include "G4ParticleGun.hh"
+#include "G4GenericMessenger.hh"
+
+#include "PhaseSpace.hh"
 
 
 namespace BremSim
@@ -21,6 +24,22 @@ namespace BremSim
 			virtual void GeneratePrimaries(G4Event*);
 
 			G4ParticleGun* fParticleGun;
+
+		private:
+			void DefineCommands();
+			void SetPhaseSpaceFile(G4String fileName);
+
+			G4GenericMessenger* fMessenger = nullptr;
+
+			// replay of a phase-space file written with /BremSim/phaseSpace/record, one record per event
+			G4bool fReplay = false;
+			G4ParticleDefinition* fSpecies[3] = {nullptr, nullptr, nullptr};
+
+			// the beam gun, restored when the replay is turned off
+			G4ParticleDefinition* fBeamParticle = nullptr;
+			G4ThreeVector fBeamDirection;
+			G4double fBeamEnergy = 0.;
+			static PhaseSpaceReader fPhaseSpaceReader;
 	};
 }
 #endif
\ No newline at end of file
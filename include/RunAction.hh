@@ -4,16 +4,28 @@
 #include "G4UserRunAction.hh"
 #include "globals.hh"
 #include "G4AnalysisManager.hh"
+#include "G4GenericMessenger.hh"
 
 // time the run
 #include "G4Timer.hh"
+#include "G4Threading.hh"
+
+#include "PhaseSpace.hh"
+
+#include <map>
+#include <vector>
+#include <atomic>
+
+class G4Step;
+class G4LogicalVolume;
+class G4ParticleDefinition;
 
 
 namespace BremSim
 {
 
 	class HitsCollection;
-	
+
 	class RunAction : public G4UserRunAction
 	{
 		public:
@@ -22,11 +34,142 @@ namespace BremSim
 
 			void BeginOfRunAction(const G4Run* aRun) override;
 			void EndOfRunAction(const G4Run* aRun) override;
-		
+
+			// scoring mode selected with /BremSim/output/scoringMode
+			G4bool IsNtupleScoring() const { return fNtupleScoring; };
+			G4bool IsHistogramScoring() const { return fHistogramScoring; };
+
+			// H1 id of the energy histogram for a particle ID (0 gamma, 1 e-, 2 e+)
+			G4int GetSpeciesH1Id(G4int particleID) const { return fSpeciesH1Ids[particleID]; };
+
+			// ntuple schema selected with /BremSim/output/absNtuple, relNtuple and floatEnergies
+			G4bool IsAbsNtupleActive() const { return fNtupleScoring && fAbsNtuple; };
+			G4bool IsRelNtupleActive() const { return fNtupleScoring && fRelNtuple; };
+			G4bool HasFloatEnergies() const { return fFloatEnergiesBooked; };
+
+			// statistical weight column, booked when bremsstrahlung splitting is active
+			G4bool HasWeightColumn() const { return fWeightColumnBooked; };
+
+			// output file of the current run, inside the output directory
+			G4String GetOutputFileName() const;
+
+			// performance counters, switched on with /BremSim/perf/enable
+			G4bool IsPerfEnabled() const { return fPerfEnabled; };
+			void CountStep(const G4Step* step);
+			void CountNtupleRow(G4int ntupleId) { fNtupleRows[ntupleId]++; };
+
+			// convergence-based early stop, switched on with /BremSim/convergence/enable
+			G4bool IsConvergenceEnabled() const { return fConvergenceEnabled; };
+			void ScoreConvergence(G4double energy, G4double weight);
+			void EndOfEvent();
+
+			// phase-space file of the particles leaving the foil, switched on with /BremSim/phaseSpace/record
+			G4bool IsPhaseSpaceRecording() const { return fPhaseSpaceRecording; };
+			void RecordPhaseSpace(const PhaseSpaceRecord& record);
+
 		private:
+			// counters of one worker thread for one run
+			struct PerfRecord
+			{
+				G4int threadId = -1;
+				G4int events = 0;
+				G4double seconds = 0.;
+				G4long ntupleRows[2] = {0, 0};
+			};
+
+			// step and track counts per (volume, species)
+			struct StepCounts
+			{
+				G4long steps = 0;
+				G4long tracks = 0;
+			};
+
+			void DefineCommands();
+			void SetScoringMode(G4String mode);
+
+			// output file name without the .root extension, for the files written next to it
+			G4String GetOutputStem() const;
+
+			// create ntuples and histograms (first run) and apply the current binning
+			void Book();
+			std::vector<G4double> GetBinEdges() const;
+
+			G4GenericMessenger* fMessenger = nullptr;
+			G4bool fBooked = false;
+
+			// directory the output files are written to (BremSim -o)
+			G4String fOutputDirectory = "";
+
+			// scoring mode
+			G4String fScoringMode = "ntuple";
+			G4bool fNtupleScoring = true;
+			G4bool fHistogramScoring = false;
+
+			// histogram binning, either uniform or read from a bin edges file
+			G4int fNBins = 2000;
+			G4double fMinEnergy = 0.;
+			G4double fMaxEnergy = 5.05; // MeV, set in the constructor
+			G4String fBinEdgesFile = "";
+			G4int fSpeciesH1Ids[3] = {0, 1, 2};
+
+			// ntuple schema, the column types are fixed once the ntuples are booked
+			G4bool fAbsNtuple = true;
+			G4bool fRelNtuple = true;
+			G4bool fFloatEnergies = false;
+			G4bool fFloatEnergiesBooked = false;
+			G4bool fWeightColumnBooked = false;
+
+			// merge worker ntuples into one file, or keep one file per worker thread (<name>_t<N>.root)
+			G4bool fMergeNtuples = true;
+			G4bool fMergeNtuplesBooked = true;
+
 			// just want to save the amount of time per action
 			G4Timer fTimer;
 			void PrintTime();
+
+			// performance counters of this thread, collected by the master at the end of the run
+			void CollectPerf(const G4Run* run);
+			void WritePerf(const G4Run* run);
+
+			G4GenericMessenger* fPerfMessenger = nullptr;
+			G4bool fPerfEnabled = false;
+			G4long fNtupleRows[2] = {0, 0};
+			std::map<std::pair<const G4LogicalVolume*, const G4ParticleDefinition*>, StepCounts> fStepCounts;
+
+			// records of all workers, filled before the master's EndOfRunAction
+			static std::vector<PerfRecord> fPerfRecords;
+			static std::map<std::pair<G4String, G4String>, StepCounts> fPerfStepCounts;
+			static G4Mutex fPerfMutex;
+
+			// photon spectrum statistics of this thread since the last check, in the output binning
+			G4bool CheckConvergence();
+
+			G4GenericMessenger* fConvergenceMessenger = nullptr;
+			G4bool fConvergenceEnabled = false;
+			G4int fCheckInterval = 10000;
+			G4double fTargetError = 0.01;
+			G4int fMinBinEntries = 100;
+			G4double fPeakFraction = 0.1;
+			G4int fEventsSinceCheck = 0;
+			std::vector<G4double> fSpectrumEdges;
+			std::vector<G4double> fSumW, fSumW2;
+			std::vector<G4long> fEntries;
+
+			// statistics of all threads, reset by the master at the start of the run
+			static std::vector<G4double> fSharedSumW, fSharedSumW2;
+			static std::vector<G4long> fSharedEntries;
+			static std::atomic<G4bool> fConverged;
+			static G4Mutex fConvergenceMutex;
+
+			// number of events simulated, filled by the workers so the sum survives the histogram merge
+			G4int fEventCountH1Id = 3;
+
+			// phase space at the foil exit, buffered per thread and written to one shared file
+			G4GenericMessenger* fPhaseSpaceMessenger = nullptr;
+			G4bool fPhaseSpaceRecording = false;
+			G4int fPhaseSpaceBufferSize = 65536;
+			std::vector<PhaseSpaceRecord> fPhaseSpaceBuffer;
+			static PhaseSpaceWriter fPhaseSpaceWriter;
 	};
 }
-#endif
\ No newline at end of file
+#endif
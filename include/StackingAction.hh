@@ -0,0 +1,30 @@
+#ifndef BREMSIM_STACKINGACTION_H
+#define BREMSIM_STACKINGACTION_H 1
+
+#include "G4UserStackingAction.hh"
+#include "G4GenericMessenger.hh"
+#include "G4LogicalVolume.hh"
+
+
+namespace BremSim
+{
+	class StackingAction : public G4UserStackingAction
+	{
+		public:
+			StackingAction();
+			~StackingAction() override;
+
+			G4ClassificationOfNewTrack ClassifyNewTrack(const G4Track* track) override;
+
+		private:
+			void DefineCommands();
+
+			G4GenericMessenger* fMessenger = nullptr;
+
+			// score-and-kill: secondaries are scored by the stepping action when they are created,
+			// killSecondaries keeps only the electrons in the foil that can still radiate
+			G4bool fKillSecondaries = false;
+			G4bool fKillOutsideFoil = false;
+	};
+}
+#endif
@@ -3,6 +3,9 @@
 
 #include "G4UserSteppingAction.hh"
 #include "G4LogicalVolume.hh"
+#include "G4GenericMessenger.hh"
+
+#include "RunAction.hh"
 
 
 namespace BremSim
@@ -10,13 +13,29 @@ namespace BremSim
     class SteppingAction : public G4UserSteppingAction
     {
         public: 
-            SteppingAction();
+            SteppingAction(RunAction* runAction);
             ~SteppingAction();
 
             void UserSteppingAction(const G4Step*) override;
         
         private:
+            void DefineCommands();
+            void SetScoredSpecies(G4String species);
+
+            // phase space of the particles crossing the downstream face of the foil
+            void RecordFoilExit(const G4Step* step, G4double foilThickness);
+
+            G4GenericMessenger* fMessenger = nullptr;
+
+            // secondaries below this energy or of an unselected species are not scored
+            G4double fMinEnergy = 0.;
+            G4bool fScoreSpecies[3] = {true, true, true}; // gamma, e-, e+
+
+            // score-and-kill: tracks leaving the foil cannot add to the scored secondaries
+            G4bool fKillOnFoilExit = false;
+
             G4LogicalVolume* fBremsVolume = nullptr;
+            RunAction* fRunAction = nullptr; // scoring mode, histogram ids and performance counters of this thread
     };
 }
 #endif
\ No newline at end of file
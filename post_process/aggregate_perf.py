@@ -0,0 +1,100 @@
+import os
+import csv
+import glob
+import json
+import argparse
+from collections import defaultdict
+
+# Written by BremSim next to every output file when /BremSim/perf/enable is set
+PERF_SUFFIX = "_perf.json"
+
+def load_perf_files(data_dir):
+    """
+    Returns the performance records of all runs in data_dir, sorted by file name.
+    """
+    records = []
+    for path in sorted(glob.glob(os.path.join(data_dir, "*" + PERF_SUFFIX))):
+        with open(path) as f:
+            record = json.load(f)
+        record["perf_file"] = path
+        records.append(record)
+    return records
+
+def run_table(records):
+    """
+    One row per run: throughput and how evenly the work was spread over the worker threads.
+    """
+    rows = []
+    for r in records:
+        threads = r["threads"]
+        rates = [t["events_per_s"] for t in threads if t["events"] > 0]
+        rows.append({
+            "output": os.path.basename(r["output"]),
+            "events": r["events"],
+            "seconds": round(r["seconds"], 3),
+            "events_per_s": round(r["events_per_s"], 1),
+            "threads": len(threads),
+            "min_thread_events_per_s": round(min(rates), 1) if rates else 0.0,
+            "max_thread_events_per_s": round(max(rates), 1) if rates else 0.0,
+            "abs_ntuple_rows": sum(t["abs_ntuple_rows"] for t in threads),
+            "rel_ntuple_rows": sum(t["rel_ntuple_rows"] for t in threads),
+        })
+    return rows
+
+def step_table(records):
+    """
+    Step and track counts per (volume, species), summed over all runs, with the share of all steps.
+    """
+    totals = defaultdict(lambda: {"steps": 0, "tracks": 0})
+    for r in records:
+        for s in r["steps"]:
+            key = (s["volume"], s["species"])
+            totals[key]["steps"] += s["steps"]
+            totals[key]["tracks"] += s["tracks"]
+
+    all_steps = sum(t["steps"] for t in totals.values()) or 1
+    rows = [{"volume": volume, "species": species, "steps": t["steps"], "tracks": t["tracks"],
+             "step_fraction": round(t["steps"] / all_steps, 4)}
+            for (volume, species), t in totals.items()]
+    rows.sort(key=lambda row: row["steps"], reverse=True)
+    return rows
+
+def write_csv(rows, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Saved {path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate the BremSim performance counters (*_perf.json) of a campaign.")
+    parser.add_argument("data_dir", help="Directory with the BremSim output files")
+    parser.add_argument("--csv-prefix", default=None, help="Also save <prefix>_runs.csv and <prefix>_steps.csv")
+    args = parser.parse_args()
+
+    records = load_perf_files(args.data_dir)
+    if not records:
+        print(f"No *{PERF_SUFFIX} files in {args.data_dir} (run BremSim with /BremSim/perf/enable true)")
+        raise SystemExit(1)
+
+    runs = run_table(records)
+    steps = step_table(records)
+
+    print(f"{'output':<40}{'events':>10}{'evt/s':>12}{'thr':>5}{'min thr/s':>11}{'max thr/s':>11}{'rows':>12}")
+    for r in runs:
+        print(f"{r['output']:<40}{r['events']:>10}{r['events_per_s']:>12}{r['threads']:>5}"
+              f"{r['min_thread_events_per_s']:>11}{r['max_thread_events_per_s']:>11}"
+              f"{r['abs_ntuple_rows'] + r['rel_ntuple_rows']:>12}")
+
+    total_events = sum(r["events"] for r in runs)
+    total_seconds = sum(r["seconds"] for r in runs)
+    if total_seconds > 0:
+        print(f"Total: {total_events} events in {total_seconds:.1f} s ({total_events / total_seconds:.1f} events/s)")
+
+    print(f"\n{'volume':<16}{'species':<10}{'steps':>14}{'tracks':>12}{'share':>8}")
+    for s in steps:
+        print(f"{s['volume']:<16}{s['species']:<10}{s['steps']:>14}{s['tracks']:>12}{s['step_fraction']:>8.1%}")
+
+    if args.csv_prefix:
+        write_csv(runs, args.csv_prefix + "_runs.csv")
+        write_csv(steps, args.csv_prefix + "_steps.csv")
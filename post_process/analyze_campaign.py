@@ -1,129 +1,190 @@
 import os
-import glob
-import re
 import logging
+import time
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 import uproot
-import pandas as pd
+import matplotlib
+matplotlib.use("Agg") # no display needed, also in the worker processes
 import matplotlib.pyplot as plt
 import numpy as np
 
+import profiling
+from catalog import open_catalog
+from worker_dataset import event_branches, WEIGHT_BRANCH
+from quantile_sketch import QuantileSketch, freedman_diaconis_width
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
-def freedman_diaconis(data):
+# Particle Types provided by Geant4 simulation
+PARTICLES = {
+    0: {"name": "Photons", "color": "blue"},
+    1: {"name": "Electrons", "color": "red"},
+    2: {"name": "Positrons", "color": "green"}
+}
+
+TREE_NAME = "Absolute Energies"
+
+# Plots and caches belong to the configuration: with per-thread output (<name>_t<N>.root) they are
+# named after the logical file <name>.root and built from all of its files.
+def cache_path(logical_path):
+    return os.path.splitext(logical_path)[0] + "_spectra.npz"
+
+def plot_path(logical_path):
+    return os.path.splitext(logical_path)[0] + "_spectra.png"
+
+def is_up_to_date(target, sources):
+    return os.path.exists(target) and all(os.path.getmtime(target) >= os.path.getmtime(s) for s in sources)
+
+def _iterate(file_paths, step_size, weighted=False):
     """
-    Calculate optimal bin width using Freedman-Diaconis rule.
-    Bin Width = 2 * IQR * n^(-1/3)
+    Chunks of the event tree of every file in turn, with the weights of biased runs if weighted.
     """
-    if len(data) < 2:
-        return 0.1
-    # Check for zero range
-    if data.max() == data.min():
-        return 0.1
-        
-    q75, q25 = np.percentile(data, [75 ,25])
-    iqr = q75 - q25
-    n = len(data)
-    
-    if iqr == 0:
-        # Fallback if IQR is 0 (e.g. all data is same or very concentrated)
-        # Use std dev based rule or simple fixed count
-        std = np.std(data)
-        if std == 0:
-            return 0.1
-        bin_width = 3.5 * std * (n ** (-1/3))
-        return bin_width
-        
-    bin_width = 2 * iqr * (n ** (-1/3))
-    return bin_width
-
-def process_file(file_path):
+    for file_path in file_paths:
+        with uproot.open(file_path) as file:
+            if TREE_NAME not in file:
+                logging.warning(f"Tree '{TREE_NAME}' not found in {file_path}")
+                continue
+            tree = file[TREE_NAME]
+            branches = event_branches(tree) if weighted else ["AbsEnergy", "ParticleID"]
+            yield from tree.iterate(branches, step_size=step_size, library="np")
+
+@profiling.profiled("analyze.histogram")
+def histogram_files(file_paths, step_size="100 MB"):
     """
-    Processes a single ROOT file and generates a spectrum plot.
+    Histograms the raw events of one configuration (all of its files) once, with Freedman-Diaconis bins per species.
+    Two streaming passes: quantile sketches for the bin width, then the histograms.
+    Returns {pid: (counts, edges)}, or None if the files hold no events.
+    """
+    # pass 1: bin width per species
+    sketches = {pid: QuantileSketch() for pid in PARTICLES}
+    for chunk in _iterate(file_paths, step_size, weighted=True):
+        weights = chunk.get(WEIGHT_BRANCH)
+        for pid in PARTICLES:
+            mask = chunk["ParticleID"] == pid
+            sketches[pid].update(chunk["AbsEnergy"][mask], weights[mask] if weights is not None else None)
+
+    if all(sketch.entries == 0 for sketch in sketches.values()):
+        logging.warning(f"No data in {', '.join(os.path.basename(f) for f in file_paths)}")
+        return None
+
+    edges = {}
+    for pid, sketch in sketches.items():
+        if sketch.entries == 0:
+            continue
+        # Calculate bins using Freedman-Diaconis
+        bw = freedman_diaconis_width(sketch)
+        if bw > 0 and sketch.max > sketch.min:
+            bins = int((sketch.max - sketch.min) / bw)
+            bins = max(10, min(bins, 200)) # Safety Limits
+        else:
+            bins = 100
+        edges[pid] = np.linspace(sketch.min, sketch.max if sketch.max > sketch.min else sketch.min + 1e-3, bins + 1)
+
+    # pass 2: histograms, weighted for biased (bremsstrahlung splitting) runs
+    counts = {pid: np.zeros(len(e) - 1) for pid, e in edges.items()}
+    for chunk in _iterate(file_paths, step_size, weighted=True):
+        weights = chunk.get(WEIGHT_BRANCH)
+        for pid in edges:
+            selected = chunk["ParticleID"] == pid
+            hist, _ = np.histogram(chunk["AbsEnergy"][selected], bins=edges[pid],
+                                   weights=weights[selected] if weights is not None else None)
+            counts[pid] += hist
+
+    return {pid: (counts[pid], edges[pid]) for pid in edges}
+
+def load_spectra(logical_path, files):
     """
+    Returns the cached histograms of a configuration, rebuilding the cache if one of its files is newer.
+    """
+    cache = cache_path(logical_path)
+    if is_up_to_date(cache, files):
+        with np.load(cache) as cached:
+            return {pid: (cached[f"counts_{pid}"], cached[f"edges_{pid}"]) for pid in PARTICLES if f"counts_{pid}" in cached}
+
+    spectra = histogram_files(files)
+    if spectra is not None:
+        arrays = {}
+        for pid, (counts, edges) in spectra.items():
+            arrays[f"counts_{pid}"] = counts
+            arrays[f"edges_{pid}"] = edges
+        np.savez(cache, **arrays)
+    return spectra
+
+@profiling.profiled("analyze.process_configuration")
+def process_configuration(logical_path, files=None, force=False):
+    """
+    Plots the spectra of one configuration from its cached histograms. files are the files holding
+    its events (catalog configuration "files"), by default the logical file itself.
+    Skipped when the plot is newer than the files, unless force is set.
+    Returns "plotted", "skipped", "empty" or "error".
+    """
+    files = files or [logical_path]
+    output_path = plot_path(logical_path)
+    if not force and is_up_to_date(output_path, files):
+        return "skipped"
+
     try:
-        with uproot.open(file_path) as file:
-            tree_name = "Absolute Energies"
-            if tree_name not in file:
-                logging.warning(f"Tree '{tree_name}' not found in {file_path}")
-                return
-
-            df = file[tree_name].arrays(["AbsEnergy", "ParticleID"], library="pd")
-            
-            if df.empty:
-                logging.warning(f"No data in {file_path}")
-                return
-
-            # Plotting
-            plt.figure(figsize=(10, 6))
-            
-            # Particle Types provided by Geant4 simulation
-            particles = {
-                0: {"name": "Photons", "color": "blue"},
-                1: {"name": "Electrons", "color": "red"},
-                2: {"name": "Positrons", "color": "green"}
-            }
-
-            has_data = False
-            for pid, info in particles.items():
-                subset = df[df["ParticleID"] == pid]["AbsEnergy"]
-                if not subset.empty:
-                    # Calculate bins using Freedman-Diaconis
-                    bw = freedman_diaconis(subset)
-                    if bw > 0:
-                        bins = int((subset.max() - subset.min()) / bw)
-                        bins = max(10, min(bins, 200)) # Safety Limits
-                    else:
-                        bins = 100
-
-                    plt.hist(subset, bins=bins, log=True, histtype='step', linewidth=2, 
-                             label=info["name"], color=info["color"])
-                    has_data = True
-            
-            if has_data:
-                plt.title(f"Particle Spectra\n{os.path.basename(file_path)}")
-                plt.xlabel("Energy (MeV)")
-                plt.ylabel("Counts")
-                plt.legend()
-                plt.grid(True, which="both", ls="--", alpha=0.5)
-                
-                # Save plot
-                output_path = os.path.splitext(file_path)[0] + "_spectra.png"
-                plt.savefig(output_path)
-                plt.close()
-                logging.info(f"Saved plot: {output_path}")
-            else:
-                plt.close()
-                logging.info(f"No relevant particles found in {os.path.basename(file_path)}")
+        spectra = load_spectra(logical_path, files)
+        if not spectra:
+            logging.info(f"No relevant particles found in {os.path.basename(logical_path)}")
+            return "empty"
+
+        # Plotting
+        fig, ax = plt.subplots(figsize=(10, 6))
+        for pid, (counts, edges) in spectra.items():
+            info = PARTICLES[pid]
+            ax.stairs(counts, edges, linewidth=2, label=info["name"], color=info["color"])
+
+        ax.set_yscale("log")
+        ax.set_title(f"Particle Spectra\n{os.path.basename(logical_path)}")
+        ax.set_xlabel("Energy (MeV)")
+        ax.set_ylabel("Counts")
+        ax.legend()
+        ax.grid(True, which="both", ls="--", alpha=0.5)
+
+        # Save plot
+        fig.savefig(output_path)
+        plt.close(fig)
+        return "plotted"
 
     except Exception as e:
-        logging.error(f"Error processing {file_path}: {e}")
+        logging.error(f"Error processing {logical_path}: {e}")
+        return "error"
 
-def analyze_campaign(data_dir):
+@profiling.profiled("analyze")
+def analyze_campaign(data_dir, force=False, max_workers=None):
     """
-    Scans for ROOT files and generates plots for each.
+    Generates one plot per configuration with ntuple rows, in parallel.
+    The configurations are taken from the campaign catalog, empty ones are never opened.
     """
-    # Find all ROOT files recursively or just in the top level? 
-    pattern = os.path.join(data_dir, "*.root")
-    files = glob.glob(pattern)
-    
-    if not files:
+    with open_catalog(data_dir) as catalog:
+        configs = catalog.configurations(data_dir, require_events=True)
+
+    if not configs:
         logging.warning(f"No .root files found in {data_dir}")
         return
 
-    logging.info(f"Found {len(files)} ROOT files in {data_dir}. Processing...")
-    
-    for f in files:
-        process_file(f)
+    logging.info(f"Found {len(configs)} configurations in {data_dir}. Processing...")
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(process_configuration, [c["logical"] for c in configs], [c["files"] for c in configs],
+                                [force] * len(configs), chunksize=8))
+
+    summary = {status: results.count(status) for status in sorted(set(results))}
+    logging.info(f"Done in {time.perf_counter() - start:.1f} s: {summary}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Analyze BremSim ROOT files.")
     parser.add_argument("data_dir", nargs="?", default=None, help="Directory containing ROOT files")
+    parser.add_argument("--force", action="store_true", help="Re-plot every configuration (from the cached histograms), e.g. after a style change")
+    parser.add_argument("--workers", type=int, default=None, help="Plotting processes (default: all cores)")
     args = parser.parse_args()
 
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    
+
     # Target directory logic
     if args.data_dir:
         target_dir = args.data_dir
@@ -136,6 +197,6 @@ if __name__ == "__main__":
             target_dir = "."
 
     if os.path.exists(target_dir):
-        analyze_campaign(target_dir)
+        analyze_campaign(target_dir, force=args.force, max_workers=args.workers)
     else:
         logging.error(f"Target directory does not exist: {target_dir}")
@@ -0,0 +1,103 @@
+import os
+import sys
+import csv
+import argparse
+import tempfile
+import numpy as np
+
+from spectra_io import read_histogram_spectra, read_histogram_variances
+from bench_common import write_macro, run_macro, chi2_ndf
+
+def run(exe_path, work_dir, splitting, thickness, energy, events):
+    """
+    Runs one configuration and returns (cpu seconds, spectra per primary, variances per primary,
+    photon entries per primary).
+    """
+    name = f"split{splitting}"
+    macro_path = os.path.join(work_dir, f"{name}.mac")
+    output_name = f"{name}.root"
+    # the splitting factor is applied when the physics is built
+    write_macro(macro_path, [(energy, thickness, output_name, events)], pre_init=[f"/BremSim/phys/bremSplitting {splitting}"])
+
+    run_times, _ = run_macro(exe_path, macro_path, work_dir)
+    run_time = run_times[0] if run_times else float("nan")
+
+    output_path = os.path.join(work_dir, output_name)
+    _, spectra = read_histogram_spectra(output_path)
+    variances = read_histogram_variances(output_path)
+
+    # histogram fills per primary: with equal weights (sum w)^2 / sum w^2 is the number of entries,
+    # it grows with the splitting factor while the weighted spectrum stays the same
+    photon_entries = spectra["Photon_Spectrum"].sum() ** 2 / max(variances["Photon_Spectrum"].sum(), 1e-300) / events
+
+    # normalise per primary so runs with different numbers of events compare directly
+    spectra = {k: v / events for k, v in spectra.items()}
+    variances = {k: v / events ** 2 for k, v in variances.items()}
+    return run_time, spectra, variances, photon_entries
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate bremsstrahlung splitting against an unbiased run.")
+    parser.add_argument("exe", help="Path to the BremSim executable")
+    parser.add_argument("--energy", type=float, default=0.5, help="Beam energy in MeV")
+    parser.add_argument("--thickness", default="50 um", help="Foil thickness with unit")
+    parser.add_argument("--events", type=int, default=1000000, help="Primaries of the unbiased reference run")
+    parser.add_argument("--factors", type=int, nargs="+", default=[10, 100], help="Splitting factors to test")
+    parser.add_argument("--event-fraction", type=float, default=0.1,
+                        help="Primaries of the biased runs, as a fraction of the reference")
+    parser.add_argument("--csv", default="brem_splitting_validation.csv", help="Where to save the results")
+    args = parser.parse_args()
+
+    exe = os.path.abspath(args.exe)
+    biased_events = max(1, int(args.events * args.event_fraction))
+    results = []
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        print(f"Reference: unbiased, {args.events} primaries...")
+        ref_time, ref_spectra, ref_vars, ref_entries = run(exe, work_dir, 1, args.thickness, args.energy, args.events)
+        results.append({"splitting": 1, "events": args.events, "run_time_s": round(ref_time, 2),
+                        "cpu_fraction": 1.0, "photon_chi2_ndf": 0.0, "photon_rel_error": None,
+                        "photons_per_primary": round(ref_entries, 4), "yield_gain": 1.0})
+
+        for factor in args.factors:
+            print(f"Splitting {factor}, {biased_events} primaries...")
+            t, spectra, variances, entries = run(exe, work_dir, factor, args.thickness, args.energy, biased_events)
+
+            photons = spectra["Photon_Spectrum"]
+            populated = photons > 0
+            rel_error = np.sqrt(variances["Photon_Spectrum"][populated]).sum() / photons[populated].sum()
+
+            results.append({
+                "splitting": factor,
+                "events": biased_events,
+                "run_time_s": round(t, 2),
+                "cpu_fraction": round(t / ref_time, 3),
+                # ~1 when the biased spectrum matches the reference within statistics
+                "photon_chi2_ndf": round(chi2_ndf(photons, variances["Photon_Spectrum"],
+                                                  ref_spectra["Photon_Spectrum"], ref_vars["Photon_Spectrum"]), 3),
+                "photon_rel_error": round(rel_error, 5),
+                "photons_per_primary": round(entries, 4),
+                "yield_gain": round(entries / ref_entries, 2) if ref_entries > 0 else float("nan"),
+            })
+
+    ref_populated = ref_spectra["Photon_Spectrum"] > 0
+    results[0]["photon_rel_error"] = round(
+        np.sqrt(ref_vars["Photon_Spectrum"][ref_populated]).sum() / ref_spectra["Photon_Spectrum"][ref_populated].sum(), 5)
+
+    print(f"{'split':>6}{'events':>10}{'time s':>9}{'cpu frac':>10}{'chi2/ndf':>10}{'rel err':>10}{'photons/e-':>12}{'gain':>7}")
+    for r in results:
+        print(f"{r['splitting']:>6}{r['events']:>10}{r['run_time_s']:>9}{r['cpu_fraction']:>10}"
+              f"{r['photon_chi2_ndf']:>10}{r['photon_rel_error']:>10}{r['photons_per_primary']:>12}{r['yield_gain']:>7}")
+
+    with open(args.csv, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"Results saved to {args.csv}")
+
+    # splitting that is not applied in the foil leaves the photon count per primary unchanged.
+    # Nearly all photons come from bremsstrahlung in the foil, so the gain should be close to the factor;
+    # less than half of it means the biasing does not reach the foil region.
+    not_split = [r["splitting"] for r in results[1:] if not r["yield_gain"] >= 0.5 * r["splitting"]]
+    if not_split:
+        print(f"FAILED: photons per primary do not grow with splitting factor(s) {not_split}")
+        sys.exit(1)
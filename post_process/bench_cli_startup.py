@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from bremsim_post import STARTUP_BUDGET_S
+
+CLI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bremsim_post.py")
+
+# none of these may be imported by a light subcommand
+HEAVY_MODULES = ["torch", "pandas", "matplotlib", "sklearn", "uproot", "numpy"]
+
+def time_command(argv, repeats):
+    """
+    Median wall time of `repeats` runs of the CLI with argv.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, CLI_PATH] + argv, capture_output=True, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def heavy_imports(argv):
+    """
+    Runs the CLI in-process in a fresh interpreter and returns the heavy modules it imported.
+    """
+    code = (
+        "import sys, runpy\n"
+        f"sys.argv = {[CLI_PATH] + argv!r}\n"
+        "try:\n"
+        f"    runpy.run_path({CLI_PATH!r}, run_name='__main__')\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        f"print('HEAVY:' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    last_line = proc.stdout.strip().splitlines()[-1]
+    return [m for m in last_line[len("HEAVY:"):].split(",") if m]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the startup time of the light bremsim_post subcommands.")
+    parser.add_argument("data_dir", nargs="?", default=None, help="Campaign directory to list (default: an empty temporary directory)")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs per measurement")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET_S, help="Startup budget in seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as empty_dir:
+        argv = ["list", args.data_dir or empty_dir]
+
+        baseline = time_command(["--help"], args.repeats)
+        elapsed = time_command(argv, args.repeats)
+        heavy = heavy_imports(argv)
+
+    print(f"interpreter + argparse (--help): {baseline:.3f} s")
+    print(f"list:                           {elapsed:.3f} s (budget {args.budget:.3f} s)")
+    print(f"heavy modules imported by list: {', '.join(heavy) if heavy else 'none'}")
+
+    if elapsed > args.budget or heavy:
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
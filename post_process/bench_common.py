@@ -0,0 +1,60 @@
+# Shared pieces of the bench_*.py scripts that run BremSim: writing the benchmark macro, running it
+# and reading the run times, and comparing two weighted spectra.
+import os
+import re
+import time
+import subprocess
+import numpy as np
+
+# printed by RunAction at the end of every run
+elapsed_pattern = re.compile(r"Elapsed time: ([\d\.eE+-]+) Seconds")
+
+def write_macro(path, runs, setup=(), pre_init=(), scoring_mode="histogram"):
+    """
+    Writes a benchmark macro. runs is a sequence of (energy_MeV, thickness, output_name, events),
+    thickness as a macro string ('50 um'). pre_init commands come before /run/initialize (physics
+    choices), setup commands after it (worker-thread commands only exist once initialized).
+    scoring_mode None keeps BremSim's default output.
+    """
+    with open(path, "w") as f:
+        for cmd in pre_init:
+            f.write(cmd + "\n")
+        f.write("/run/initialize\n")
+        if scoring_mode is not None:
+            f.write(f"/BremSim/output/scoringMode {scoring_mode}\n")
+        for cmd in setup:
+            f.write(cmd + "\n")
+
+        thickness = None
+        for energy, run_thickness, output_name, events in runs:
+            # the geometry is only rebuilt when the foil changes
+            if run_thickness != thickness:
+                thickness = run_thickness
+                f.write(f"/BremSim/det/setFoilThickness {thickness}\n")
+                f.write("/run/reinitializeGeometry\n")
+            f.write(f"/gun/energy {energy} MeV\n")
+            f.write(f"/analysis/setFileName {output_name}\n")
+            f.write(f"/run/beamOn {events}\n")
+
+def run_macro(exe_path, macro_path, work_dir):
+    """
+    Runs BremSim on a macro in work_dir. Returns (run times as reported by RunAction, one per
+    /run/beamOn in macro order, wall time of the process). Raises RuntimeError if BremSim fails.
+    """
+    start = time.perf_counter()
+    proc = subprocess.run([exe_path, macro_path], cwd=work_dir, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"BremSim failed on {os.path.basename(macro_path)}:\n{proc.stdout[-2000:]}")
+    return [float(m) for m in elapsed_pattern.findall(proc.stdout)], wall
+
+def chi2_ndf(a, var_a, b, var_b):
+    """
+    Chi2/ndf between two independent histograms with known per-bin variances (the counts for
+    unweighted runs), over the bins where either is populated.
+    """
+    var = var_a + var_b
+    populated = var > 0
+    if not populated.any():
+        return 0.0
+    return np.sum((a[populated] - b[populated]) ** 2 / var[populated]) / populated.sum()
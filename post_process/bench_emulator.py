@@ -0,0 +1,100 @@
+import os
+import time
+import argparse
+import statistics
+import numpy as np
+import pandas as pd
+
+from grid_emulator import GridEmulator
+from evaluate_model import (load_resources, model_bin_edges, predict_spectra, predict_spectrum, nominal_scales,
+                            spectrum_metrics)
+from worker_dataset import histogram_campaign
+from catalog import campaign_configurations
+from binning import edges_hash
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def median_latency(predict, repeats):
+    """
+    Median wall time of `repeats` calls of predict().
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predict()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def compare(model_dir, table, bin_edges_path, data_dir, repeats=20):
+    """
+    Accuracy, build time and query latency of the grid emulator against the network
+    on the configurations in data_dir (the non-trained campaign by default).
+    Returns the per-configuration metrics of both predictors.
+    """
+    model, meta = load_resources(model_dir)
+    bin_edges = model_bin_edges(meta)
+
+    start = time.perf_counter()
+    emulator = GridEmulator.from_table(table, bin_edges_path)
+    build_time = time.perf_counter() - start
+    if emulator.binning_sha256 != meta.get("binning_sha256", edges_hash(bin_edges)):
+        raise ValueError("The table and the network use different binnings")
+
+    catalog_configs = campaign_configurations(data_dir)
+    configs = [(c["logical"], c["energy_mev"], c["thickness_um"]) for c in catalog_configs]
+    if not configs:
+        raise FileNotFoundError(f"No files found in {data_dir}")
+
+    truth = histogram_campaign({c["logical"]: c["files"] for c in catalog_configs}, bin_edges)
+    # both predictors are on the event scale of the training table
+    scales = nominal_scales(meta, catalog_configs)[:, np.newaxis]
+    energies = np.array([c[1] for c in configs])
+    thicknesses = np.array([c[2] for c in configs])
+    n = len(configs)
+    energies2, thicknesses2, types2 = np.tile(energies, 2), np.tile(thicknesses, 2), np.repeat([0, 1], n)
+
+    predictors = {
+        "network": lambda: predict_spectra(model, meta, energies2, thicknesses2, types2),
+        "emulator": lambda: emulator.predict_spectra(energies2, thicknesses2, types2),
+    }
+    single = {
+        "network": lambda: predict_spectrum(model, meta, energies[0], thicknesses[0], 0),
+        "emulator": lambda: emulator.predict_spectrum(energies[0], thicknesses[0], 0),
+    }
+
+    rows = []
+    print(f"{n} configurations, {len(bin_edges) - 1} bins, emulator built in {build_time:.3f} s "
+          f"({'regular' if emulator.regular else 'scattered'} grid of {len(emulator.points)})")
+    print(f"{'':<10}{'chi2/ndf':>10}{'rel err':>10}{'integral':>10}{'endpoint':>10}{'1 query ms':>12}{'all ms':>10}")
+    for name, predict in predictors.items():
+        pred = predict()
+        for pid, species in ((0, "photons"), (1, "electrons")):
+            gt = np.array([truth[c[0]][pid] for c in configs]) * scales
+            metrics = spectrum_metrics(gt, pred[pid * n:(pid + 1) * n], bin_edges)
+            for i, c in enumerate(configs):
+                rows.append({"predictor": name, "species": species, "file": os.path.basename(c[0]),
+                             "Energy_MeV": c[1], "Thickness_um": c[2], **{k: v[i] for k, v in metrics.items()}})
+
+        photons = pd.DataFrame([r for r in rows if r["predictor"] == name and r["species"] == "photons"])
+        single_ms = median_latency(single[name], repeats) * 1e3
+        batch_ms = median_latency(predict, max(repeats // 4, 1)) * 1e3
+        print(f"{name:<10}{photons['chi2_ndf'].median():>10.3g}{photons['rel_error'].median():>10.3f}"
+              f"{photons['integral_error'].abs().median():>10.3f}{photons['endpoint_error'].abs().median():>10.3f}"
+              f"{single_ms:>12.3f}{batch_ms:>10.1f}")
+    print("(medians over the photon spectra, errors as absolute values)")
+
+    return pd.DataFrame(rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the grid-interpolation emulator with the network on held-out configurations.")
+    parser.add_argument("--model-dir", default=SCRIPT_DIR, help="Directory with brem_spec_net.pth and model_metadata.pkl")
+    parser.add_argument("--table", default="combined_spectra_table.pkl", help="Training table the emulator is built from")
+    parser.add_argument("--bin-edges", default="binning.json", help="Binning artifact of the table")
+    parser.add_argument("--data-dir", default=os.path.join(SCRIPT_DIR, "non_trained"), help="Held-out output files")
+    parser.add_argument("--repeats", type=int, default=20, help="Runs per latency measurement")
+    parser.add_argument("--csv", default=None, help="Also write the per-configuration metrics")
+    args = parser.parse_args()
+
+    df = compare(args.model_dir, args.table, args.bin_edges, args.data_dir, args.repeats)
+    if args.csv:
+        df.to_csv(args.csv, index=False)
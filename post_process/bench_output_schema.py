@@ -0,0 +1,95 @@
+import os
+import csv
+import time
+import argparse
+import tempfile
+import uproot
+
+from bench_common import write_macro, run_macro
+
+# Output schemas to compare. Each entry is the list of macro commands applied before the run.
+SCHEMAS = {
+    "baseline": [],
+    "float_abs_only": [
+        "/BremSim/output/floatEnergies true",
+        "/BremSim/output/relNtuple false",
+    ],
+    "float_abs_only_filtered": [
+        "/BremSim/output/floatEnergies true",
+        "/BremSim/output/relNtuple false",
+        "/BremSim/step/minEnergy 10 keV",
+    ],
+}
+
+def read_time(root_path):
+    """
+    Time to load the "Absolute Energies" tree into numpy arrays, as the post-processing does.
+    """
+    start = time.perf_counter()
+    with uproot.open(root_path) as file:
+        data = file["Absolute Energies"].arrays(["AbsEnergy", "ParticleID"], library="np")
+        n_rows = len(data["AbsEnergy"])
+    return time.perf_counter() - start, n_rows
+
+def benchmark(exe_path, energy, thickness, events):
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, commands in SCHEMAS.items():
+            macro_path = os.path.join(work_dir, f"{name}.mac")
+            output_name = f"bench_{name}.root"
+            # the ntuple output is what is compared
+            write_macro(macro_path, [(energy, thickness, output_name, events)], setup=commands, scoring_mode=None)
+
+            print(f"Running schema '{name}'...")
+            try:
+                run_times, wall = run_macro(exe_path, macro_path, work_dir)
+            except RuntimeError as e:
+                print(e)
+                continue
+
+            # run time as reported by RunAction (includes writing the output)
+            run_time = run_times[0] if run_times else float("nan")
+
+            root_path = os.path.join(work_dir, output_name)
+            size_mb = os.path.getsize(root_path) / 1e6
+            read_s, n_rows = read_time(root_path)
+
+            results.append({
+                "schema": name,
+                "rows": n_rows,
+                "file_size_MB": round(size_mb, 3),
+                "run_time_s": round(run_time, 3),
+                "wall_time_s": round(wall, 3),
+                "uproot_read_s": round(read_s, 3),
+            })
+    return results
+
+def print_table(results):
+    if not results:
+        return
+    base = results[0]
+    print(f"{'schema':<26}{'rows':>12}{'size MB':>10}{'run s':>9}{'read s':>9}{'size x':>8}{'read x':>8}")
+    for r in results:
+        size_ratio = base["file_size_MB"] / r["file_size_MB"] if r["file_size_MB"] else float("nan")
+        read_ratio = base["uproot_read_s"] / r["uproot_read_s"] if r["uproot_read_s"] else float("nan")
+        print(f"{r['schema']:<26}{r['rows']:>12}{r['file_size_MB']:>10.2f}{r['run_time_s']:>9.2f}"
+              f"{r['uproot_read_s']:>9.3f}{size_ratio:>8.2f}{read_ratio:>8.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare BremSim ntuple output schemas (file size, write and read time).")
+    parser.add_argument("exe", help="Path to the BremSim executable")
+    parser.add_argument("--energy", type=float, default=5.0, help="Beam energy in MeV")
+    parser.add_argument("--thickness", default="1.0 mm", help="Foil thickness with unit, e.g. '1.0 mm'")
+    parser.add_argument("--events", type=int, default=100000, help="Primaries per run")
+    parser.add_argument("--csv", default="output_schema_benchmark.csv", help="Where to save the results")
+    args = parser.parse_args()
+
+    results = benchmark(os.path.abspath(args.exe), args.energy, args.thickness, args.events)
+    print_table(results)
+
+    if results:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+        print(f"Results saved to {args.csv}")
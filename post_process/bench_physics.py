@@ -0,0 +1,102 @@
+import os
+import csv
+import argparse
+import itertools
+import tempfile
+import numpy as np
+
+from spectra_io import read_histogram_spectra
+from bench_common import write_macro, run_macro, chi2_ndf
+
+def parse_config(text):
+    """
+    '5.0:1 mm' -> (5.0, '1 mm')
+    """
+    energy, thickness = text.split(":", 1)
+    return float(energy), thickness.strip()
+
+def run_combination(exe_path, physics, cut, max_step, configs, events):
+    """
+    Runs all configurations with one physics setup.
+    Returns (events/sec per config, photon spectra per primary).
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        macro_path = os.path.join(work_dir, "physics.mac")
+        setup = ([f"/run/setCutForRegion FoilRegion {cut}"] if cut != "default" else []) + [f"/BremSim/det/setFoilMaxStep {max_step}"]
+        # the EM constructor is chosen before the physics is built
+        write_macro(macro_path, [(energy, thickness, f"config_{i}.root", events) for i, (energy, thickness) in enumerate(configs)],
+                    setup=setup, pre_init=[f"/BremSim/phys/emPhysics {physics}"])
+
+        try:
+            times, _ = run_macro(exe_path, macro_path, work_dir)
+        except RuntimeError as e:
+            raise RuntimeError(f"{physics}/{cut}/{max_step}: {e}") from None
+        rates, spectra = [], []
+        for i in range(len(configs)):
+            _, histograms = read_histogram_spectra(os.path.join(work_dir, f"config_{i}.root"))
+            spectra.append(histograms["Photon_Spectrum"] / events)
+            rates.append(events / times[i])
+    return rates, spectra
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tabulate speed against spectral fidelity for physics list / cut / step limit combinations.")
+    parser.add_argument("exe", help="Path to the BremSim executable")
+    parser.add_argument("--configs", nargs="+", default=["0.5:50 um", "2.0:500 um", "5.0:1 mm"],
+                        help="Fixed (E, T) subset as 'energy_MeV:thickness'")
+    parser.add_argument("--physics", nargs="+", default=["standard", "option1", "option3", "option4", "livermore", "penelope"],
+                        help="EM constructors to test")
+    parser.add_argument("--cuts", nargs="+", default=["default", "10 um", "100 um"], help="Production cuts in the foil region")
+    parser.add_argument("--max-steps", nargs="+", default=["0 um"], help="Foil step limits (0 = none)")
+    parser.add_argument("--reference", default="option4:1 um:0 um", help="Reference as 'physics:cut:max_step'")
+    parser.add_argument("--events", type=int, default=200000, help="Primaries per configuration")
+    parser.add_argument("--target", type=float, default=2.0, help="Accuracy target: worst photon chi2/ndf against the reference")
+    parser.add_argument("--csv", default="physics_benchmark.csv", help="Where to save the results")
+    args = parser.parse_args()
+
+    exe = os.path.abspath(args.exe)
+    configs = [parse_config(c) for c in args.configs]
+
+    ref_physics, ref_cut, ref_step = args.reference.split(":")
+    print(f"Reference: {ref_physics}, cut {ref_cut}, max step {ref_step}...")
+    _, ref_spectra = run_combination(exe, ref_physics, ref_cut, ref_step, configs, args.events)
+
+    results = []
+    for physics, cut, max_step in itertools.product(args.physics, args.cuts, args.max_steps):
+        print(f"Running {physics}, cut {cut}, max step {max_step}...")
+        try:
+            rates, spectra = run_combination(exe, physics, cut, max_step, configs, args.events)
+        except RuntimeError as e:
+            print(e)
+            continue
+
+        # per-primary Poisson spectra of args.events primaries each
+        deviations = [chi2_ndf(s, s / args.events, r, r / args.events) for s, r in zip(spectra, ref_spectra)]
+        results.append({
+            "physics": physics,
+            "cut": cut,
+            "max_step": max_step,
+            "events_per_s": round(float(np.mean(rates)), 1),
+            "worst_chi2_ndf": round(float(np.max(deviations)), 3),
+            "meets_target": bool(np.max(deviations) <= args.target),
+        })
+
+    results.sort(key=lambda r: r["events_per_s"], reverse=True)
+
+    print(f"{'physics':<12}{'cut':>10}{'max step':>10}{'evt/s':>12}{'chi2/ndf':>10}{'ok':>5}")
+    for r in results:
+        print(f"{r['physics']:<12}{r['cut']:>10}{r['max_step']:>10}{r['events_per_s']:>12}"
+              f"{r['worst_chi2_ndf']:>10}{'yes' if r['meets_target'] else 'no':>5}")
+
+    passing = [r for r in results if r["meets_target"]]
+    if passing:
+        best = passing[0]
+        print(f"Fastest setup meeting the target: {best['physics']}, cut {best['cut']}, max step {best['max_step']}")
+    else:
+        print("No setup meets the accuracy target.")
+
+    if results:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+        print(f"Results saved to {args.csv}")
@@ -0,0 +1,105 @@
+import os
+import re
+import csv
+import argparse
+import tempfile
+
+from spectra_io import read_histogram_spectra
+from bench_common import write_macro, run_macro, chi2_ndf
+
+# Tracking modes to compare, as macro commands applied after /run/initialize
+MODES = {
+    "full": [],
+    "kill_exit": [
+        "/BremSim/step/killOnFoilExit true",
+        "/BremSim/stack/killOutsideFoil true",
+    ],
+    "kill_secondaries": [
+        "/BremSim/step/killOnFoilExit true",
+        "/BremSim/stack/killOutsideFoil true",
+        "/BremSim/stack/killSecondaries true",
+    ],
+}
+
+thickness_pattern = re.compile(r"^/BremSim/det/setFoilThickness (.+)$")
+
+def read_thicknesses(macro_path):
+    """
+    Returns the foil thicknesses (as macro strings, e.g. '5 um') used by a campaign macro.
+    """
+    thicknesses = []
+    with open(macro_path) as f:
+        for line in f:
+            match = thickness_pattern.match(line.strip())
+            if match:
+                thicknesses.append(match.group(1))
+    return thicknesses
+
+def output_name(mode, energy, thickness):
+    return f"bench_{mode}_E_{energy}MeV_T_{thickness.replace(' ', '')}.root"
+
+def benchmark(exe_path, macro_path, energies, events):
+    thicknesses = read_thicknesses(macro_path)
+    print(f"Thicknesses from {macro_path}: {thicknesses}")
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        run_times = {}
+        for mode in MODES:
+            mode_macro = os.path.join(work_dir, f"{mode}.mac")
+            write_macro(mode_macro, [(e, t, output_name(mode, e, t), events) for t in thicknesses for e in energies],
+                        setup=MODES[mode])
+
+            print(f"Running mode '{mode}'...")
+            try:
+                run_times[mode], _ = run_macro(exe_path, mode_macro, work_dir)
+            except RuntimeError as e:
+                print(e)
+                return results
+
+        configs = [(t, e) for t in thicknesses for e in energies]
+        for i, (t, e) in enumerate(configs):
+            _, reference = read_histogram_spectra(os.path.join(work_dir, output_name("full", e, t)))
+            ref_rate = events / run_times["full"][i]
+
+            for mode in MODES:
+                _, spectra = read_histogram_spectra(os.path.join(work_dir, output_name(mode, e, t)))
+                rate = events / run_times[mode][i]
+                results.append({
+                    "mode": mode,
+                    "thickness": t,
+                    "energy_MeV": e,
+                    "events_per_s": round(rate, 1),
+                    "speedup": round(rate / ref_rate, 3),
+                    # unweighted counts, the variance of a bin is its content
+                    "photon_chi2_ndf": round(chi2_ndf(spectra["Photon_Spectrum"], spectra["Photon_Spectrum"],
+                                                      reference["Photon_Spectrum"], reference["Photon_Spectrum"]), 3),
+                    "electron_chi2_ndf": round(chi2_ndf(spectra["Electron_Spectrum"], spectra["Electron_Spectrum"],
+                                                        reference["Electron_Spectrum"], reference["Electron_Spectrum"]), 3),
+                })
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark score-and-kill tracking modes against full tracking.")
+    parser.add_argument("exe", help="Path to the BremSim executable")
+    parser.add_argument("--macro", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "macros", "full_run.mac"),
+                        help="Campaign macro to take the foil thicknesses from")
+    parser.add_argument("--energies", type=float, nargs="+", default=[0.5, 2.0, 5.0], help="Beam energies in MeV")
+    parser.add_argument("--events", type=int, default=100000, help="Primaries per run")
+    parser.add_argument("--csv", default="score_and_kill_benchmark.csv", help="Where to save the results")
+    args = parser.parse_args()
+
+    results = benchmark(os.path.abspath(args.exe), args.macro, args.energies, args.events)
+
+    # chi2/ndf ~ 1 means the spectra agree within statistics
+    print(f"{'mode':<18}{'thickness':>10}{'E MeV':>7}{'evt/s':>11}{'speedup':>9}{'chi2 g':>8}{'chi2 e':>8}")
+    for r in results:
+        print(f"{r['mode']:<18}{r['thickness']:>10}{r['energy_MeV']:>7}{r['events_per_s']:>11}"
+              f"{r['speedup']:>9}{r['photon_chi2_ndf']:>8}{r['electron_chi2_ndf']:>8}")
+
+    if results:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+        print(f"Results saved to {args.csv}")
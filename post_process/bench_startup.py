@@ -0,0 +1,52 @@
+import os
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+def write_macro(path, events):
+    # a short shard: initialization plus a tiny run, so launch cost dominates
+    with open(path, "w") as f:
+        f.write("/run/initialize\n")
+        f.write("/BremSim/output/scoringMode histogram\n")
+        f.write(f"/run/beamOn {events}\n")
+
+def time_launch(cmd, cwd, repeats):
+    """
+    Median wall time of `repeats` launches of cmd.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True)
+        times.append(time.perf_counter() - start)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{' '.join(cmd)} failed:\n{proc.stdout[-2000:]}")
+    return statistics.median(times)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure BremSim launch time for short sharded runs.")
+    parser.add_argument("exe", help="Path to the BremSim executable")
+    parser.add_argument("--baseline-exe", default=None,
+                        help="Older BremSim build to compare against (initializes vis, ignores -t)")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, os.cpu_count()], help="Thread counts to time")
+    parser.add_argument("--events", type=int, default=10, help="Primaries in the short run")
+    parser.add_argument("--repeats", type=int, default=5, help="Launches per measurement")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        macro_path = os.path.join(work_dir, "startup.mac")
+        write_macro(macro_path, args.events)
+
+        baseline = None
+        if args.baseline_exe:
+            baseline = time_launch([os.path.abspath(args.baseline_exe), macro_path], work_dir, args.repeats)
+            print(f"baseline (all cores, vis initialized): {baseline:.2f} s")
+
+        print(f"{'threads':>8}{'launch s':>10}{'vs baseline':>13}")
+        for n in args.threads:
+            cmd = [os.path.abspath(args.exe), "-m", macro_path, "-t", str(n)]
+            t = time_launch(cmd, work_dir, args.repeats)
+            ratio = f"{baseline / t:.2f}x" if baseline else "-"
+            print(f"{n:>8}{t:>10.2f}{ratio:>13}")
@@ -0,0 +1,160 @@
+import os
+import re
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+
+# Recommended configuration, read by run_validation
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thread_config.json")
+
+beam_on_pattern = re.compile(r"^/run/beamOn\s+(\d+)")
+
+def count_events(macro_text):
+    return sum(int(m.group(1)) for m in map(beam_on_pattern.match, macro_text.splitlines()) if m)
+
+def shard_macro(macro_text, n_shards):
+    """
+    Splits a campaign macro into n_shards macros with the runs dealt round-robin.
+    Every run keeps the foil thickness it was configured with.
+    """
+    header, blocks = [], []
+    current, thickness = [], None
+    in_header = True
+
+    for line in macro_text.splitlines():
+        stripped = line.strip()
+        if in_header and (stripped.startswith("/BremSim/det/setFoilThickness") or stripped.startswith("/gun/energy")):
+            in_header = False
+            # comments right above the first configuration belong to it
+            while header and (not header[-1].strip() or header[-1].lstrip().startswith("#")):
+                current.insert(0, header.pop())
+        if in_header:
+            header.append(line)
+            continue
+
+        if stripped.startswith("/BremSim/det/setFoilThickness"):
+            thickness = stripped
+            continue
+        if stripped.startswith("/run/reinitializeGeometry"):
+            continue
+
+        current.append(line)
+        if beam_on_pattern.match(stripped):
+            blocks.append((thickness, current))
+            current = []
+
+    shards = [list(header) for _ in range(n_shards)]
+    last_thickness = [None] * n_shards
+    for i, (block_thickness, block) in enumerate(blocks):
+        s = i % n_shards
+        if block_thickness is not None and block_thickness != last_thickness[s]:
+            shards[s] += [block_thickness, "/run/reinitializeGeometry"]
+            last_thickness[s] = block_thickness
+        shards[s] += block
+    return ["\n".join(shard) + "\n" for shard in shards]
+
+def run_split(exe_path, macro_text, processes, threads, work_dir):
+    """
+    Runs the macro as `processes` concurrent shards of `threads` threads each.
+    Returns the wall time in seconds.
+    """
+    procs = []
+    start = time.perf_counter()
+    for i, shard in enumerate(shard_macro(macro_text, processes)):
+        shard_dir = os.path.join(work_dir, f"p{processes}_t{threads}_{i}")
+        os.makedirs(shard_dir, exist_ok=True)
+        macro_path = os.path.join(shard_dir, "shard.mac")
+        with open(macro_path, "w") as f:
+            f.write(shard)
+        cmd = [exe_path, "-m", macro_path, "-t", str(threads), "-o", shard_dir]
+        procs.append(subprocess.Popen(cmd, cwd=shard_dir, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT))
+
+    codes = [p.wait() for p in procs]
+    wall = time.perf_counter() - start
+    if any(codes):
+        raise RuntimeError(f"BremSim failed with {processes} x {threads}: exit codes {codes}")
+    return wall
+
+def thread_counts(max_threads):
+    counts, n = [], 1
+    while n < max_threads:
+        counts.append(n)
+        n *= 2
+    counts.append(max_threads)
+    return counts
+
+def benchmark(exe_path, macro_path, max_threads):
+    with open(macro_path) as f:
+        macro_text = f.read()
+    events = count_events(macro_text)
+    print(f"{macro_path}: {events} primaries")
+
+    scaling, splits = [], []
+    with tempfile.TemporaryDirectory() as work_dir:
+        # single process, 1, 2, 4, ... N threads
+        for n in thread_counts(max_threads):
+            wall = run_split(exe_path, macro_text, 1, n, work_dir)
+            scaling.append({"processes": 1, "threads": n, "wall_s": round(wall, 2), "events_per_s": round(events / wall, 1)})
+            print(f"1 x {n:>3} threads: {events / wall:>12.1f} events/s")
+
+        # process x thread splits that fill all cores
+        for p in range(2, max_threads + 1):
+            if max_threads % p:
+                continue
+            t = max_threads // p
+            wall = run_split(exe_path, macro_text, p, t, work_dir)
+            splits.append({"processes": p, "threads": t, "wall_s": round(wall, 2), "events_per_s": round(events / wall, 1)})
+            print(f"{p:>3} x {t:>3} threads: {events / wall:>12.1f} events/s")
+
+    # efficiency against perfect scaling of the single-thread rate
+    base_rate = scaling[0]["events_per_s"]
+    for r in scaling + splits:
+        r["efficiency"] = round(r["events_per_s"] / (base_rate * r["processes"] * r["threads"]), 3)
+
+    return scaling, splits
+
+def load_thread_config(path=DEFAULT_CONFIG_PATH):
+    """
+    Returns the recommended configuration written by this benchmark, or None.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark BremSim thread scaling and write a recommended configuration.")
+    parser.add_argument("exe", help="Path to the BremSim executable")
+    parser.add_argument("macro", help="Fixed macro to run (keep it short, e.g. a few configurations with 1e5 primaries)")
+    parser.add_argument("--max-threads", type=int, default=os.cpu_count(), help="Number of cores to scale up to")
+    parser.add_argument("--output", default=DEFAULT_CONFIG_PATH, help="Where to write the recommended configuration")
+    args = parser.parse_args()
+
+    scaling, splits = benchmark(os.path.abspath(args.exe), os.path.abspath(args.macro), args.max_threads)
+
+    best_single = max(scaling, key=lambda r: r["events_per_s"])
+    best_split = max(scaling + splits, key=lambda r: r["events_per_s"])
+
+    config = {
+        "host": socket.gethostname(),
+        "cpu_count": os.cpu_count(),
+        "measured": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "macro": os.path.abspath(args.macro),
+        # best thread count for a single BremSim process (used by run_validation)
+        "threads": best_single["threads"],
+        # best way to fill the node with several processes
+        "processes": best_split["processes"],
+        "threads_per_process": best_split["threads"],
+        "scaling": scaling,
+        "splits": splits,
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(config, f, indent=2)
+
+    print(f"Recommended: {config['threads']} threads for one process; "
+          f"{config['processes']} x {config['threads_per_process']} to fill the node")
+    print(f"Saved {args.output}")
@@ -0,0 +1,245 @@
+import os
+import json
+import hashlib
+import logging
+import argparse
+import numpy as np
+
+from quantile_sketch import QuantileSketch, freedman_diaconis_width
+from worker_dataset import WorkerDataset
+from catalog import campaign_configurations
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+# Version of the artifact layout, bumped when the JSON fields change
+BINNING_FORMAT_VERSION = 1
+DEFAULT_BINNING_PATH = "binning.json"
+
+# Upper edge of every scheme, slightly above the highest beam energy of the campaign
+MAX_ENERGY = 5.05
+
+class BinningError(ValueError):
+    pass
+
+def edges_hash(edges):
+    """
+    sha256 of the edges as little-endian float64, identifies a binning across stages.
+    """
+    return hashlib.sha256(np.asarray(edges, dtype="<f8").tobytes()).hexdigest()
+
+def validate_edges(edges):
+    edges = np.asarray(edges, dtype=np.float64)
+    if edges.ndim != 1 or len(edges) < 2:
+        raise BinningError("A binning needs at least two edges")
+    if not np.all(np.isfinite(edges)) or np.any(np.diff(edges) <= 0):
+        raise BinningError("Bin edges must be finite and strictly increasing")
+    return edges
+
+class Binning:
+    """
+    Versioned, hashed bin edges shared by combine, training and evaluation.
+    Stored as JSON: scheme, parameters, where the statistics came from, the edges and their hash.
+    """
+
+    def __init__(self, edges, scheme, params=None, source=None):
+        self.edges = validate_edges(edges)
+        self.scheme = scheme
+        self.params = params or {}
+        self.source = source or {}
+
+    @property
+    def hash(self):
+        return edges_hash(self.edges)
+
+    @property
+    def n_bins(self):
+        return len(self.edges) - 1
+
+    @property
+    def centers(self):
+        return (self.edges[:-1] + self.edges[1:]) / 2
+
+    @property
+    def widths(self):
+        return np.diff(self.edges)
+
+    def save(self, path=DEFAULT_BINNING_PATH):
+        artifact = {
+            "format": "bremsim-binning",
+            "version": BINNING_FORMAT_VERSION,
+            "scheme": self.scheme,
+            "params": self.params,
+            "source": self.source,
+            "n_bins": self.n_bins,
+            "sha256": self.hash,
+            "edges": self.edges.tolist(),
+        }
+        with open(path, "w") as f:
+            json.dump(artifact, f, indent=1)
+        logging.info(f"Saved {self.scheme} binning ({self.n_bins} bins, {self.hash[:12]}) to {path}")
+
+    def export_txt(self, path):
+        """
+        Writes the edges as text, one per line, for /BremSim/output/binEdgesFile.
+        """
+        np.savetxt(path, self.edges, fmt="%.10g", header=f"BremSim bin edges (MeV), {self.scheme} {self.hash[:12]}")
+        logging.info(f"Wrote {self.n_bins + 1} bin edges to {path}")
+
+    @classmethod
+    def load(cls, path=DEFAULT_BINNING_PATH, expected_hash=None):
+        """
+        Loads and validates a binning artifact. A bare .npy edge file is accepted as a legacy binning.
+        Raises BinningError if the artifact is corrupt or does not match expected_hash.
+        """
+        if path.endswith(".npy"):
+            binning = cls(np.load(path), "legacy", source={"file": os.path.abspath(path)})
+        else:
+            with open(path) as f:
+                artifact = json.load(f)
+            if artifact.get("format") != "bremsim-binning":
+                raise BinningError(f"{path} is not a binning artifact")
+            if artifact.get("version") != BINNING_FORMAT_VERSION:
+                raise BinningError(f"{path} has binning format version {artifact.get('version')}, expected {BINNING_FORMAT_VERSION}")
+
+            binning = cls(artifact["edges"], artifact["scheme"], artifact.get("params"), artifact.get("source"))
+            if binning.hash != artifact.get("sha256"):
+                raise BinningError(f"Bin edges in {path} do not match their hash")
+
+        if expected_hash is not None and binning.hash != expected_hash:
+            raise BinningError(f"Binning {binning.hash[:12]} from {path} does not match the expected {expected_hash[:12]}")
+        return binning
+
+    def check_spectra(self, spectra, name="spectra"):
+        """
+        Raises BinningError unless every spectrum has one entry per bin.
+        """
+        lengths = {len(s) for s in spectra}
+        if lengths != {self.n_bins}:
+            raise BinningError(f"{name} have {sorted(lengths)} bins, binning {self.hash[:12]} has {self.n_bins}")
+
+def load_edges(path):
+    """
+    Bin edges from a binning artifact (.json) or a legacy bin_edges.npy.
+    """
+    return Binning.load(path).edges
+
+# --- schemes ---
+
+def uniform_binning(bin_width, max_energy=MAX_ENERGY, source=None):
+    edges = np.arange(0, max_energy + bin_width, bin_width)
+    return Binning(edges, "uniform", {"bin_width": bin_width, "max_energy": max_energy}, source)
+
+def log_binning(n_bins, min_energy=1e-3, max_energy=MAX_ENERGY, source=None):
+    """
+    Log-spaced edges from min_energy to max_energy, plus a first bin from 0.
+    """
+    edges = np.concatenate([[0.0], np.geomspace(min_energy, max_energy, n_bins)])
+    return Binning(edges, "log", {"n_bins": n_bins, "min_energy": min_energy, "max_energy": max_energy}, source)
+
+def equal_count_binning(sketch, n_bins, max_energy=MAX_ENERGY, source=None):
+    """
+    Edges at the quantiles of the (campaign) energy distribution, so every bin holds about the same count.
+    Quantiles closer than the sketch accuracy collapse into one edge.
+    """
+    inner = sketch.quantiles(np.linspace(0, 1, n_bins + 1)[1:-1])
+    edges = np.unique(np.concatenate([[0.0], inner[(inner > 0) & (inner < max_energy)], [max_energy]]))
+    return Binning(edges, "equal_count", {"n_bins": n_bins, "max_energy": max_energy,
+                                          "relative_accuracy": sketch.relative_accuracy}, source)
+
+def bayesian_blocks_binning(fine_edges, counts, p0=0.01, source=None):
+    """
+    Bayesian blocks (Scargle et al. 2013, binned data) over a fine histogram:
+    the optimal piecewise-constant segmentation, so bins are narrow around lines and edges
+    and wide where the spectrum is flat. p0 is the false-positive rate for a change point.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    widths = np.diff(fine_edges)
+    n = len(counts)
+    n_total = counts.sum()
+    ncp_prior = 4 - np.log(73.53 * p0 * n ** -0.478)
+
+    best = np.zeros(n)
+    last = np.zeros(n, dtype=np.int64)
+    for k in range(n):
+        # blocks ending at cell k and starting at any cell r <= k
+        block_counts = np.cumsum(counts[:k + 1][::-1])[::-1]
+        block_widths = np.cumsum(widths[:k + 1][::-1])[::-1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fitness = np.where(block_counts > 0, block_counts * np.log(block_counts / block_widths), 0.0)
+        total = fitness - ncp_prior
+        total[1:] += best[:k]
+        last[k] = np.argmax(total)
+        best[k] = total[last[k]]
+
+    change_points = []
+    k = n
+    while k > 0:
+        change_points.append(k)
+        k = last[k - 1]
+    change_points.append(0)
+    edges = np.asarray(fine_edges)[np.array(change_points[::-1])]
+    return Binning(edges, "bayesian_blocks", {"p0": p0, "fine_bins": n, "entries": float(n_total)}, source)
+
+# --- campaign statistics ---
+
+def campaign_sketch(data_dir, pattern, particle_id=0, relative_accuracy=0.005):
+    sketch = QuantileSketch(relative_accuracy)
+    configs = campaign_configurations(data_dir, pattern)
+    for c in configs:
+        dataset = WorkerDataset(c["logical"], files=c["files"])
+        sketch.merge(dataset.sketch(particle_ids=(particle_id,), relative_accuracy=relative_accuracy)[particle_id])
+    return sketch, [c["logical"] for c in configs]
+
+def campaign_histogram(data_dir, pattern, fine_edges, particle_id=0):
+    counts = np.zeros(len(fine_edges) - 1)
+    configs = campaign_configurations(data_dir, pattern)
+    for c in configs:
+        file_counts, _ = WorkerDataset(c["logical"], files=c["files"]).histogram(fine_edges, particle_ids=(particle_id,))
+        counts += file_counts[particle_id]
+    return counts, [c["logical"] for c in configs]
+
+def compute_binning(scheme, data_dir=".", pattern="output_E_*_T_*.root", n_bins=300, p0=0.01, fine_bins=5050):
+    """
+    Computes a binning scheme from the photon statistics of the matching configurations.
+    """
+    source = {"data_dir": os.path.abspath(data_dir), "pattern": pattern}
+
+    if scheme == "log":
+        return log_binning(n_bins, source=source)
+
+    if scheme in ("uniform", "equal_count"):
+        sketch, files = campaign_sketch(data_dir, pattern)
+        if not files:
+            raise BinningError(f"No files matching {pattern} in {data_dir}")
+        source["configurations"] = len(files)
+        if scheme == "uniform":
+            return uniform_binning(freedman_diaconis_width(sketch), source=source)
+        return equal_count_binning(sketch, n_bins, source=source)
+
+    if scheme == "bayesian_blocks":
+        fine_edges = np.linspace(0, MAX_ENERGY, fine_bins + 1)
+        counts, files = campaign_histogram(data_dir, pattern, fine_edges)
+        if not files:
+            raise BinningError(f"No files matching {pattern} in {data_dir}")
+        source["configurations"] = len(files)
+        return bayesian_blocks_binning(fine_edges, counts, p0=p0, source=source)
+
+    raise BinningError(f"Unknown binning scheme {scheme}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute an adaptive binning artifact from campaign statistics.")
+    parser.add_argument("scheme", choices=["uniform", "log", "equal_count", "bayesian_blocks"])
+    parser.add_argument("data_dir", nargs="?", default=".", help="Directory with the BremSim output files")
+    parser.add_argument("--pattern", default="output_E_*_T_*.root", help="Configurations to take the statistics from")
+    parser.add_argument("--bins", type=int, default=300, help="Number of bins (log, equal_count)")
+    parser.add_argument("--p0", type=float, default=0.01, help="False-positive rate per change point (bayesian_blocks)")
+    parser.add_argument("--output", default=DEFAULT_BINNING_PATH, help="Binning artifact to write")
+    parser.add_argument("--export-txt", default=None, help="Also write the edges as text for /BremSim/output/binEdgesFile")
+    args = parser.parse_args()
+
+    binning = compute_binning(args.scheme, args.data_dir, args.pattern, n_bins=args.bins, p0=args.p0)
+    binning.save(args.output)
+
+    if args.export_txt:
+        binning.export_txt(args.export_txt)
@@ -0,0 +1,279 @@
+# Single entry point for the BremSim post-processing tools:
+#     python post_process/bremsim_post.py <command> [options]
+# Heavy libraries (torch, pandas, matplotlib, sklearn, uproot) are only imported by the
+# subcommands that need them, so light commands such as `list` start quickly.
+import os
+import sys
+import glob
+import argparse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(SCRIPT_DIR)
+
+# the tools import each other by module name
+if SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, SCRIPT_DIR)
+
+# `list` has to stay below this, measured by bench_cli_startup.py
+STARTUP_BUDGET_S = 0.5
+
+def cmd_list(args):
+    """
+    Lists the configurations of a campaign directory, without reading any ROOT file.
+    With --catalog the metadata index is used (and brought up to date), which shows entries and events.
+    """
+    # stdlib only, see catalog.py
+    from catalog import parse_output_name, open_catalog, print_configurations
+
+    if args.catalog:
+        with open_catalog(args.data_dir) as catalog:
+            print_configurations(catalog.configurations(args.data_dir))
+        return 0
+
+    configs = {}
+    for path in glob.glob(os.path.join(args.data_dir, "output_E_*_T_*.root")):
+        parsed = parse_output_name(path)
+        if parsed is None:
+            continue
+        key = parsed[:2]
+        files, size = configs.get(key, (0, 0))
+        configs[key] = (files + 1, size + os.path.getsize(path))
+
+    if not configs:
+        print(f"No BremSim output files in {args.data_dir}")
+        return 0
+
+    print(f"{'E (MeV)':>9}{'T (um)':>10}{'files':>7}{'MB':>10}")
+    for (energy, thickness), (files, size) in sorted(configs.items(), key=lambda kv: (kv[0][1], kv[0][0])):
+        print(f"{energy:>9}{thickness:>10g}{files:>7}{size / 1e6:>10.1f}")
+    print(f"{len(configs)} configurations")
+    return 0
+
+def cmd_combine(args):
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.histograms:
+        from spectra_io import combine_histograms
+        combine_histograms(args.data_dir, os.path.join(args.output_dir, "combined_spectra_table.pkl"))
+    else:
+        from combine_datasets import combine_data
+        patterns = [args.binning_pattern] if args.binning_pattern else ["output_E_5.0MeV_T_1mm.root", "output_E_5.0MeV_*.root"]
+        combine_data(args.data_dir, args.output_dir, patterns, args.binning)
+    return 0
+
+def cmd_analyze(args):
+    from analyze_campaign import analyze_campaign
+    analyze_campaign(args.data_dir, force=args.force, max_workers=args.workers)
+    return 0
+
+def cmd_train(args):
+    from train_spectra_net import train_model
+    os.makedirs(args.output_dir, exist_ok=True)
+    train_model(args.table, args.bin_edges, args.output_dir)
+    return 0
+
+def cmd_evaluate(args):
+    if args.bulk:
+        from evaluate_model import evaluate_bulk
+        evaluate_bulk(args.model_dir, args.data_dir, args.output_dir, args.binning, worst_k=args.worst_k,
+                      precision=args.precision)
+    else:
+        from evaluate_model import evaluate_non_trained
+        evaluate_non_trained(args.model_dir, args.data_dir, args.output_dir, args.binning, precision=args.precision)
+    return 0
+
+def cmd_quantize(args):
+    from quantize_model import export, report
+    precisions = tuple(args.precision or ("int8", "bf16"))
+    export(args.model_dir, precisions)
+    if args.report:
+        report(args.model_dir, args.data_dir, precisions, binning_path=args.binning)
+    return 0
+
+def cmd_invert(args):
+    from inverse_fit import benchmark
+    fits = benchmark(args.model_dir, args.data_dir, args.replicas, not args.fixed_norm, args.steps,
+                     binning_path=args.binning)
+    if args.csv:
+        fits.to_csv(args.csv, index=False)
+    return 0
+
+def cmd_bins(args):
+    from calculate_bins import calculate_bins
+    calculate_bins(args.dataset, args.plot)
+    return 0
+
+def cmd_binning(args):
+    from binning import compute_binning
+    binning = compute_binning(args.scheme, args.data_dir, args.pattern, n_bins=args.bins, p0=args.p0)
+    binning.save(args.output)
+    if args.export_txt:
+        binning.export_txt(args.export_txt)
+    return 0
+
+def cmd_master(args):
+    from master_spectra import ingest
+    ingest(args.data_dir, args.master, args.fine_width)
+    return 0
+
+def cmd_rebin(args):
+    from binning import Binning, uniform_binning
+    from master_spectra import write_table
+    os.makedirs(args.output_dir, exist_ok=True)
+    binning = Binning.load(args.binning) if args.binning else uniform_binning(args.width)
+    write_table(args.master, binning, args.output_dir)
+    return 0
+
+def cmd_archive(args):
+    from parquet_archive import convert_campaign
+    convert_campaign(args.data_dir, args.archive, args.level, max_workers=args.workers)
+    return 0
+
+def cmd_watch(args):
+    from binning import Binning
+    from watch_outputs import OutputWatcher
+    os.makedirs(args.output_dir, exist_ok=True)
+    binning = Binning.load(args.binning) if args.binning else None
+    watcher = OutputWatcher(args.data_dir, args.master, binning, args.output_dir, args.plots,
+                            args.settle, max_workers=args.workers)
+    watcher.run(args.poll, args.until_idle)
+    return 0
+
+def cmd_validate(args):
+    from run_validation import run_simulation
+    run_simulation(os.path.abspath(args.exe), os.path.abspath(args.macro), os.path.abspath(args.output_dir))
+
+    if args.bin_edges:
+        from process_validation_data import process_data
+        process_data(args.output_dir, args.bin_edges, os.path.join(args.output_dir, "combined_spectra_table.pkl"))
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="bremsim-post", description="BremSim post-processing tools.")
+    parser.add_argument("--profile", metavar="REPORT", default=None,
+                        help="Append per-stage wall/CPU time, memory and item counts to REPORT (.jsonl), "
+                             "same as BREMSIM_PROFILE=REPORT; summarize with profiling.py")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("list", help="List the (E, T) configurations of a campaign directory")
+    p.add_argument("data_dir", nargs="?", default=".", help="Directory with the BremSim output files")
+    p.add_argument("--catalog", action="store_true", help="Show entries and events from the campaign catalog (scans new files)")
+    p.set_defaults(func=cmd_list)
+
+    p = subparsers.add_parser("combine", help="Build combined_spectra_table.pkl and bin_edges.npy from a campaign")
+    p.add_argument("data_dir", nargs="?", default=".", help="Directory with the BremSim output files")
+    p.add_argument("--output-dir", default=".", help="Where to write the table and the bin edges")
+    p.add_argument("--histograms", action="store_true", help="Read histogram-mode files instead of ntuples")
+    p.add_argument("--binning-pattern", default=None,
+                   help="Configurations the Freedman-Diaconis bin width is estimated from, e.g. 'output_E_*_T_*.root' "
+                        "(default: the 5.0 MeV / 1 mm reference)")
+    p.add_argument("--binning", default=None, help="Binning artifact (binning.json) to use instead of Freedman-Diaconis")
+    p.set_defaults(func=cmd_combine)
+
+    p = subparsers.add_parser("analyze", help="Plot the spectrum of every output file in a directory")
+    p.add_argument("data_dir", nargs="?", default=".", help="Directory with the BremSim output files")
+    p.add_argument("--force", action="store_true", help="Re-plot files whose plot is up to date (from the cached histograms)")
+    p.add_argument("--workers", type=int, default=None, help="Plotting processes (default: all cores)")
+    p.set_defaults(func=cmd_analyze)
+
+    p = subparsers.add_parser("train", help="Train the spectrum network")
+    p.add_argument("--table", default="combined_spectra_table.pkl", help="Combined spectra table")
+    p.add_argument("--bin-edges", default="binning.json", help="Binning artifact (or legacy bin_edges.npy) of the table")
+    p.add_argument("--output-dir", default=".", help="Where to write the model, metadata and loss plot")
+    p.set_defaults(func=cmd_train)
+
+    p = subparsers.add_parser("evaluate", help="Compare the network against simulated spectra")
+    p.add_argument("--model-dir", default=SCRIPT_DIR, help="Directory with brem_spec_net.pth and model_metadata.pkl")
+    p.add_argument("--data-dir", default=os.path.join(SCRIPT_DIR, "non_trained"), help="Directory with the output files to compare against")
+    p.add_argument("--output-dir", default=None, help="Where to write the plots (default: <data-dir>/eval_plots)")
+    p.add_argument("--binning", default=None, help="Binning artifact the model must have been trained with")
+    p.add_argument("--bulk", action="store_true", help="Write evaluation_metrics.csv for all configurations instead of one plot each")
+    p.add_argument("--worst-k", type=int, default=0, help="With --bulk, plot the k worst configurations")
+    p.add_argument("--precision", choices=["fp32", "int8", "bf16"], default="fp32",
+                   help="Model variant, int8 and bf16 are written by the quantize command")
+    p.set_defaults(func=cmd_evaluate)
+
+    p = subparsers.add_parser("quantize", help="Export int8 and bf16 CPU variants of the trained network")
+    p.add_argument("--model-dir", default=SCRIPT_DIR, help="Directory with brem_spec_net.pth and model_metadata.pkl")
+    p.add_argument("--precision", choices=["int8", "bf16"], action="append", default=None, help="Only this variant (repeatable)")
+    p.add_argument("--report", action="store_true", help="Also compare accuracy and speed with fp32 on held-out spectra")
+    p.add_argument("--data-dir", default=os.path.join(SCRIPT_DIR, "non_trained"), help="Held-out output files for --report")
+    p.add_argument("--binning", default=None, help="Binning artifact the model must have been trained with")
+    p.set_defaults(func=cmd_quantize)
+
+    p = subparsers.add_parser("invert", help="Fit beam energy and thickness to held-out photon spectra and time it")
+    p.add_argument("--model-dir", default=SCRIPT_DIR, help="Directory with brem_spec_net.pth and model_metadata.pkl")
+    p.add_argument("--data-dir", default=os.path.join(SCRIPT_DIR, "non_trained"), help="Output files to fit")
+    p.add_argument("--replicas", type=int, default=10, help="Poisson resamples per configuration")
+    p.add_argument("--steps", type=int, default=200, help="Gradient refinement steps")
+    p.add_argument("--fixed-norm", action="store_true", help="Use the model normalization instead of fitting it")
+    p.add_argument("--binning", default=None, help="Binning artifact the model must have been trained with")
+    p.add_argument("--csv", default=None, help="Also write the fits")
+    p.set_defaults(func=cmd_invert)
+
+    p = subparsers.add_parser("bins", help="Freedman-Diaconis binning of a processed dataset")
+    p.add_argument("dataset", help="Dataset pickle written by process_brem.py")
+    p.add_argument("--plot", default="optimal_bins_spectrum.png", help="Where to save the spectrum plot")
+    p.set_defaults(func=cmd_bins)
+
+    p = subparsers.add_parser("binning", help="Compute an adaptive binning artifact from campaign statistics")
+    p.add_argument("scheme", choices=["uniform", "log", "equal_count", "bayesian_blocks"])
+    p.add_argument("data_dir", nargs="?", default=".", help="Directory with the BremSim output files")
+    p.add_argument("--pattern", default="output_E_*_T_*.root", help="Configurations to take the statistics from")
+    p.add_argument("--bins", type=int, default=300, help="Number of bins (log, equal_count)")
+    p.add_argument("--p0", type=float, default=0.01, help="False-positive rate per change point (bayesian_blocks)")
+    p.add_argument("--output", default="binning.json", help="Binning artifact to write")
+    p.add_argument("--export-txt", default=None, help="Also write the edges as text for /BremSim/output/binEdgesFile")
+    p.set_defaults(func=cmd_binning)
+
+    p = subparsers.add_parser("master", help="Add a campaign to the fine-resolution master spectra store")
+    p.add_argument("data_dir", nargs="?", default=".", help="Directory with the BremSim output files")
+    p.add_argument("--master", default="master_spectra.npz", help="Master store to create or extend")
+    p.add_argument("--fine-width", type=float, default=0.001, help="Base resolution in MeV (new stores only)")
+    p.set_defaults(func=cmd_master)
+
+    p = subparsers.add_parser("rebin", help="Build combined_spectra_table.pkl in any binning from the master store")
+    p.add_argument("--master", default="master_spectra.npz", help="Master store")
+    group = p.add_mutually_exclusive_group(required=True)
+    group.add_argument("--binning", help="Binning artifact (binning.json or bin_edges.npy)")
+    group.add_argument("--width", type=float, help="Uniform bin width in MeV")
+    p.add_argument("--output-dir", default=".", help="Where to write the table and the binning")
+    p.set_defaults(func=cmd_rebin)
+
+    p = subparsers.add_parser("archive", help="Convert the raw events into the partitioned Parquet archive (needs pyarrow)")
+    p.add_argument("data_dir", nargs="?", default=".", help="Directory with the BremSim output files")
+    p.add_argument("--archive", default="events_parquet", help="Archive directory")
+    p.add_argument("--level", type=int, default=3, help="zstd compression level")
+    p.add_argument("--workers", type=int, default=None, help="Conversion processes")
+    p.set_defaults(func=cmd_archive)
+
+    p = subparsers.add_parser("watch", help="Histogram output files into the master store while the campaign runs")
+    p.add_argument("data_dir", nargs="?", default=".", help="Directory BremSim writes its output files to")
+    p.add_argument("--master", default="master_spectra.npz", help="Master store to create or extend")
+    p.add_argument("--binning", default=None, help="Also rewrite combined_spectra_table.pkl in this binning (binning.json)")
+    p.add_argument("--output-dir", default=".", help="Where to write the table")
+    p.add_argument("--plots", action="store_true", help="Also plot every file as it is taken")
+    p.add_argument("--poll", type=float, default=10.0, help="Seconds between directory scans")
+    p.add_argument("--settle", type=float, default=30.0, help="Seconds a file must be unchanged to count as closed")
+    p.add_argument("--until-idle", type=float, default=None, help="Stop after this many seconds without new output")
+    p.add_argument("--workers", type=int, default=None, help="Histogramming processes")
+    p.set_defaults(func=cmd_watch)
+
+    p = subparsers.add_parser("validate", help="Run the validation macro and (optionally) build its spectra table")
+    p.add_argument("--exe", default=os.path.join(PROJECT_DIR, "build", "BremSim"), help="BremSim executable")
+    p.add_argument("--macro", default=os.path.join(PROJECT_DIR, "macros", "non_trained_run.mac"), help="Validation macro")
+    p.add_argument("--output-dir", default=os.path.join(SCRIPT_DIR, "non_trained"), help="Where BremSim writes its output")
+    p.add_argument("--bin-edges", default=None, help="Histogram the output with these bin edges afterwards")
+    p.set_defaults(func=cmd_validate)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.profile:
+        # stdlib only, `list` stays light
+        import profiling
+        profiling.enable(args.profile)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,25 +4,27 @@ import matplotlib.pyplot as plt
 import os
 import logging
 
+import profiling
+from quantile_sketch import QuantileSketch, freedman_diaconis_width
+
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
-def freedman_diaconis(data):
+def freedman_diaconis(data, chunk_size=1_000_000):
     """
     Calculate optimal bin width using Freedman-Diaconis rule.
     Bin Width = 2 * IQR * n^(-1/3)
+    The IQR comes from a streaming quantile sketch (no full sort), fed chunk by chunk.
     """
-    q75, q25 = np.percentile(data, [75 ,25])
-    iqr = q75 - q25
-    n = len(data)
-    if iqr == 0:
-        return 0.1 # Fallback
-    bin_width = 2 * iqr * (n ** (-1/3))
-    return bin_width
+    values = np.asarray(data)
+    sketch = QuantileSketch()
+    for start in range(0, len(values), chunk_size):
+        sketch.update(values[start:start + chunk_size])
+    return freedman_diaconis_width(sketch) # 0.1 fallback if IQR is 0
 
-def calculate_bins():
+@profiling.profiled("bins")
+def calculate_bins(pkl_path=os.path.join("..", "build", "Release", "output_dataset.pkl"), plot_path="optimal_bins_spectrum.png"):
     # Path to the PKL file
     # Assuming it's in the build/Release folder based on previous steps
-    pkl_path = os.path.join("..", "build", "Release", "output_dataset.pkl")
     
     if not os.path.exists(pkl_path):
         logging.error("PKL file not found: %s", pkl_path)
@@ -38,6 +40,10 @@ def calculate_bins():
     # Separate data
     photons = df[df["ParticleID"] == 0]["AbsEnergy"]
     electrons = df[df["ParticleID"] == 1]["AbsEnergy"]
+
+    # Statistical weights of biased (bremsstrahlung splitting) runs
+    w_photons = df[df["ParticleID"] == 0]["Weight"] if "Weight" in df.columns else None
+    w_electrons = df[df["ParticleID"] == 1]["Weight"] if "Weight" in df.columns else None
     
     logging.info("Photons: %d, Electrons: %d", len(photons), len(electrons))
 
@@ -63,10 +69,10 @@ def calculate_bins():
     plt.figure(figsize=(10, 6))
     
     if len(photons) > 0:
-        plt.hist(photons, bins=bins_gamma, log=True, histtype='stepfilled', alpha=0.5, label=f'Photons (bins={bins_gamma})', color='blue')
+        plt.hist(photons, bins=bins_gamma, weights=w_photons, log=True, histtype='stepfilled', alpha=0.5, label=f'Photons (bins={bins_gamma})', color='blue')
     
     if len(electrons) > 0:
-        plt.hist(electrons, bins=bins_e, log=True, histtype='stepfilled', alpha=0.5, label=f'Electrons (bins={bins_e})', color='red')
+        plt.hist(electrons, bins=bins_e, weights=w_electrons, log=True, histtype='stepfilled', alpha=0.5, label=f'Electrons (bins={bins_e})', color='red')
         
     plt.title("Particle Energy Spectrum (Optimal Bins)")
     plt.xlabel("Energy (MeV)")
@@ -74,7 +80,6 @@ def calculate_bins():
     plt.legend()
     plt.grid(True, which="both", ls="--", alpha=0.5)
     
-    plot_path = "optimal_bins_spectrum.png"
     plt.savefig(plot_path)
     logging.info("Saved plot to: %s", os.path.abspath(plot_path))
 
@@ -0,0 +1,295 @@
+# SQLite index of a BremSim campaign directory, built from ROOT metadata only.
+#
+#     python post_process/catalog.py <data_dir>            # build or update <data_dir>/bremsim_catalog.sqlite
+#     python post_process/catalog.py <data_dir> --energy 5.0
+#
+# Every output file is scanned once (tree names, num_entries, branch types, compressed size,
+# event count); the scan is redone only for files whose size or modification time changed.
+# The post-processing stages select their inputs through campaign_configurations() instead of
+# globbing the directory and opening every file.
+# Only the scan itself needs uproot, so filename parsing and queries stay light.
+import os
+import re
+import json
+import time
+import sqlite3
+import fnmatch
+import logging
+import argparse
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+CATALOG_NAME = "bremsim_catalog.sqlite"
+CATALOG_VERSION = 1
+
+# names written by BremSim (see worker_dataset.py and spectra_io.py)
+EVENTS_TREE = "Absolute Energies"
+PHOTON_HISTOGRAM = "Photon_Spectrum"
+EVENT_COUNT_NAME = "Event_Count"
+WEIGHT_BRANCH = "Weight"
+
+# output_E_<E>MeV_T_<T>(um|mm)[_t<thread>].root, the names the campaign macros give BremSim
+output_pattern = re.compile(r"^output_E_(?P<energy>\d+(?:\.\d*)?)MeV_T_(?P<thickness>\d+(?:\.\d*)?)(?P<unit>um|mm)"
+                            r"(?:_t(?P<thread>\d+))?\.root$")
+
+def parse_output_name(filename):
+    """
+    Parses an output file name. Returns (energy in MeV, thickness in um, worker thread or None),
+    or None if the name does not follow the campaign convention.
+    """
+    match = output_pattern.match(os.path.basename(filename))
+    if match is None:
+        return None
+    thickness = float(match.group("thickness")) * (1000.0 if match.group("unit") == "mm" else 1.0)
+    thread = int(match.group("thread")) if match.group("thread") is not None else None
+    return float(match.group("energy")), thickness, thread
+
+def parse_filename(filename):
+    """
+    Energy (MeV) and thickness (um) of an output file, (None, None) for other files.
+    The one parser used by all post-processing stages.
+    """
+    parsed = parse_output_name(filename)
+    if parsed is None:
+        return None, None
+    return parsed[0], parsed[1]
+
+def logical_path(path):
+    """
+    The merged file name BremSim was given, <name>.root for a worker file <name>_t<N>.root.
+    """
+    match = re.match(r"^(?P<stem>.+)_t\d+\.root$", os.path.basename(path))
+    return os.path.join(os.path.dirname(path), match.group("stem") + ".root") if match else path
+
+def scan_file(path):
+    """
+    Reads the metadata of one ROOT file, never the baskets of its trees.
+    """
+    import uproot
+
+    info = {"trees": {}, "entries": 0, "compressed_bytes": 0, "has_events": False,
+            "has_histograms": False, "weighted": False, "n_events": None, "error": None}
+    try:
+        with uproot.open(path) as file:
+            names = {key.split(";")[0]: classname for key, classname in file.classnames().items()}
+            for name, classname in names.items():
+                if classname not in ("TTree", "ROOT::RNTuple"):
+                    continue
+                tree = file[name]
+                info["trees"][name] = {
+                    "entries": int(tree.num_entries),
+                    "compressed_bytes": int(getattr(tree, "compressed_bytes", 0)),
+                    "branches": {branch: getattr(tree[branch], "typename", "") for branch in tree.keys()},
+                }
+
+            events = info["trees"].get(EVENTS_TREE)
+            if events is not None:
+                info["entries"] = events["entries"]
+                info["compressed_bytes"] = events["compressed_bytes"]
+                info["has_events"] = events["entries"] > 0
+                info["weighted"] = WEIGHT_BRANCH in events["branches"]
+            info["has_histograms"] = PHOTON_HISTOGRAM in names
+            if EVENT_COUNT_NAME in names:
+                info["n_events"] = int(round(file[EVENT_COUNT_NAME].values().sum()))
+    except Exception as e:
+        info["error"] = str(e)
+    return info
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    logical TEXT NOT NULL,
+    energy_mev REAL,
+    thickness_um REAL,
+    thread INTEGER,
+    size_bytes INTEGER,
+    mtime REAL,
+    entries INTEGER,
+    compressed_bytes INTEGER,
+    has_events INTEGER,
+    has_histograms INTEGER,
+    weighted INTEGER,
+    n_events INTEGER,
+    trees TEXT,
+    error TEXT,
+    scanned_at REAL
+);
+CREATE INDEX IF NOT EXISTS files_config ON files (energy_mev, thickness_um);
+CREATE INDEX IF NOT EXISTS files_logical ON files (logical);
+"""
+
+class Catalog:
+    """
+    Query helpers over the SQLite index of one campaign directory.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+        self.connection.execute("INSERT OR IGNORE INTO meta VALUES ('version', ?)", (str(CATALOG_VERSION),))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def update(self, data_dir, max_workers=None):
+        """
+        Scans the output files that are new or changed since the last update and drops deleted ones.
+        Returns the number of files scanned.
+        """
+        on_disk = {}
+        for entry in os.scandir(data_dir):
+            if entry.is_file() and parse_output_name(entry.name) is not None:
+                stat = entry.stat()
+                on_disk[os.path.abspath(entry.path)] = (stat.st_size, stat.st_mtime)
+
+        known = {row["path"]: (row["size_bytes"], row["mtime"])
+                 for row in self.connection.execute("SELECT path, size_bytes, mtime FROM files WHERE path LIKE ?",
+                                                    (os.path.join(os.path.abspath(data_dir), "%"),))
+                 if os.path.dirname(row["path"]) == os.path.abspath(data_dir)}
+
+        stale = [p for p, signature in on_disk.items() if known.get(p) != signature]
+        removed = [p for p in known if p not in on_disk]
+
+        if len(stale) > 1:
+            # imported here, `bremsim_post.py list` only parses names
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                scans = list(pool.map(scan_file, stale))
+        else:
+            scans = [scan_file(p) for p in stale]
+
+        now = time.time()
+        rows = []
+        for path, info in zip(stale, scans):
+            energy, thickness, thread = parse_output_name(path)
+            size, mtime = on_disk[path]
+            rows.append((path, os.path.basename(path), logical_path(path), energy, thickness, thread, size, mtime,
+                         info["entries"], info["compressed_bytes"], int(info["has_events"]), int(info["has_histograms"]),
+                         int(info["weighted"]), info["n_events"], json.dumps(info["trees"]), info["error"], now))
+            if info["error"]:
+                logging.warning(f"Could not read {path}: {info['error']}")
+
+        with self.connection:
+            self.connection.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in removed])
+            self.connection.executemany(f"INSERT OR REPLACE INTO files VALUES ({', '.join('?' * 17)})", rows)
+
+        if stale or removed:
+            logging.info(f"Catalog {self.db_path}: scanned {len(stale)} file(s), removed {len(removed)}")
+        return len(stale)
+
+    def files(self, data_dir=None, energy=None, thickness=None, pattern=None):
+        """
+        File rows (as dicts) matching the given configuration and name pattern.
+        """
+        query = "SELECT * FROM files WHERE 1"
+        params = []
+        if data_dir is not None:
+            query += " AND path LIKE ?"
+            params.append(os.path.join(os.path.abspath(data_dir), "%"))
+        if energy is not None:
+            query += " AND abs(energy_mev - ?) < 1e-9"
+            params.append(energy)
+        if thickness is not None:
+            query += " AND abs(thickness_um - ?) < 1e-9"
+            params.append(thickness)
+        rows = [dict(row) for row in self.connection.execute(query + " ORDER BY thickness_um, energy_mev, path", params)]
+        if data_dir is not None:
+            rows = [r for r in rows if os.path.dirname(r["path"]) == os.path.abspath(data_dir)]
+        if pattern is not None:
+            rows = [r for r in rows if fnmatch.fnmatch(r["name"], pattern)]
+        for r in rows:
+            r["trees"] = json.loads(r["trees"]) if r["trees"] else {}
+        return rows
+
+    def configurations(self, data_dir=None, energy=None, thickness=None, pattern=None,
+                       require_events=False, require_histograms=False):
+        """
+        One dict per configuration (logical output file), sorted by thickness and energy:
+        logical, energy_mev, thickness_um, files (the files holding the ntuple rows), entries,
+        compressed_bytes, n_events, has_histograms, weighted.
+        pattern selects whole configurations: it matches the logical name or the name of any of their files,
+        so "output_E_5.0MeV_T_1mm.root" also selects the worker files of an unmerged run.
+        require_events skips configurations without ntuple rows, require_histograms those without histograms.
+        """
+        groups = {}
+        for row in self.files(data_dir, energy, thickness):
+            groups.setdefault(row["logical"], []).append(row)
+
+        configs = []
+        for logical, rows in groups.items():
+            if pattern is not None and not (fnmatch.fnmatch(os.path.basename(logical), pattern)
+                                            or any(fnmatch.fnmatch(r["name"], pattern) for r in rows)):
+                continue
+            workers = [r for r in rows if r["thread"] is not None]
+            master = next((r for r in rows if r["path"] == logical), None)
+            # the master file of an unmerged run carries no ntuple rows
+            event_rows = sorted(workers, key=lambda r: r["thread"]) if workers else rows
+            config = {
+                "logical": logical,
+                "energy_mev": rows[0]["energy_mev"],
+                "thickness_um": rows[0]["thickness_um"],
+                "files": [r["path"] for r in event_rows],
+                "entries": sum(r["entries"] for r in event_rows),
+                "compressed_bytes": sum(r["compressed_bytes"] for r in event_rows),
+                "n_events": master["n_events"] if master is not None else None,
+                "has_histograms": bool(master is not None and master["has_histograms"]),
+                "weighted": any(r["weighted"] for r in event_rows),
+            }
+            if require_events and config["entries"] == 0:
+                continue
+            if require_histograms and not config["has_histograms"]:
+                continue
+            configs.append(config)
+        return sorted(configs, key=lambda c: (c["thickness_um"], c["energy_mev"]))
+
+def open_catalog(data_dir, db_path=None, update=True, max_workers=None):
+    """
+    Opens the catalog of data_dir (default <data_dir>/bremsim_catalog.sqlite), brought up to date first.
+    """
+    catalog = Catalog(db_path or os.path.join(data_dir, CATALOG_NAME))
+    if update:
+        catalog.update(data_dir, max_workers=max_workers)
+    return catalog
+
+def campaign_configurations(data_dir, pattern="output_E_*_T_*.root", require_events=True, require_histograms=False, db_path=None):
+    """
+    The configurations of a campaign directory selected through its (updated) catalog.
+    The pattern selects whole configurations, matched against the logical name <name>.root and the names
+    of all files of a configuration, worker files included.
+    """
+    with open_catalog(data_dir, db_path) as catalog:
+        return catalog.configurations(data_dir, pattern=pattern, require_events=require_events,
+                                      require_histograms=require_histograms)
+
+def print_configurations(configs):
+    print(f"{'E (MeV)':>9}{'T (um)':>10}{'files':>7}{'entries':>12}{'MB':>10}{'events':>10}")
+    for c in configs:
+        events = "-" if c["n_events"] is None else c["n_events"]
+        print(f"{c['energy_mev']:>9g}{c['thickness_um']:>10g}{len(c['files']):>7}{c['entries']:>12}"
+              f"{c['compressed_bytes'] / 1e6:>10.1f}{events:>10}")
+    print(f"{len(configs)} configurations")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the metadata catalog of a BremSim campaign directory.")
+    parser.add_argument("data_dir", nargs="?", default=".", help="Directory with the BremSim output files")
+    parser.add_argument("--db", default=None, help=f"Catalog file (default: <data_dir>/{CATALOG_NAME})")
+    parser.add_argument("--energy", type=float, default=None, help="Only this beam energy (MeV)")
+    parser.add_argument("--thickness", type=float, default=None, help="Only this thickness (um)")
+    parser.add_argument("--workers", type=int, default=None, help="Scanning processes")
+    args = parser.parse_args()
+
+    with open_catalog(args.data_dir, args.db, max_workers=args.workers) as catalog:
+        print_configurations(catalog.configurations(args.data_dir, args.energy, args.thickness))
@@ -1,91 +1,84 @@
 import os
-import glob
-import re
 import logging
-import uproot
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+import profiling
+from worker_dataset import WorkerDataset
+from catalog import campaign_configurations
+from quantile_sketch import QuantileSketch, freedman_diaconis_width
+from binning import Binning, uniform_binning
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
-def parse_filename(filename):
+def campaign_bin_width(data_dir, patterns, relative_accuracy=0.005, executor=None):
     """
-    Parses the filename to extract Energy (MeV) and Thickness.
-    Returns Energy (float) and Thickness (float in microns).
+    Freedman-Diaconis photon bin width over every configuration matching the first pattern that matches anything.
+    The IQR comes from merged streaming quantile sketches, so no file is ever loaded as a whole.
+    Returns (bin_width, files used).
     """
-    basename = os.path.basename(filename)
-    match = re.search(r"output_E_([\d\.]+)MeV_T_(.+)\.root", basename)
-    if match:
-        energy = float(match.group(1))
-        thick_str = match.group(2)
-        
-        # Convert thickness to microns
-        if "mm" in thick_str:
-            thickness = float(re.findall(r"[\d\.]+", thick_str)[0]) * 1000
-        elif "um" in thick_str:
-            thickness = float(re.findall(r"[\d\.]+", thick_str)[0])
-        else:
-            thickness = 0.0 # Should not happen based on filename format
-            
-        return energy, thickness
-    return None, None
+    for pattern in patterns:
+        configs = campaign_configurations(data_dir, pattern)
+        if configs:
+            break
+    else:
+        return None, []
 
-def freedman_diaconis(data):
-    """
-    Calculate optimal bin width using Freedman-Diaconis rule.
-    """
-    if len(data) < 2:
-        return 0.1
-    q75, q25 = np.percentile(data, [75 ,25])
-    iqr = q75 - q25
-    n = len(data)
-    if iqr == 0:
-        return 0.1
-    bin_width = 2 * iqr * (n ** (-1/3))
-    return bin_width
-
-def combine_data(data_dir="."):
+    sketch = QuantileSketch(relative_accuracy)
+    for config in configs:
+        # The reference may be written as per-thread files (/BremSim/output/mergeNtuples false)
+        dataset = WorkerDataset(config["logical"], files=config["files"])
+        sketch.merge(dataset.sketch(particle_ids=(0,), relative_accuracy=relative_accuracy, executor=executor)[0])
+
+    return freedman_diaconis_width(sketch), [config["logical"] for config in configs]
+
+@profiling.profiled("combine")
+def combine_data(data_dir=".", output_dir=".", binning_patterns=("output_E_5.0MeV_T_1mm.root", "output_E_5.0MeV_*.root"),
+                 binning_path=None):
     logging.info("Starting data combination process...")
 
+    # one process pool for the per-thread files of all configurations
+    pool = ProcessPoolExecutor()
+
     # 1. Determine Global Binning Scheme
-    # We use the 5.0 MeV configuration (max energy) to determine a bin width 
-    # that captures the necessary detail for the largest range.
-    ref_pattern = os.path.join(data_dir, "output_E_5.0MeV_T_1mm.root")
-    ref_files = glob.glob(ref_pattern)
-    
-    if not ref_files:
-        # Fallback if specific file not found, try any 5.0MeV
-        ref_files = glob.glob(os.path.join(data_dir, "output_E_5.0MeV_*.root"))
+    if binning_path is not None:
+        # adaptive (or any previously computed) binning artifact, see binning.py
+        binning = Binning.load(binning_path)
+        logging.info(f"Using {binning.scheme} binning {binning.hash[:12]} from {binning_path}")
+    else:
+        # By default we use the 5.0 MeV configuration (max energy) to determine a bin width 
+        # that captures the necessary detail for the largest range.
+        # Any subset of the campaign (e.g. "output_E_*_T_*.root") can be used instead.
+        # Use photons for the 'primary' bin width as they are the main interest usually.
+        # Photons often have a sharp characteristic X-ray peak so they might demand smaller bins.
+        try:
+            with profiling.stage("combine.binning"):
+                bin_width, ref_files = campaign_bin_width(data_dir, binning_patterns, executor=pool)
+        except Exception as e:
+            logging.error(f"Failed to calculate bin width: {e}")
+            pool.shutdown()
+            return
+
         if not ref_files:
             logging.error("Could not find reference 5.0 MeV file for binning calculation.")
+            pool.shutdown()
             return
 
-    ref_file = ref_files[0]
-    logging.info(f"Using reference file for bin width calculation: {ref_file}")
-    
-    try:
-        with uproot.open(ref_file) as file:
-            df_ref = file["Absolute Energies"].arrays(["AbsEnergy", "ParticleID"], library="pd")
-            # Use photons for the 'primary' bin width as they are the main interest usually
-            # But we can check both or just use the whole set. 
-            # Photons often have a sharp characteristic X-ray peak so they might demand smaller bins.
-            ref_data = df_ref[df_ref["ParticleID"] == 0]["AbsEnergy"]
-            
-            bin_width = freedman_diaconis(ref_data)
-            logging.info(f"Calculated Freedman-Diaconis Bin Width: {bin_width:.5f} MeV")
-            
-    except Exception as e:
-        logging.error(f"Failed to calculate bin width: {e}")
-        return
+        logging.info(f"Using {len(ref_files)} configuration(s) for bin width calculation, e.g. {ref_files[0]}")
+        logging.info(f"Calculated Freedman-Diaconis Bin Width: {bin_width:.5f} MeV")
 
-    # Define Global Bins
-    max_energy = 5.05 # Slightly above 5.0
-    bins = np.arange(0, max_energy + bin_width, bin_width)
+        # Define Global Bins, slightly above 5.0 MeV
+        binning = uniform_binning(bin_width, source={"data_dir": os.path.abspath(data_dir), "files": ref_files})
+
+    bins = binning.edges
     logging.info(f"Global Bins defined: {len(bins)-1} bins from 0 to {bins[-1]:.2f} MeV")
 
     # 2. Process All Files
-    files = glob.glob(os.path.join(data_dir, "output_E_*_T_*.root"))
+    # Per-thread files of one configuration are grouped into a single logical dataset,
+    # configurations without ntuple rows are skipped by the catalog
+    configs = campaign_configurations(data_dir)
     
     data_rows = []
     
@@ -93,66 +86,71 @@ def combine_data(data_dir="."):
     # Or just store the counts and metadata.
     # Let's create a list of dicts.
     
-    logging.info(f"Processing {len(files)} files...")
-    
-    for i, f in enumerate(files):
+    logging.info(f"Processing {len(configs)} files...")
+
+    for i, config in enumerate(configs):
         if i % 20 == 0:
-            logging.info(f"Processed {i}/{len(files)} files...")
+            logging.info(f"Processed {i}/{len(configs)} files...")
             
-        energy, thickness = parse_filename(f)
-        if energy is None:
-            continue
+        f = config["logical"]
+        energy, thickness = config["energy_mev"], config["thickness_um"]
             
         try:
-            with uproot.open(f) as file:
-                if "Absolute Energies" not in file:
-                    continue
-                df = file["Absolute Energies"].arrays(["AbsEnergy", "ParticleID"], library="pd")
-                
-                # Separate particles
-                photons = df[df["ParticleID"] == 0]["AbsEnergy"]
-                electrons = df[df["ParticleID"] == 1]["AbsEnergy"]
-                
-                # Histogram
-                p_counts, _ = np.histogram(photons, bins=bins)
-                e_counts, _ = np.histogram(electrons, bins=bins)
-                
-                # Create Row
-                row = {
-                    "Energy_MeV": energy,
-                    "Thickness_um": thickness,
-                    "Total_Photons": len(photons),
-                    "Total_Electrons": len(electrons)
-                }
-                
-                # Add spectral data
-                # We can store as array columns or flattened. 
-                # For a "single data table" csv style, flattened is best.
-                # For PKL/Parquet, array columns are cleaner.
-                # Given "combine all... single data table", array columns are likely more manageable 
-                # than 2000 columns of integers.
-                
-                row["Photon_Spectrum"] = p_counts
-                row["Electron_Spectrum"] = e_counts
-                
-                data_rows.append(row)
+            dataset = WorkerDataset(f, files=config["files"])
+
+            # Histogram photons (0) and electrons (1), worker files in parallel
+            with profiling.stage("combine.histogram", items=config["entries"]):
+                counts, totals = dataset.histogram(bins, particle_ids=(0, 1), executor=pool)
+            p_counts = counts[0]
+            e_counts = counts[1]
+
+            # the master file of an unmerged run still holds the event count histogram
+            n_events = config["n_events"]
+
+            # Create Row
+            row = {
+                "Energy_MeV": energy,
+                "Thickness_um": thickness,
+                "N_Events": np.nan if n_events is None else n_events,
+                "Total_Photons": totals[0],
+                "Total_Electrons": totals[1]
+            }
                 
+            # Add spectral data
+            # We can store as array columns or flattened. 
+            # For a "single data table" csv style, flattened is best.
+            # For PKL/Parquet, array columns are cleaner.
+            # Given "combine all... single data table", array columns are likely more manageable 
+            # than 2000 columns of integers.
+            
+            row["Photon_Spectrum"] = p_counts
+            row["Electron_Spectrum"] = e_counts
+            
+            data_rows.append(row)
+            
         except Exception as e:
             logging.warning(f"Error processing {f}: {e}")
 
+    pool.shutdown()
+
     # 3. Create DataFrame
-    df_final = pd.DataFrame(data_rows)
+    with profiling.stage("combine.dataframe", items=len(data_rows)):
+        df_final = pd.DataFrame(data_rows)
     
-    # Sort
-    df_final = df_final.sort_values(by=["Thickness_um", "Energy_MeV"]).reset_index(drop=True)
+        # Sort
+        df_final = df_final.sort_values(by=["Thickness_um", "Energy_MeV"]).reset_index(drop=True)
     
     # Save
-    pkl_path = "combined_spectra_table.pkl"
-    df_final.to_pickle(pkl_path)
+    pkl_path = os.path.join(output_dir, "combined_spectra_table.pkl")
+    # training and evaluation check that they use the same binning
+    df_final.attrs["binning_sha256"] = binning.hash
+    with profiling.stage("combine.save"):
+        df_final.to_pickle(pkl_path)
     logging.info(f"Saved combined data table to {os.path.abspath(pkl_path)}")
     
     # Also save bin edges for reference
-    np.save("bin_edges.npy", bins)
+    binning.save(os.path.join(output_dir, "binning.json"))
+    np.save(os.path.join(output_dir, "bin_edges.npy"), bins)
     logging.info("Saved bin_edges.npy")
 
     # Quick peek
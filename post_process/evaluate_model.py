@@ -5,10 +5,14 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import os
-import glob
-import re
-import uproot
 import logging
+import argparse
+
+import profiling
+from worker_dataset import WorkerDataset, histogram_campaign
+from catalog import campaign_configurations
+from binning import Binning, edges_hash
+from spectra_io import nominal_event_scale, NOMINAL_EVENTS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
@@ -36,7 +40,33 @@ class BremSpecNet(nn.Module):
     def forward(self, x):
         return self.net(x)
 
-def load_resources(base_dir):
+# Weights of the trained network and of its reduced-precision exports (quantize_model.py)
+MODEL_FILES = {
+    "fp32": "brem_spec_net.pth",
+    "int8": "brem_spec_net_int8.pth",
+    "bf16": "brem_spec_net_bf16.pth",
+}
+
+def convert_precision(model, precision):
+    """
+    The fp32 model in another inference precision:
+    int8 quantizes the weights of the linear layers dynamically (activations are quantized per batch),
+    bf16 casts all weights. The input dtype the model expects is kept as model.input_dtype.
+    """
+    if precision == "fp32":
+        model.input_dtype = torch.float32
+    elif precision == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+        model.input_dtype = torch.float32
+    elif precision == "bf16":
+        model = model.to(torch.bfloat16)
+        model.input_dtype = torch.bfloat16
+    else:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {sorted(MODEL_FILES)}")
+    model.precision = precision
+    return model.eval()
+
+def load_resources(base_dir, precision="fp32"):
     # Load Metadata
     meta_path = os.path.join(base_dir, 'model_metadata.pkl')
     if not os.path.exists(meta_path):
@@ -47,35 +77,33 @@ def load_resources(base_dir):
         meta = pickle.load(f)
         
     # Load Model
-    model = BremSpecNet()
-    model_path = os.path.join(base_dir, 'brem_spec_net.pth')
+    if precision not in MODEL_FILES:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {sorted(MODEL_FILES)}")
+    model_path = os.path.join(base_dir, MODEL_FILES[precision])
     if not os.path.exists(model_path):
-        model_path = 'brem_spec_net.pth'
-        
+        model_path = MODEL_FILES[precision]
+
+    # the layers of the reduced-precision variants have to exist before their weights are loaded
+    model = convert_precision(BremSpecNet(), precision)
     model.load_state_dict(torch.load(model_path))
     model.eval()
     
     return model, meta
 
-def predict_spectrum(model, meta, energy_mev, thickness_um, particle_type):
+def build_features(meta, energies, thicknesses, particle_types):
     """
-    Generates a full spectrum prediction for a single configuration.
-    particle_type: 0 (Photon) or 1 (Electron)
+    Network inputs for every (configuration, bin) pair, one row per bin and configuration.
+    energies, thicknesses and particle_types are arrays of equal length N (one entry per spectrum).
+    Returns the scaled feature matrix of shape (N * n_bins, 6).
     """
-    scaler_X = meta['scaler_X']
-    scaler_y = meta['scaler_y']
     bin_centers = meta['bin_centers']
-    
     n_bins = len(bin_centers)
-    
-    # Prepare Input Vectors
-    # [Energy, Thickness, Bin_E, Type]
-    
-    # Create arrays
-    energies = np.full(n_bins, energy_mev)
-    thicknesses = np.full(n_bins, thickness_um)
-    types = np.full(n_bins, particle_type)
-    
+
+    energies = np.repeat(np.asarray(energies, dtype=np.float64), n_bins)
+    thicknesses = np.repeat(np.asarray(thicknesses, dtype=np.float64), n_bins)
+    types = np.repeat(np.asarray(particle_types, dtype=np.float64), n_bins)
+    centers = np.tile(bin_centers, len(energies) // n_bins)
+
     # Base Features
     # 0: Energy
     # 1: Thickness (will be logged)
@@ -84,7 +112,7 @@ def predict_spectrum(model, meta, energy_mev, thickness_um, particle_type):
     
     # Feature 4: Energy - Bin Center (Endpoint Distance)
     # Matches Scaler Mean ~0.02, Var ~4.2
-    feat_4 = energies - bin_centers
+    feat_4 = energies - centers
     
     # Feature 5: (Energy - Bin Center) * Energy
     # Matches Scaler Mean ~2.27, Var ~22.5
@@ -98,156 +126,263 @@ def predict_spectrum(model, meta, energy_mev, thickness_um, particle_type):
     X_working = np.column_stack((
         energies, 
         log_thick, 
-        bin_centers, 
+        centers, 
         types, 
         feat_4, 
         feat_5
     ))
     
     # Scale Inputs
-    X_scaled = scaler_X.transform(X_working)
-    
-    # Convert to Tensor
-    X_tensor = torch.tensor(X_scaled, dtype=torch.float32)
-    
+    return meta['scaler_X'].transform(X_working)
+
+def predict_spectra(model, meta, energies, thicknesses, particle_types, batch_size=1_000_000):
+    """
+    Predicts the spectra of N configurations in batched forward passes.
+    Returns an array of shape (N, n_bins).
+    """
+    n_bins = len(meta['bin_centers'])
+    X_scaled = build_features(meta, energies, thicknesses, particle_types)
+
     # Predict
+    outputs = []
     with torch.no_grad():
-        y_pred_scaled = model(X_tensor).numpy()
+        for start in range(0, len(X_scaled), batch_size):
+            X_tensor = torch.tensor(X_scaled[start:start + batch_size], dtype=getattr(model, "input_dtype", torch.float32))
+            outputs.append(model(X_tensor).float().numpy())
+    y_pred_scaled = np.concatenate(outputs) if outputs else np.zeros((0, 1))
     
     # Inverse Scale Targets
     # 1. Inverse MinMax
-    y_pred_log = scaler_y.inverse_transform(y_pred_scaled)
+    y_pred_log = meta['scaler_y'].inverse_transform(y_pred_scaled)
     
     # 2. Inverse Log (Expm1)
-    y_pred = np.expm1(y_pred_log).flatten()
+    y_pred = np.expm1(y_pred_log).reshape(-1, n_bins)
     
     # Clip negatives (physically impossible)
-    y_pred = np.maximum(y_pred, 0)
-    
-    return bin_centers, y_pred
+    return np.maximum(y_pred, 0)
 
-def parse_filename(filename):
-    basename = os.path.basename(filename)
-    match = re.search(r"output_E_([\d\.]+)MeV_T_(.+)\.root", basename)
-    if match:
-        energy = float(match.group(1))
-        thickness_str = match.group(2)
-        
-        # Parse thickness string to float um
-        val = float(re.findall(r"[\d\.]+", thickness_str)[0])
-        if "mm" in thickness_str:
-            val *= 1000.0
-        return energy, val
-    return None, None
-
-def get_ground_truth_from_root(file_path, bin_edges):
-    """
-    Loads particle data from ROOT file and bins it according to bin_edges.
-    Returns (hist_photons, hist_electrons)
-    """
-    try:
-        with uproot.open(file_path) as file:
-            if "Absolute Energies" not in file:
-                return None, None
-            
-            tree = file["Absolute Energies"]
-            # Load as numpy arrays directly
-            data = tree.arrays(["AbsEnergy", "ParticleID"], library="np")
-            
-            energies = data["AbsEnergy"]
-            pids = data["ParticleID"]
-            
-            # Filter
-            photons = energies[pids == 0]
-            electrons = energies[pids == 1]
-            
-            # Histogram
-            # Note: The model predicts counts/density? 
-            # Looking at previous code, it seems to predict counts (or log counts).
-            # We should check if density=True or False.
-            # In predict_spectrum, 'y_pred' is counts (expm1 of log count).
-            # So we use density=False.
-            
-            hist_p, _ = np.histogram(photons, bins=bin_edges)
-            hist_e, _ = np.histogram(electrons, bins=bin_edges)
-            
-            return hist_p, hist_e
-            
-    except Exception as e:
-        logging.error(f"Error reading {file_path}: {e}")
-        return None, None
+def predict_spectrum(model, meta, energy_mev, thickness_um, particle_type):
+    """
+    Generates a full spectrum prediction for a single configuration.
+    particle_type: 0 (Photon) or 1 (Electron)
+    """
+    y_pred = predict_spectra(model, meta, [energy_mev], [thickness_um], [particle_type])[0]
+    return meta['bin_centers'], y_pred
 
-def evaluate_non_trained(base_dir):
+def nominal_scales(meta, configs):
+    """
+    Per catalog configuration, the factor bringing its simulated spectra to the event count the model
+    predicts, so runs stopped early by the convergence check are compared on the right scale.
+    """
+    nominal = meta.get('nominal_events', NOMINAL_EVENTS)
+    return np.array([nominal_event_scale(c["n_events"], nominal) for c in configs])
+
+def model_bin_edges(meta, binning_path=None):
+    """
+    Bin edges the model was trained with, validated against a binning artifact if one is given.
+    Models trained before the binning artifact only stored uniform bin centers.
+    """
+    if 'bin_edges' in meta:
+        bin_edges = np.asarray(meta['bin_edges'])
+    else:
+        # Reconstruct Bin Edges from Centers (assuming uniform)
+        bin_centers = meta['bin_centers']
+        bin_width = bin_centers[1] - bin_centers[0]
+        bin_edges = np.concatenate([
+            bin_centers - bin_width/2, 
+            [bin_centers[-1] + bin_width/2]
+        ])
+
+    if binning_path is not None:
+        Binning.load(binning_path, expected_hash=meta.get('binning_sha256', edges_hash(bin_edges)))
+    return bin_edges
+
+def plot_comparison(bin_centers, gt_photons, pred_photons, gt_electrons, pred_electrons, energy, thickness, output_dir, suffix="NonTrained"):
+    plt.figure(figsize=(10, 6))
+    
+    # Photons
+    plt.step(bin_centers, gt_photons, where='mid', label='Simulated $\\gamma$', color='blue', alpha=0.5)
+    plt.plot(bin_centers, pred_photons, label='Neural Net $\\gamma$', color='blue', linestyle='--', linewidth=2)
+    
+    # Electrons
+    plt.step(bin_centers, gt_electrons, where='mid', label='Simulated $e^-$', color='red', alpha=0.5)
+    plt.plot(bin_centers, pred_electrons, label='Neural Net $e^-$', color='red', linestyle='--', linewidth=2)
+    
+    plt.yscale('log')
+    plt.title(f"Model Evaluation: {energy} MeV Beam, {thickness} $\\mu$m Foil (Non-Trained)")
+    plt.xlabel("Energy (MeV)")
+    plt.ylabel("Counts")
+    plt.legend()
+    plt.grid(True, alpha=0.3, which="both")
+    
+    # Save
+    filename = f"model_evaluation_{energy}MeV_{thickness}um_{suffix}.png"
+    save_path = os.path.join(output_dir, filename)
+    plt.savefig(save_path)
+    plt.close()
+    return save_path
+
+@profiling.profiled("evaluate")
+def evaluate_non_trained(base_dir, data_dir=None, output_dir=None, binning_path=None, precision="fp32"):
     # Locate Resources
     model_dir = base_dir # Assuming model is in post_process
     
-    model, meta = load_resources(model_dir)
+    model, meta = load_resources(model_dir, precision)
     
-    # Reconstruct Bin Edges from Centers (assuming uniform)
     bin_centers = meta['bin_centers']
-    bin_width = bin_centers[1] - bin_centers[0]
-    bin_edges = np.concatenate([
-        bin_centers - bin_width/2, 
-        [bin_centers[-1] + bin_width/2]
-    ])
+    bin_edges = model_bin_edges(meta, binning_path)
     
     # Find Non-Trained Files
-    non_trained_dir = os.path.join(base_dir, "non_trained")
-    pattern = os.path.join(non_trained_dir, "output_E_*_T_*.root")
-    files = glob.glob(pattern)
+    non_trained_dir = data_dir or os.path.join(base_dir, "non_trained")
+    configs = campaign_configurations(non_trained_dir)
     
-    if not files:
+    if not configs:
         print(f"No files found in {non_trained_dir}")
         return
 
-    print(f"Found {len(files)} files to evaluate.")
+    print(f"Found {len(configs)} files to evaluate.")
     
-    output_dir = os.path.join(non_trained_dir, "eval_plots")
+    output_dir = output_dir or os.path.join(non_trained_dir, "eval_plots")
     os.makedirs(output_dir, exist_ok=True)
+
+    # photons and electrons of every configuration in one pass
+    n = len(configs)
+    energies = np.array([c["energy_mev"] for c in configs])
+    thicknesses = np.array([c["thickness_um"] for c in configs])
+    pred = predict_spectra(model, meta, np.tile(energies, 2), np.tile(thicknesses, 2), np.repeat([0, 1], n))
+    # on the event scale of the model
+    scales = nominal_scales(meta, configs)
     
-    for i, file_path in enumerate(files):
-        energy, thickness = parse_filename(file_path)
-        if energy is None:
-            continue
+    for i, config in enumerate(configs):
+        energy, thickness = config["energy_mev"], config["thickness_um"]
             
-        print(f"[{i+1}/{len(files)}] Evaluating E={energy} MeV, T={thickness} um...")
+        print(f"[{i+1}/{len(configs)}] Evaluating E={energy} MeV, T={thickness} um...")
         
-        # Get Ground Truth
-        gt_photons, gt_electrons = get_ground_truth_from_root(file_path, bin_edges)
-        if gt_photons is None:
+        # Get Ground Truth (per-thread files of one configuration read together)
+        try:
+            counts, _ = WorkerDataset(config["logical"], files=config["files"]).histogram(bin_edges, particle_ids=(0, 1))
+        except Exception as e:
+            logging.error(f"Error reading {config['logical']}: {e}")
             continue
-            
-        # Get Predictions
-        _, pred_photons = predict_spectrum(model, meta, energy, thickness, 0)
-        _, pred_electrons = predict_spectrum(model, meta, energy, thickness, 1)
+        gt_photons, gt_electrons = counts[0] * scales[i], counts[1] * scales[i]
+        pred_photons, pred_electrons = pred[i], pred[n + i]
         
-        # Plot
-        plt.figure(figsize=(10, 6))
-        
-        # Photons
-        plt.step(bin_centers, gt_photons, where='mid', label='Simulated $\gamma$', color='blue', alpha=0.5)
-        plt.plot(bin_centers, pred_photons, label='Neural Net $\gamma$', color='blue', linestyle='--', linewidth=2)
-        
-        # Electrons
-        plt.step(bin_centers, gt_electrons, where='mid', label='Simulated $e^-$', color='red', alpha=0.5)
-        plt.plot(bin_centers, pred_electrons, label='Neural Net $e^-$', color='red', linestyle='--', linewidth=2)
-        
-        plt.yscale('log')
-        plt.title(f"Model Evaluation: {energy} MeV Beam, {thickness} $\mu$m Foil (Non-Trained)")
-        plt.xlabel("Energy (MeV)")
-        plt.ylabel("Counts")
-        plt.legend()
-        plt.grid(True, alpha=0.3, which="both")
-        
-        # Save
-        filename = f"model_evaluation_{energy}MeV_{thickness}um_NonTrained.png"
-        save_path = os.path.join(output_dir, filename)
-        plt.savefig(save_path)
-        plt.close()
+        plot_comparison(bin_centers, gt_photons, pred_photons, gt_electrons, pred_electrons, energy, thickness, output_dir)
         
     print(f"All plots saved to {output_dir}")
 
+def endpoint_energy(spectra, bin_edges, fraction=0.999):
+    """
+    Upper edge of the bin where each spectrum's cumulative count reaches `fraction` of its integral.
+    spectra has shape (N, n_bins), returns N energies.
+    """
+    cumulative = np.cumsum(spectra, axis=1)
+    total = cumulative[:, -1:]
+    reached = cumulative >= fraction * np.where(total > 0, total, np.inf)
+    index = np.where(reached.any(axis=1), np.argmax(reached, axis=1), len(bin_edges) - 2)
+    return np.asarray(bin_edges)[1:][index]
+
+def spectrum_metrics(truth, pred, bin_edges):
+    """
+    Accuracy of N predicted spectra against simulated ones, both of shape (N, n_bins):
+    chi2_ndf        Pearson chi2 over the populated bins (Poisson variance of the simulated counts) per bin
+    rel_error       mean |pred - truth| / truth over the populated bins
+    integral_error  (sum pred - sum truth) / sum truth
+    endpoint_error  difference of the 99.9 % energies in MeV (see endpoint_energy)
+    Returns a dict of arrays of length N.
+    """
+    truth = np.asarray(truth, dtype=np.float64)
+    pred = np.asarray(pred, dtype=np.float64)
+    populated = truth > 0
+    ndf = np.maximum(populated.sum(axis=1), 1)
+    safe_truth = np.where(populated, truth, 1.0)
+
+    chi2 = np.where(populated, (pred - truth) ** 2 / safe_truth, 0.0).sum(axis=1)
+    rel_error = np.where(populated, np.abs(pred - truth) / safe_truth, 0.0).sum(axis=1) / ndf
+
+    truth_total = truth.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        integral_error = np.where(truth_total > 0, (pred.sum(axis=1) - truth_total) / truth_total, np.nan)
+
+    return {
+        "chi2_ndf": chi2 / ndf,
+        "rel_error": rel_error,
+        "integral_error": integral_error,
+        "endpoint_error": endpoint_energy(pred, bin_edges) - endpoint_energy(truth, bin_edges),
+    }
+
+@profiling.profiled("evaluate.bulk")
+def evaluate_bulk(base_dir, data_dir=None, output_dir=None, binning_path=None, worst_k=0, sort_by="chi2_ndf_photons",
+                  max_workers=None, precision="fp32"):
+    """
+    Evaluates all held-out configurations at once: ground truth histogrammed in parallel,
+    every prediction in one batched pass, metrics computed as array operations.
+    Writes evaluation_metrics.csv (worst first) and, if worst_k > 0, plots of the worst_k configurations.
+    """
+    model, meta = load_resources(base_dir, precision)
+    bin_centers = meta['bin_centers']
+    bin_edges = model_bin_edges(meta, binning_path)
+
+    non_trained_dir = data_dir or os.path.join(base_dir, "non_trained")
+    catalog_configs = campaign_configurations(non_trained_dir)
+    configs = [(c["logical"], c["energy_mev"], c["thickness_um"]) for c in catalog_configs]
+
+    if not configs:
+        logging.warning(f"No files found in {non_trained_dir}")
+        return None
+
+    logging.info(f"Histogramming {len(configs)} configurations...")
+    with profiling.stage("evaluate.ground_truth", items=len(configs)):
+        # the files the catalog found, the directory is not searched again
+        truth = histogram_campaign({c["logical"]: c["files"] for c in catalog_configs}, bin_edges, max_workers=max_workers)
+    # on the event scale of the model
+    scales = nominal_scales(meta, catalog_configs)[:, np.newaxis]
+    gt_photons = np.array([truth[c[0]][0] for c in configs]) * scales
+    gt_electrons = np.array([truth[c[0]][1] for c in configs]) * scales
+
+    energies = np.array([c[1] for c in configs])
+    thicknesses = np.array([c[2] for c in configs])
+    n = len(configs)
+
+    # photons and electrons of every configuration in one pass
+    with profiling.stage("evaluate.predict", items=2 * n):
+        pred = predict_spectra(model, meta, np.tile(energies, 2), np.tile(thicknesses, 2), np.repeat([0, 1], n))
+    pred_photons, pred_electrons = pred[:n], pred[n:]
+
+    table = {"file": [os.path.basename(c[0]) for c in configs], "Energy_MeV": energies, "Thickness_um": thicknesses}
+    with profiling.stage("evaluate.metrics", items=2 * n):
+        for name, gt, pr in (("photons", gt_photons, pred_photons), ("electrons", gt_electrons, pred_electrons)):
+            for metric, values in spectrum_metrics(gt, pr, bin_edges).items():
+                table[f"{metric}_{name}"] = values
+
+    df = pd.DataFrame(table).sort_values(sort_by, ascending=False, na_position="first")
+
+    output_dir = output_dir or os.path.join(non_trained_dir, "eval_plots")
+    os.makedirs(output_dir, exist_ok=True)
+    csv_path = os.path.join(output_dir, "evaluation_metrics.csv")
+    df.to_csv(csv_path, index=False)
+    logging.info(f"Saved metrics of {n} configurations to {csv_path}")
+
+    with profiling.stage("evaluate.plots", items=min(worst_k, n)):
+        for i in df.index[:worst_k]:
+            plot_comparison(bin_centers, gt_photons[i], pred_photons[i], gt_electrons[i], pred_electrons[i],
+                            energies[i], thicknesses[i], output_dir)
+    if worst_k:
+        logging.info(f"Plotted the {min(worst_k, n)} worst configurations by {sort_by}")
+
+    return df
+
 if __name__ == "__main__":
     # Assume script is in post_process
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    evaluate_non_trained(script_dir)
+
+    parser = argparse.ArgumentParser(description="Compare the network against simulated spectra.")
+    parser.add_argument("--bulk", action="store_true", help="Write a metrics table for all configurations instead of one plot each")
+    parser.add_argument("--worst-k", type=int, default=0, help="With --bulk, plot the k worst configurations")
+    parser.add_argument("--precision", choices=sorted(MODEL_FILES), default="fp32", help="Model variant (see quantize_model.py)")
+    args = parser.parse_args()
+
+    if args.bulk:
+        evaluate_bulk(script_dir, worst_k=args.worst_k, precision=args.precision)
+    else:
+        evaluate_non_trained(script_dir, precision=args.precision)
@@ -0,0 +1,31 @@
+# Stand-in for the BremSim executable, to exercise work_queue.py without Geant4:
+#     python post_process/work_queue.py work queue.sqlite --exe "python post_process/fake_bremsim.py --fail-rate 0.2"
+# Reads the macro given with -m, sleeps per /run/beamOn and writes an empty file for every /analysis/setFileName.
+import re
+import sys
+import time
+import random
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake BremSim: touches the output files of a macro.")
+    parser.add_argument("-m", dest="macro", required=True, help="Macro to 'run'")
+    parser.add_argument("-t", dest="threads", type=int, default=1)
+    parser.add_argument("--seconds-per-mevent", type=float, default=1.0, help="Simulated time per million events")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Probability of exiting with an error")
+    args = parser.parse_args()
+
+    output = None
+    with open(args.macro) as f:
+        for line in f:
+            match = re.match(r"^/analysis/setFileName\s+(\S+)", line)
+            if match:
+                output = match.group(1)
+            match = re.match(r"^/run/beamOn\s+(\d+)", line)
+            if match and output:
+                time.sleep(int(match.group(1)) / 1e6 * args.seconds_per_mevent)
+                if random.random() < args.fail_rate:
+                    print(f"G4Exception: fake failure while writing {output}")
+                    sys.exit(1)
+                open(output, "w").close()
+                print(f"Run terminated, wrote {output}")
@@ -0,0 +1,169 @@
+import pickle
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.interpolate import LinearNDInterpolator, NearestNDInterpolator, RegularGridInterpolator
+
+import profiling
+from spectra_io import per_nominal_events, NOMINAL_EVENTS
+from binning import Binning
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+DEFAULT_EMULATOR_PATH = "grid_emulator.pkl"
+
+SPECTRUM_COLUMNS = {0: "Photon_Spectrum", 1: "Electron_Spectrum"}
+
+class GridEmulator:
+    """
+    Non-neural baseline for BremSpecNet: linear interpolation of the simulated spectra over (E, log10 T).
+
+    Each spectrum is split into its integral and its shape (spectrum / integral). The log of the
+    shape, floored at half a count, and the log of the integral are interpolated, bilinearly on a
+    full (E, T) grid and on a Delaunay triangulation for scattered configurations.
+    Queries outside the simulated grid fall back to the nearest configuration.
+    """
+
+    def __init__(self, energies, thicknesses, photon_spectra, electron_spectra, bin_edges, binning_sha256=None,
+                 nominal_events=NOMINAL_EVENTS):
+        self.bin_edges = np.asarray(bin_edges, dtype=np.float64)
+        self.bin_centers = (self.bin_edges[:-1] + self.bin_edges[1:]) / 2
+        self.binning_sha256 = binning_sha256
+        self.nominal_events = nominal_events
+        n_bins = len(self.bin_centers)
+
+        # average repeated configurations
+        points, inverse = np.unique(np.column_stack([energies, np.log10(np.asarray(thicknesses) + 1e-6)]),
+                                    axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        spectra = np.hstack([photon_spectra, electron_spectra]).astype(np.float64)
+        summed = np.zeros((len(points), spectra.shape[1]))
+        np.add.at(summed, inverse, spectra)
+        spectra = summed / np.bincount(inverse)[:, np.newaxis]
+
+        # [log shape photons, log shape electrons, log integral photons, log integral electrons]
+        values = []
+        totals = []
+        for species in (spectra[:, :n_bins], spectra[:, n_bins:]):
+            total = species.sum(axis=1, keepdims=True)
+            safe_total = np.where(total > 0, total, 1.0)
+            values.append(np.log(np.maximum(species, 0.5) / safe_total))
+            totals.append(np.log(np.maximum(total, 0.5)))
+        self.values = np.hstack(values + totals)
+        self.points = points
+        self.n_bins = n_bins
+
+        self._build()
+
+    def _build(self):
+        energies = np.unique(self.points[:, 0])
+        log_thick = np.unique(self.points[:, 1])
+        self.regular = len(energies) * len(log_thick) == len(self.points) and len(energies) > 1 and len(log_thick) > 1
+
+        if self.regular:
+            # np.unique sorted the points by (E, log T), i.e. in grid order
+            grid = self.values.reshape(len(energies), len(log_thick), -1)
+            self._interpolator = RegularGridInterpolator((energies, log_thick), grid, bounds_error=False, fill_value=np.nan)
+        elif len(self.points) > 2:
+            self._interpolator = LinearNDInterpolator(self.points, self.values)
+        else:
+            self._interpolator = None
+        self._nearest = NearestNDInterpolator(self.points, self.values)
+
+    def __getstate__(self):
+        # the interpolators are rebuilt on load
+        state = self.__dict__.copy()
+        state.pop("_interpolator", None)
+        state.pop("_nearest", None)
+        return state
+
+    def __setstate__(self, state):
+        # emulators saved before the event scale was recorded
+        state.setdefault("nominal_events", NOMINAL_EVENTS)
+        self.__dict__.update(state)
+        self._build()
+
+    @classmethod
+    @profiling.profiled("emulator.build")
+    def from_table(cls, pickle_path, binning_path, nominal_events=NOMINAL_EVENTS):
+        """
+        Builds the emulator from combined_spectra_table.pkl and its binning artifact.
+        """
+        data = per_nominal_events(pd.read_pickle(pickle_path), nominal_events)
+        binning = Binning.load(binning_path, expected_hash=data.attrs.get("binning_sha256"))
+        binning.check_spectra(data["Photon_Spectrum"], "Photon spectra")
+        return cls(data["Energy_MeV"].values, data["Thickness_um"].values,
+                   np.vstack(data["Photon_Spectrum"].values), np.vstack(data["Electron_Spectrum"].values),
+                   binning.edges, binning.hash, nominal_events)
+
+    def save(self, path=DEFAULT_EMULATOR_PATH):
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+        logging.info(f"Saved emulator over {len(self.points)} configurations to {path}")
+
+    @classmethod
+    def load(cls, path=DEFAULT_EMULATOR_PATH):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    @property
+    def meta(self):
+        """
+        The binning and event scale entries of model_metadata.pkl, so the emulator can stand in for the network.
+        """
+        meta = {"bin_centers": self.bin_centers, "bin_edges": self.bin_edges, "nominal_events": self.nominal_events}
+        if self.binning_sha256 is not None:
+            meta["binning_sha256"] = self.binning_sha256
+        return meta
+
+    def _interpolate(self, energies, thicknesses):
+        query = np.column_stack([energies, np.log10(np.asarray(thicknesses, dtype=np.float64) + 1e-6)])
+        if self._interpolator is None:
+            return self._nearest(query)
+        values = self._interpolator(query)
+        outside = np.isnan(values).any(axis=1)
+        if outside.any():
+            values[outside] = self._nearest(query[outside])
+        return values
+
+    def predict_spectra(self, energies, thicknesses, particle_types):
+        """
+        Spectra of N configurations at once, shape (N, n_bins), same scale as the network.
+        """
+        energies = np.atleast_1d(np.asarray(energies, dtype=np.float64))
+        thicknesses = np.broadcast_to(np.asarray(thicknesses, dtype=np.float64), energies.shape)
+        particle_types = np.broadcast_to(np.asarray(particle_types, dtype=np.int64), energies.shape)
+
+        values = self._interpolate(energies, thicknesses)
+        n = self.n_bins
+        rows = np.arange(len(energies))[:, np.newaxis]
+        shape_columns = particle_types[:, np.newaxis] * n + np.arange(n)
+        log_shape = values[rows, shape_columns]
+        log_total = values[np.arange(len(energies)), 2 * n + particle_types]
+
+        shape = np.exp(log_shape)
+        shape /= shape.sum(axis=1, keepdims=True)
+        y_pred = shape * np.exp(log_total)[:, np.newaxis]
+
+        # the floor of half a count is not a prediction
+        return np.where(y_pred < 0.5, 0.0, y_pred)
+
+    def predict_spectrum(self, energy_mev, thickness_um, particle_type):
+        """
+        Same interface as evaluate_model.predict_spectrum (without model and meta).
+        particle_type: 0 (Photon) or 1 (Electron)
+        """
+        return self.bin_centers, self.predict_spectra([energy_mev], [thickness_um], [particle_type])[0]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the (E, log T) interpolation emulator from a combined spectra table.")
+    parser.add_argument("--table", default="combined_spectra_table.pkl", help="Combined spectra table")
+    parser.add_argument("--bin-edges", default="binning.json", help="Binning artifact (or legacy bin_edges.npy) of the table")
+    parser.add_argument("--output", default=DEFAULT_EMULATOR_PATH, help="Where to save the emulator")
+    args = parser.parse_args()
+
+    emulator = GridEmulator.from_table(args.table, args.bin_edges)
+    logging.info(f"{'Regular' if emulator.regular else 'Scattered'} grid of {len(emulator.points)} configurations, {emulator.n_bins} bins")
+    emulator.save(args.output)
@@ -0,0 +1,285 @@
+# Inverse of predict_spectrum: the beam energy and foil thickness that produced a photon spectrum.
+#
+#     fits = fit_spectra(model, meta, spectra)       # spectra: (M, n_bins) photon counts in the model binning
+#     python post_process/inverse_fit.py --data-dir post_process/non_trained --replicas 20
+#
+# Many spectra are fitted together:
+#   1. the network predicts a coarse (E, log10 T) candidate grid once, in one batched pass, and the
+#      chi2 of every spectrum against every candidate is a few matrix products;
+#   2. starting from the best candidate, all spectra are refined at once by Adam on the summed chi2,
+#      differentiating through the feature scaling, the network and the target scaling in torch
+#      (the chi2 of each spectrum only depends on its own parameters);
+#   3. uncertainties come from the Hessian of each chi2 at its minimum, cov = 2 H^-1.
+# The chi2 uses the variances of the spectrum (counts by default). The normalization is a free
+# parameter solved analytically for measured spectra, or fixed to the model's nominal event count.
+# The uncertainties are statistical: the model's own error (see evaluate_model.py) is not included.
+import os
+import time
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+import torch
+
+import profiling
+from evaluate_model import load_resources, predict_spectra, model_bin_edges, nominal_scales
+from worker_dataset import histogram_campaign
+from catalog import campaign_configurations
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# parameter range of the training campaign (thickness in um)
+ENERGY_RANGE = (0.1, 5.0)
+THICKNESS_RANGE = (5.0, 2000.0)
+
+class ScaledNet(torch.nn.Module):
+    """
+    (energy, log10 thickness) of N photon spectra -> the N predicted spectra, as predict_spectra
+    computes them but differentiable: feature construction, scalers and expm1 are done in torch.
+    """
+
+    def __init__(self, model, meta):
+        super().__init__()
+        self.model = model
+        self.register_buffer("centers", torch.tensor(meta["bin_centers"], dtype=torch.float32))
+        self.register_buffer("x_mean", torch.tensor(meta["scaler_X"].mean_, dtype=torch.float32))
+        self.register_buffer("x_scale", torch.tensor(meta["scaler_X"].scale_, dtype=torch.float32))
+        self.y_min = float(meta["scaler_y"].min_[0])
+        self.y_scale = float(meta["scaler_y"].scale_[0])
+
+    def forward(self, energies, log_thicknesses):
+        n, n_bins = len(energies), len(self.centers)
+        E = energies[:, None].expand(n, n_bins)
+        # same features as evaluate_model.build_features: [E, LogT, Bin, Type, (E-Bin), (E-Bin)*E]
+        log_thick = torch.log10(10 ** log_thicknesses + 1e-6)[:, None].expand(n, n_bins)
+        centers = self.centers[None, :].expand(n, n_bins)
+        distance = E - centers
+        X = torch.stack([E, log_thick, centers, torch.zeros_like(E), distance, distance * E], dim=-1)
+        X = (X - self.x_mean) / self.x_scale
+        y_scaled = self.model(X.reshape(-1, 6)).reshape(n, n_bins)
+        return torch.clamp(torch.expm1((y_scaled - self.y_min) / self.y_scale), min=0)
+
+def _chi2_terms(spectra, variances):
+    weights = 1.0 / variances
+    return spectra * weights, weights, (spectra ** 2 * weights).sum(axis=-1)
+
+@profiling.profiled("invert.grid_search")
+def grid_search(model, meta, spectra, variances, free_norm=True, n_energy=50, n_thickness=40,
+                energy_range=ENERGY_RANGE, thickness_range=THICKNESS_RANGE):
+    """
+    Best (E, T) of every spectrum on an n_energy x n_thickness grid (log-spaced in T).
+    Returns (energies, thicknesses, chi2) of the best candidates, each of length M.
+    """
+    grid_E, grid_logT = np.meshgrid(np.linspace(*energy_range, n_energy),
+                                    np.linspace(*np.log10(thickness_range), n_thickness), indexing="ij")
+    grid_E, grid_T = grid_E.ravel(), 10 ** grid_logT.ravel()
+    candidates = predict_spectra(model, meta, grid_E, grid_T, np.zeros(len(grid_E)))
+
+    # chi2[m, g] = C[m] - 2 a A[m, g] + a^2 B[m, g], with the normalization a = A / B when it is free
+    Sw, w, C = _chi2_terms(spectra, variances)
+    A = Sw @ candidates.T
+    B = w @ (candidates ** 2).T
+    chi2 = C[:, None] - A ** 2 / np.maximum(B, 1e-300) if free_norm else C[:, None] - 2 * A + B
+
+    best = np.argmin(chi2, axis=1)
+    return grid_E[best], grid_T[best], chi2[np.arange(len(spectra)), best]
+
+def _chi2(net, spectra, weights, energies, log_thicknesses, free_norm):
+    """
+    chi2 of every spectrum (and the normalization used) for the given parameters.
+    """
+    pred = net(energies, log_thicknesses)
+    if free_norm:
+        scale = (spectra * weights * pred).sum(dim=1) / torch.clamp((weights * pred ** 2).sum(dim=1), min=1e-30)
+    else:
+        scale = torch.ones(len(pred), dtype=pred.dtype)
+    chi2 = (weights * (spectra - scale[:, None] * pred) ** 2).sum(dim=1)
+    return chi2, scale
+
+@profiling.profiled("invert.refine")
+def refine(net, spectra, variances, energies, thicknesses, free_norm=True, steps=200, lr=0.02,
+           energy_range=ENERGY_RANGE, thickness_range=THICKNESS_RANGE):
+    """
+    Adam on the parameters of all spectra at once, in coordinates scaled to [0, 1] over the ranges.
+    Returns (energies, log10 thicknesses, chi2) of the best point seen for each spectrum.
+    """
+    lo = torch.tensor([energy_range[0], np.log10(thickness_range[0])], dtype=torch.float32)
+    span = torch.tensor([energy_range[1] - energy_range[0], np.log10(thickness_range[1] / thickness_range[0])],
+                        dtype=torch.float32)
+
+    S = torch.tensor(spectra, dtype=torch.float32)
+    W = torch.tensor(1.0 / variances, dtype=torch.float32)
+    start = torch.tensor(np.column_stack([energies, np.log10(thicknesses)]), dtype=torch.float32)
+    params = ((start - lo) / span).clone().requires_grad_(True)
+
+    optimizer = torch.optim.Adam([params], lr=lr)
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, steps)
+    best = params.detach().clone()
+    best_chi2 = torch.full((len(S),), float("inf"))
+
+    for _ in range(steps):
+        theta = lo + params * span
+        chi2, _ = _chi2(net, S, W, theta[:, 0], theta[:, 1], free_norm)
+        improved = chi2.detach() < best_chi2
+        best[improved] = params.detach()[improved]
+        best_chi2 = torch.where(improved, chi2.detach(), best_chi2)
+
+        optimizer.zero_grad()
+        # the chi2 of a spectrum depends on its own parameters only, the sum gives every gradient at once
+        chi2.sum().backward()
+        optimizer.step()
+        scheduler.step()
+        with torch.no_grad():
+            params.clamp_(0.0, 1.0)
+
+    theta = lo + best * span
+    return theta[:, 0], theta[:, 1], best_chi2
+
+def hessian_errors(net, spectra, variances, energies, log_thicknesses, free_norm=True):
+    """
+    Uncertainties of E (MeV) and log10 T from cov = 2 H^-1 of each chi2 at its minimum.
+    Returns (sigma_E, sigma_log10T, correlation, scale); NaN where H is not positive definite.
+    """
+    S = torch.tensor(spectra, dtype=torch.float32)
+    W = torch.tensor(1.0 / variances, dtype=torch.float32)
+    theta = torch.stack([energies, log_thicknesses], dim=1).detach().clone().requires_grad_(True)
+
+    chi2, scale = _chi2(net, S, W, theta[:, 0], theta[:, 1], free_norm)
+    (grad,) = torch.autograd.grad(chi2.sum(), theta, create_graph=True)
+    # the Hessian of the sum is block diagonal, one 2x2 block per spectrum, a row per backward pass
+    rows = [torch.autograd.grad(grad[:, k].sum(), theta, retain_graph=True)[0] for k in range(2)]
+    H = torch.stack(rows, dim=1).detach().double()
+
+    det = H[:, 0, 0] * H[:, 1, 1] - H[:, 0, 1] * H[:, 1, 0]
+    valid = (det > 0) & (H[:, 0, 0] > 0)
+    cov = 2 * torch.stack([torch.stack([H[:, 1, 1], -H[:, 0, 1]], dim=1),
+                           torch.stack([-H[:, 1, 0], H[:, 0, 0]], dim=1)], dim=1) / det[:, None, None]
+    sigma_E = torch.sqrt(cov[:, 0, 0]).numpy()
+    sigma_logT = torch.sqrt(cov[:, 1, 1]).numpy()
+    corr = (cov[:, 0, 1] / torch.sqrt(cov[:, 0, 0] * cov[:, 1, 1])).numpy()
+    invalid = ~valid.numpy()
+    sigma_E[invalid] = sigma_logT[invalid] = corr[invalid] = np.nan
+    return sigma_E, sigma_logT, corr, scale.detach().numpy()
+
+@profiling.profiled("invert.fit")
+def fit_spectra(model, meta, spectra, variances=None, free_norm=True, steps=200, batch_size=512,
+                energy_range=ENERGY_RANGE, thickness_range=THICKNESS_RANGE):
+    """
+    Fits (E, T) to M photon spectra in the model binning, shape (M, n_bins).
+    variances defaults to the counts (at least 1 per bin).
+    Returns a DataFrame with one row per spectrum: the best fit and its uncertainties, the normalization,
+    chi2/ndf, the grid starting point and whether the fit ended on the edge of the range.
+    """
+    spectra = np.atleast_2d(np.asarray(spectra, dtype=np.float64))
+    if spectra.shape[1] != len(meta["bin_centers"]):
+        raise ValueError(f"Spectra have {spectra.shape[1]} bins, the model {len(meta['bin_centers'])}")
+    variances = np.maximum(spectra if variances is None else np.atleast_2d(variances), 1.0)
+
+    grid_E, grid_T, _ = grid_search(model, meta, spectra, variances, free_norm,
+                                    energy_range=energy_range, thickness_range=thickness_range)
+
+    # only the inputs are optimized
+    for p in model.parameters():
+        p.requires_grad_(False)
+    net = ScaledNet(model, meta)
+
+    columns = {name: [] for name in ("E", "logT", "chi2", "sigma_E", "sigma_logT", "corr", "scale")}
+    for start in range(0, len(spectra), batch_size):
+        batch = slice(start, start + batch_size)
+        E, logT, chi2 = refine(net, spectra[batch], variances[batch], grid_E[batch], grid_T[batch], free_norm, steps,
+                               energy_range=energy_range, thickness_range=thickness_range)
+        sigma_E, sigma_logT, corr, scale = hessian_errors(net, spectra[batch], variances[batch], E, logT, free_norm)
+        for name, values in (("E", E.detach().numpy()), ("logT", logT.detach().numpy()), ("chi2", chi2.numpy()),
+                             ("sigma_E", sigma_E), ("sigma_logT", sigma_logT), ("corr", corr), ("scale", scale)):
+            columns[name].append(values)
+    c = {name: np.concatenate(values) for name, values in columns.items()}
+
+    thickness = 10 ** c["logT"]
+    ndf = (spectra > 0).sum(axis=1) - (3 if free_norm else 2)
+    at_bound = ((np.abs(c["E"] - energy_range[0]) < 1e-3) | (np.abs(c["E"] - energy_range[1]) < 1e-3)
+                | (np.abs(c["logT"] - np.log10(thickness_range[0])) < 1e-3)
+                | (np.abs(c["logT"] - np.log10(thickness_range[1])) < 1e-3))
+    return pd.DataFrame({
+        "Energy_MeV": c["E"],
+        "Energy_err": c["sigma_E"],
+        "Thickness_um": thickness,
+        # log10 T is fitted, the error is propagated linearly
+        "Thickness_err": thickness * np.log(10) * c["sigma_logT"],
+        "corr": c["corr"],
+        "scale": c["scale"],
+        "chi2_ndf": c["chi2"] / np.maximum(ndf, 1),
+        "grid_Energy_MeV": grid_E,
+        "grid_Thickness_um": grid_T,
+        "at_bound": at_bound,
+    })
+
+@profiling.profiled("invert")
+def benchmark(model_dir, data_dir, replicas=10, free_norm=True, steps=200, batch_size=512, binning_path=None, seed=0):
+    """
+    Fits the photon spectra of the configurations in data_dir (the non-trained campaign by default),
+    each repeated as `replicas` Poisson resamples, and reports the accuracy against the true (E, T)
+    and the throughput in spectra per second.
+    """
+    model, meta = load_resources(model_dir)
+    bin_edges = model_bin_edges(meta, binning_path)
+
+    configs = campaign_configurations(data_dir)
+    if not configs:
+        raise FileNotFoundError(f"No files found in {data_dir}")
+    with profiling.stage("invert.ground_truth", items=len(configs)):
+        truth = histogram_campaign({c["logical"]: c["files"] for c in configs}, bin_edges, particle_ids=(0,))
+    photons = np.array([truth[c["logical"]][0] for c in configs], dtype=np.float64)
+
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(np.repeat(photons, replicas, axis=0)).astype(np.float64)
+    # resampled as simulated, then brought to the event scale of the model with their variances
+    scales = np.repeat(nominal_scales(meta, configs), replicas)[:, np.newaxis]
+    spectra = counts * scales
+    variances = np.maximum(counts, 1.0) * scales ** 2
+    true_E = np.repeat([c["energy_mev"] for c in configs], replicas)
+    true_T = np.repeat([c["thickness_um"] for c in configs], replicas)
+
+    start = time.perf_counter()
+    grid_search(model, meta, spectra, variances, free_norm)
+    grid_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fits = fit_spectra(model, meta, spectra, variances, free_norm=free_norm, steps=steps, batch_size=batch_size)
+    fit_time = time.perf_counter() - start
+
+    fits["true_Energy_MeV"] = true_E
+    fits["true_Thickness_um"] = true_T
+    pull_E = (fits["Energy_MeV"] - true_E) / fits["Energy_err"]
+    pull_T = (fits["Thickness_um"] - true_T) / fits["Thickness_err"]
+
+    n = len(spectra)
+    print(f"{len(configs)} configurations x {replicas} Poisson replicas = {n} spectra, {len(bin_edges) - 1} bins, "
+          f"{torch.get_num_threads()} threads")
+    print(f"grid only:  {grid_time:8.2f} s  {n / grid_time:10.1f} spectra/s")
+    print(f"full fit:   {fit_time:8.2f} s  {n / fit_time:10.1f} spectra/s  ({steps} refinement steps)")
+    print(f"|dE| median {np.median(np.abs(fits['Energy_MeV'] - true_E)) * 1e3:.1f} keV, "
+          f"|dT|/T median {np.median(np.abs(fits['Thickness_um'] - true_T) / true_T):.3f}, "
+          f"chi2/ndf median {fits['chi2_ndf'].median():.2f}, at bound {int(fits['at_bound'].sum())}")
+    print(f"pulls: E median {pull_E.median():+.2f}, width {pull_E.std():.2f}; "
+          f"T median {pull_T.median():+.2f}, width {pull_T.std():.2f} (statistical errors only)")
+    return fits
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit beam energy and foil thickness to photon spectra through the network.")
+    parser.add_argument("--model-dir", default=SCRIPT_DIR, help="Directory with brem_spec_net.pth and model_metadata.pkl")
+    parser.add_argument("--data-dir", default=os.path.join(SCRIPT_DIR, "non_trained"), help="Output files to fit")
+    parser.add_argument("--replicas", type=int, default=10, help="Poisson resamples per configuration")
+    parser.add_argument("--steps", type=int, default=200, help="Gradient refinement steps")
+    parser.add_argument("--batch-size", type=int, default=512, help="Spectra refined together")
+    parser.add_argument("--fixed-norm", action="store_true", help="Use the model normalization instead of fitting it")
+    parser.add_argument("--binning", default=None, help="Binning artifact the model must have been trained with")
+    parser.add_argument("--csv", default=None, help="Also write the fits")
+    args = parser.parse_args()
+
+    fits = benchmark(args.model_dir, args.data_dir, args.replicas, not args.fixed_norm, args.steps, args.batch_size,
+                     args.binning)
+    if args.csv:
+        fits.to_csv(args.csv, index=False)
@@ -0,0 +1,201 @@
+import os
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+import profiling
+from catalog import campaign_configurations
+from worker_dataset import WorkerDataset
+from binning import Binning, uniform_binning, MAX_ENERGY
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+DEFAULT_MASTER_PATH = "master_spectra.npz"
+
+# 1 keV base resolution, fine enough to resolve the tungsten K lines
+DEFAULT_FINE_WIDTH = 0.001
+
+SPECIES = {0: "photons", 1: "electrons"}
+
+class MasterSpectra:
+    """
+    Every configuration of a campaign histogrammed once at a fine base resolution and stored
+    as cumulative counts, cum[i, k] = counts of configuration i below fine_edges[k].
+    Spectra for any coarser binning are differences of the cumulative arrays at the new edges,
+    computed for all configurations at once without touching the ROOT files again.
+    """
+
+    def __init__(self, fine_edges, sources=None, energies=None, thicknesses=None, n_events=None, cumulative=None):
+        self.fine_edges = np.asarray(fine_edges, dtype=np.float64)
+        n_fine = len(self.fine_edges)
+        self.sources = list(sources) if sources is not None else []
+        self.energies = np.asarray(energies if energies is not None else [], dtype=np.float64)
+        self.thicknesses = np.asarray(thicknesses if thicknesses is not None else [], dtype=np.float64)
+        self.n_events = np.asarray(n_events if n_events is not None else [], dtype=np.float64)
+        self.cumulative = cumulative or {pid: np.zeros((0, n_fine)) for pid in SPECIES}
+
+    def __len__(self):
+        return len(self.sources)
+
+    def save(self, path=DEFAULT_MASTER_PATH):
+        # written next to the store and renamed, an interrupted save leaves the previous store intact
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, fine_edges=self.fine_edges, sources=np.array(self.sources), energies=self.energies,
+                     thicknesses=self.thicknesses, n_events=self.n_events,
+                     **{f"cum_{name}": self.cumulative[pid] for pid, name in SPECIES.items()})
+        os.replace(tmp_path, path)
+        logging.info(f"Saved {len(self)} configurations at {len(self.fine_edges) - 1} fine bins to {path}")
+
+    @classmethod
+    def load(cls, path=DEFAULT_MASTER_PATH):
+        with np.load(path) as data:
+            return cls(data["fine_edges"], data["sources"].tolist(), data["energies"], data["thicknesses"],
+                       data["n_events"], {pid: data[f"cum_{name}"] for pid, name in SPECIES.items()})
+
+    def add(self, source, energy, thickness, n_events, counts):
+        """
+        Appends one configuration, counts is {pid: fine histogram}.
+        """
+        self.sources.append(source)
+        self.energies = np.append(self.energies, energy)
+        self.thicknesses = np.append(self.thicknesses, thickness)
+        self.n_events = np.append(self.n_events, np.nan if n_events is None else n_events)
+        for pid in SPECIES:
+            row = np.concatenate([[0.0], np.cumsum(counts[pid])])
+            self.cumulative[pid] = np.vstack([self.cumulative[pid], row])
+
+    def cumulative_at(self, edges, particle_id=0):
+        """
+        Cumulative counts of every configuration at the given energies, shape (N, len(edges)).
+        Edges between fine edges are interpolated linearly (exact when they fall on fine edges).
+        """
+        edges = np.clip(np.asarray(edges, dtype=np.float64), self.fine_edges[0], self.fine_edges[-1])
+        k = np.clip(np.searchsorted(self.fine_edges, edges, side="right") - 1, 0, len(self.fine_edges) - 2)
+        frac = (edges - self.fine_edges[k]) / (self.fine_edges[k + 1] - self.fine_edges[k])
+        # edges on the fine grid (up to rounding) difference exact counts
+        frac[frac < 1e-9] = 0.0
+        frac[frac > 1 - 1e-9] = 1.0
+        cum = self.cumulative[particle_id]
+        return cum[:, k] + frac * (cum[:, k + 1] - cum[:, k])
+
+    def misalignment(self, edges):
+        """
+        Largest distance (MeV) of an edge from the nearest fine edge, 0 for exact rebinning.
+        """
+        edges = np.asarray(edges, dtype=np.float64)
+        k = np.clip(np.searchsorted(self.fine_edges, edges), 1, len(self.fine_edges) - 1)
+        return float(np.max(np.minimum(np.abs(edges - self.fine_edges[k - 1]), np.abs(self.fine_edges[k] - edges))))
+
+    def rebin(self, edges, particle_id=0):
+        """
+        Spectra of all configurations in the given (uniform or variable) binning, shape (N, len(edges) - 1).
+        """
+        return np.diff(self.cumulative_at(edges, particle_id), axis=1)
+
+    def rebin_uniform(self, bin_width, max_energy=MAX_ENERGY, particle_id=0):
+        edges = np.arange(0, max_energy + bin_width, bin_width)
+        return edges, self.rebin(edges, particle_id)
+
+    def to_table(self, binning):
+        """
+        Combined spectra table (same layout as combine_datasets) in the given Binning.
+        """
+        if self.misalignment(binning.edges) > 1e-9:
+            logging.warning(f"Bin edges fall between fine edges (up to {self.misalignment(binning.edges) * 1e3:.3f} keV), "
+                            "counts are split linearly")
+
+        photons = self.rebin(binning.edges, 0)
+        electrons = self.rebin(binning.edges, 1)
+        df = pd.DataFrame({
+            "Energy_MeV": self.energies,
+            "Thickness_um": self.thicknesses,
+            "N_Events": self.n_events,
+            "Total_Photons": self.cumulative[0][:, -1],
+            "Total_Electrons": self.cumulative[1][:, -1],
+            "Photon_Spectrum": list(photons),
+            "Electron_Spectrum": list(electrons),
+        })
+        df = df.sort_values(by=["Thickness_um", "Energy_MeV"]).reset_index(drop=True)
+        df.attrs["binning_sha256"] = binning.hash
+        return df
+
+@profiling.profiled("master.ingest")
+def ingest(data_dir, master_path=DEFAULT_MASTER_PATH, fine_width=DEFAULT_FINE_WIDTH, max_energy=MAX_ENERGY):
+    """
+    Adds every configuration of data_dir that is not in the master store yet.
+    Only the new configurations are read from their ROOT files.
+    """
+    if os.path.exists(master_path):
+        master = MasterSpectra.load(master_path)
+        logging.info(f"Loaded {len(master)} configurations from {master_path}")
+    else:
+        master = MasterSpectra(np.arange(0, max_energy + fine_width, fine_width))
+
+    known = set(master.sources)
+    configs = [c for c in campaign_configurations(data_dir) if os.path.basename(c["logical"]) not in known]
+    logging.info(f"Ingesting {len(configs)} new configurations at {fine_width * 1e3:g} keV resolution...")
+
+    with ProcessPoolExecutor() as pool:
+        for i, config in enumerate(configs):
+            f = config["logical"]
+            try:
+                dataset = WorkerDataset(f, files=config["files"])
+                counts, _ = dataset.histogram(master.fine_edges, particle_ids=tuple(SPECIES), executor=pool)
+            except Exception as e:
+                logging.warning(f"Error processing {f}: {e}")
+                continue
+            master.add(os.path.basename(f), config["energy_mev"], config["thickness_um"], config["n_events"], counts)
+            if (i + 1) % 20 == 0:
+                logging.info(f"Processed {i + 1}/{len(configs)} files...")
+
+    master.save(master_path)
+    return master
+
+@profiling.profiled("master.rebin")
+def write_table(master_path, binning, output_dir="."):
+    """
+    Writes combined_spectra_table.pkl, binning.json and bin_edges.npy for a binning, from the master store only.
+    """
+    return save_table(MasterSpectra.load(master_path), binning, output_dir)
+
+def save_table(master, binning, output_dir="."):
+    """
+    Writes the table files of write_table from a master store already in memory.
+    """
+    df = master.to_table(binning)
+    table_path = os.path.join(output_dir, "combined_spectra_table.pkl")
+    # readers (training, plots) may pick the table up while it is rewritten, see watch_outputs.py
+    df.to_pickle(table_path + ".tmp")
+    os.replace(table_path + ".tmp", table_path)
+    binning.save(os.path.join(output_dir, "binning.json"))
+    np.save(os.path.join(output_dir, "bin_edges.npy"), binning.edges)
+    logging.info(f"Wrote {len(df)} configurations in {binning.n_bins} bins to {output_dir}")
+    return df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fine-resolution master spectra and fast rebinning.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("ingest", help="Add the configurations of a campaign directory to the master store")
+    p.add_argument("data_dir", help="Directory with the BremSim output files")
+    p.add_argument("--master", default=DEFAULT_MASTER_PATH, help="Master store to create or extend")
+    p.add_argument("--fine-width", type=float, default=DEFAULT_FINE_WIDTH, help="Base resolution in MeV (new stores only)")
+
+    p = subparsers.add_parser("table", help="Write a combined spectra table in another binning, from the master store")
+    p.add_argument("--master", default=DEFAULT_MASTER_PATH, help="Master store")
+    group = p.add_mutually_exclusive_group(required=True)
+    group.add_argument("--binning", help="Binning artifact (binning.json or bin_edges.npy)")
+    group.add_argument("--width", type=float, help="Uniform bin width in MeV")
+    p.add_argument("--output-dir", default=".", help="Where to write the table and the binning")
+
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        ingest(args.data_dir, args.master, args.fine_width)
+    else:
+        binning = Binning.load(args.binning) if args.binning else uniform_binning(args.width)
+        write_table(args.master, binning, args.output_dir)
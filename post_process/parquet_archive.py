@@ -0,0 +1,206 @@
+# Parquet archive of the raw "Absolute Energies" events of a campaign.
+#
+#     python post_process/parquet_archive.py convert <data_dir> --archive events_parquet
+#     python post_process/parquet_archive.py query --archive events_parquet --particle 0 --min-energy 1 --min-thickness 1000
+#
+# One hive partition per configuration, Energy_MeV=<E>/Thickness_um=<T>/<name>.parquet (one file per
+# BremSim output file), with AbsEnergy and Weight as float32, ParticleID as int8 and zstd compression.
+# Queries go through the Arrow dataset scanner: partitions outside a beam energy or thickness range
+# are never opened, only the projected columns are decoded, and row groups whose statistics cannot
+# match the filter are skipped. The scan runs on all cores.
+# Conversion is incremental: files whose part is newer than the ROOT file are not converted again.
+import os
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import uproot
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import profiling
+from catalog import campaign_configurations
+from worker_dataset import event_branches, WEIGHT_BRANCH
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+DEFAULT_ARCHIVE_DIR = "events_parquet"
+TREE_NAME = "Absolute Energies"
+
+# ParticleID is 0 (photon), 1 (electron) or 2 (positron), the energies are well within float32 precision
+EVENT_SCHEMA = pa.schema([
+    ("AbsEnergy", pa.float32()),
+    ("ParticleID", pa.int8()),
+    (WEIGHT_BRANCH, pa.float32()),
+])
+PARTITIONING = ds.partitioning(pa.schema([("Energy_MeV", pa.float64()), ("Thickness_um", pa.float64())]), flavor="hive")
+
+# ~1M rows per row group, large enough for zstd and small enough for the statistics to skip work
+ROW_GROUP_SIZE = 1 << 20
+
+def partition_dir(archive_dir, energy, thickness):
+    return os.path.join(archive_dir, f"Energy_MeV={energy!r}", f"Thickness_um={thickness!r}")
+
+def _convert_file(file_path, part_path, n_events, compression_level, step_size):
+    """
+    Writes the events of one ROOT file to one Parquet file. Returns the number of rows.
+    """
+    rows = 0
+    # dot files are ignored by the dataset discovery, a conversion cut short is never read
+    tmp_path = os.path.join(os.path.dirname(part_path), "." + os.path.basename(part_path) + ".tmp")
+    with uproot.open(file_path) as file:
+        tree = file[TREE_NAME]
+        branches = event_branches(tree)
+        # unweighted runs have no Weight column, open_archive reads it as null for their rows
+        schema = EVENT_SCHEMA if WEIGHT_BRANCH in branches else EVENT_SCHEMA.remove(EVENT_SCHEMA.get_field_index(WEIGHT_BRANCH))
+        schema = schema.with_metadata({"bremsim.source": os.path.basename(file_path),
+                                       "bremsim.n_events": "" if n_events is None else str(n_events)})
+
+        with pq.ParquetWriter(tmp_path, schema, compression="zstd", compression_level=compression_level) as writer:
+            for chunk in tree.iterate(branches, step_size=step_size, library="np"):
+                columns = {
+                    "AbsEnergy": chunk["AbsEnergy"].astype(np.float32),
+                    "ParticleID": chunk["ParticleID"].astype(np.int8),
+                }
+                if WEIGHT_BRANCH in chunk:
+                    columns[WEIGHT_BRANCH] = chunk[WEIGHT_BRANCH].astype(np.float32)
+                writer.write_table(pa.table(columns, schema=schema), row_group_size=ROW_GROUP_SIZE)
+                rows += len(columns["AbsEnergy"])
+
+    # renamed when complete, a part that exists is always whole
+    os.replace(tmp_path, part_path)
+    return rows
+
+@profiling.profiled("archive.convert")
+def convert_campaign(data_dir, archive_dir=DEFAULT_ARCHIVE_DIR, compression_level=3, step_size="100 MB", max_workers=None):
+    """
+    Converts the ntuple rows of every configuration of data_dir into the archive, one process per file.
+    Returns the number of rows written.
+    """
+    jobs = []
+    for config in campaign_configurations(data_dir):
+        target = partition_dir(archive_dir, config["energy_mev"], config["thickness_um"])
+        os.makedirs(target, exist_ok=True)
+        for f in config["files"]:
+            part_path = os.path.join(target, os.path.splitext(os.path.basename(f))[0] + ".parquet")
+            if os.path.exists(part_path) and os.path.getmtime(part_path) >= os.path.getmtime(f):
+                continue
+            # the event count belongs to the configuration, it is stored on its first part only
+            n_events = config["n_events"] if f == config["files"][0] else None
+            jobs.append((f, part_path, n_events))
+
+    if not jobs:
+        logging.info(f"{archive_dir} is up to date")
+        return 0
+
+    logging.info(f"Converting {len(jobs)} files into {archive_dir}...")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        rows = list(pool.map(_convert_file, *zip(*jobs), [compression_level] * len(jobs), [step_size] * len(jobs)))
+
+    size = sum(os.path.getsize(p) for _, p, _ in jobs)
+    source_size = sum(os.path.getsize(f) for f, _, _ in jobs)
+    logging.info(f"Wrote {sum(rows)} rows in {time.perf_counter() - start:.1f} s, "
+                 f"{size / 1e6:.1f} MB (ROOT: {source_size / 1e6:.1f} MB)")
+    return sum(rows)
+
+def open_archive(archive_dir=DEFAULT_ARCHIVE_DIR):
+    """
+    The archive as an Arrow dataset, Energy_MeV and Thickness_um are partition columns.
+    """
+    # Weight is null for the rows of unweighted runs
+    schema = EVENT_SCHEMA.append(pa.field("Energy_MeV", pa.float64())).append(pa.field("Thickness_um", pa.float64()))
+    return ds.dataset(archive_dir, format="parquet", partitioning=PARTITIONING, schema=schema)
+
+def event_filter(particle_id=None, min_energy=None, max_energy=None, beam_energy=None,
+                 min_thickness=None, max_thickness=None):
+    """
+    Arrow filter expression from simple bounds (None means unbounded), energies in MeV and thicknesses in um.
+    The beam energy and thickness bounds select whole partitions.
+    """
+    conditions = []
+    if particle_id is not None:
+        conditions.append(ds.field("ParticleID") == pa.scalar(particle_id, pa.int8()))
+    if min_energy is not None:
+        conditions.append(ds.field("AbsEnergy") >= pa.scalar(min_energy, pa.float32()))
+    if max_energy is not None:
+        conditions.append(ds.field("AbsEnergy") < pa.scalar(max_energy, pa.float32()))
+    if beam_energy is not None:
+        conditions.append(ds.field("Energy_MeV") == beam_energy)
+    if min_thickness is not None:
+        conditions.append(ds.field("Thickness_um") >= min_thickness)
+    if max_thickness is not None:
+        conditions.append(ds.field("Thickness_um") <= max_thickness)
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+@profiling.profiled("archive.query")
+def query(archive_dir=DEFAULT_ARCHIVE_DIR, columns=None, filter=None, use_threads=True, **bounds):
+    """
+    Rows of the archive matching filter (an Arrow expression) or the event_filter bounds, as an Arrow table
+    with only the given columns. For example the photons above 1 MeV of every foil from 1 mm on:
+        query(archive, ["AbsEnergy", "Thickness_um"], particle_id=0, min_energy=1.0, min_thickness=1000)
+    """
+    if filter is None:
+        filter = event_filter(**bounds)
+    elif bounds:
+        raise ValueError("Pass either a filter expression or bounds, not both")
+    return open_archive(archive_dir).to_table(columns=columns, filter=filter, use_threads=use_threads)
+
+def count_by_configuration(table):
+    """
+    Number of rows and sum of weights per configuration of a query result that kept the partition columns.
+    """
+    if WEIGHT_BRANCH in table.column_names:
+        weights = pc.fill_null(table[WEIGHT_BRANCH], 1.0)
+    else:
+        weights = pa.array(np.ones(len(table), dtype=np.float32))
+    table = pa.table({"Energy_MeV": table["Energy_MeV"], "Thickness_um": table["Thickness_um"], "Weight": weights})
+    counts = table.group_by(["Energy_MeV", "Thickness_um"]).aggregate([("Weight", "count"), ("Weight", "sum")])
+    counts = pa.table({"Energy_MeV": counts["Energy_MeV"], "Thickness_um": counts["Thickness_um"],
+                       "Rows": counts["Weight_count"], "Weighted": counts["Weight_sum"]})
+    return counts.sort_by([("Thickness_um", "ascending"), ("Energy_MeV", "ascending")])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partitioned Parquet archive of the raw BremSim events.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("convert", help="Convert (new or changed) output files of a campaign directory")
+    p.add_argument("data_dir", nargs="?", default=".", help="Directory with the BremSim output files")
+    p.add_argument("--archive", default=DEFAULT_ARCHIVE_DIR, help="Archive directory")
+    p.add_argument("--level", type=int, default=3, help="zstd compression level")
+    p.add_argument("--workers", type=int, default=None, help="Conversion processes")
+
+    p = subparsers.add_parser("query", help="Select events and count them per configuration")
+    p.add_argument("--archive", default=DEFAULT_ARCHIVE_DIR, help="Archive directory")
+    p.add_argument("--particle", type=int, default=None, help="ParticleID (0 photons, 1 electrons, 2 positrons)")
+    p.add_argument("--min-energy", type=float, default=None, help="Lowest AbsEnergy (MeV)")
+    p.add_argument("--max-energy", type=float, default=None, help="AbsEnergy below this (MeV)")
+    p.add_argument("--beam-energy", type=float, default=None, help="Only this beam energy (MeV)")
+    p.add_argument("--min-thickness", type=float, default=None, help="Thinnest foil (um)")
+    p.add_argument("--max-thickness", type=float, default=None, help="Thickest foil (um)")
+    p.add_argument("--output", default=None, help="Also write the selected rows (.parquet or .csv)")
+
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert_campaign(args.data_dir, args.archive, args.level, max_workers=args.workers)
+    else:
+        start = time.perf_counter()
+        table = query(args.archive, ["AbsEnergy", "ParticleID", WEIGHT_BRANCH, "Energy_MeV", "Thickness_um"],
+                      particle_id=args.particle, min_energy=args.min_energy, max_energy=args.max_energy,
+                      beam_energy=args.beam_energy, min_thickness=args.min_thickness, max_thickness=args.max_thickness)
+        logging.info(f"Selected {len(table)} rows in {time.perf_counter() - start:.2f} s")
+        print(count_by_configuration(table).to_pandas().to_string(index=False))
+        if args.output:
+            if args.output.endswith(".csv"):
+                table.to_pandas().to_csv(args.output, index=False)
+            else:
+                pq.write_table(table, args.output, compression="zstd")
@@ -0,0 +1,160 @@
+import os
+import logging
+import argparse
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+# Layout of <output>_phsp.bin, written by BremSim with /BremSim/phaseSpace/record (see include/PhaseSpace.hh).
+# Energies in MeV, positions in mm, directions are unit vectors.
+HEADER_DTYPE = np.dtype([
+    ("magic", "S4"),
+    ("version", "<i4"),
+    ("record_size", "<i4"),
+    ("reserved", "<i4"),
+    ("primaries", "<i8"),
+])
+
+RECORD_DTYPE = np.dtype([
+    ("species", "<i4"),  # 0 gamma, 1 e-, 2 e+
+    ("energy", "<f4"),
+    ("x", "<f4"),
+    ("y", "<f4"),
+    ("z", "<f4"),
+    ("dx", "<f4"),
+    ("dy", "<f4"),
+    ("dz", "<f4"),
+    ("weight", "<f4"),
+])
+
+SPECIES_NAMES = {0: "gamma", 1: "e-", 2: "e+"}
+
+def read_header(file_path):
+    header = np.fromfile(file_path, dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header["magic"][0] != b"BSPS" or header["record_size"][0] != RECORD_DTYPE.itemsize:
+        raise ValueError(f"{file_path} is not a BremSim phase-space file")
+    return {name: header[name][0].item() for name in ("version", "primaries")}
+
+def open_phase_space(file_path):
+    """
+    Returns (header, records) with the records memory-mapped, nothing is read until it is used.
+    """
+    header = read_header(file_path)
+    n_records = (os.path.getsize(file_path) - HEADER_DTYPE.itemsize) // RECORD_DTYPE.itemsize
+    if n_records == 0:
+        return header, np.zeros(0, dtype=RECORD_DTYPE)
+    records = np.memmap(file_path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_DTYPE.itemsize, shape=(n_records,))
+    return header, records
+
+def iterate(file_path, chunk_size=1_000_000):
+    """
+    Yields the records in chunks of chunk_size, so files larger than memory can be streamed.
+    """
+    _, records = open_phase_space(file_path)
+    for start in range(0, len(records), chunk_size):
+        yield np.asarray(records[start:start + chunk_size])
+
+def write_phase_space(file_path, chunks, primaries):
+    """
+    Writes record chunks as a phase-space file that BremSim can replay (/BremSim/gun/phaseSpaceFile).
+    """
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = b"BSPS"
+    header["version"] = 1
+    header["record_size"] = RECORD_DTYPE.itemsize
+    header["primaries"] = primaries
+
+    n_records = 0
+    with open(file_path, "wb") as f:
+        header.tofile(f)
+        for chunk in chunks:
+            chunk.astype(RECORD_DTYPE, copy=False).tofile(f)
+            n_records += len(chunk)
+    return n_records
+
+def subsample(file_path, output_path, fraction, species=None, seed=42, chunk_size=1_000_000):
+    """
+    Keeps each record with probability `fraction` (optionally only the given species) and
+    scales the kept weights by 1/fraction, so weighted spectra per primary are unchanged on average.
+    """
+    header = read_header(file_path)
+    rng = np.random.default_rng(seed)
+
+    def chunks():
+        for chunk in iterate(file_path, chunk_size):
+            keep = rng.random(len(chunk)) < fraction
+            if species is not None:
+                keep &= np.isin(chunk["species"], species)
+            kept = chunk[keep].copy()
+            kept["weight"] /= fraction
+            yield kept
+
+    n_records = write_phase_space(output_path, chunks(), header["primaries"])
+    logging.info(f"Wrote {n_records} records to {output_path}")
+    return n_records
+
+def histogram(file_path, bins, species=(0, 1, 2), per_primary=True, chunk_size=1_000_000):
+    """
+    Streams the file into weighted energy histograms.
+    Returns {species: counts}, divided by the number of primaries of the recording if per_primary.
+    """
+    header = read_header(file_path)
+    counts = {s: np.zeros(len(bins) - 1) for s in species}
+
+    for chunk in iterate(file_path, chunk_size):
+        for s in species:
+            selected = chunk[chunk["species"] == s]
+            h, _ = np.histogram(selected["energy"], bins=bins, weights=selected["weight"])
+            counts[s] += h
+
+    if per_primary and header["primaries"] > 0:
+        counts = {s: c / header["primaries"] for s, c in counts.items()}
+    return counts
+
+def summary(file_path, chunk_size=1_000_000):
+    header, records = open_phase_space(file_path)
+    print(f"{file_path}: version {header['version']}, {header['primaries']} primaries, {len(records)} records")
+
+    totals = {s: [0, 0.0, 0.0] for s in SPECIES_NAMES}
+    for chunk in iterate(file_path, chunk_size):
+        for s in SPECIES_NAMES:
+            selected = chunk[chunk["species"] == s]
+            totals[s][0] += len(selected)
+            totals[s][1] += float(selected["weight"].sum())
+            totals[s][2] += float((selected["weight"] * selected["energy"]).sum())
+
+    print(f"{'species':<8}{'records':>12}{'weight':>14}{'mean E MeV':>12}")
+    for s, (n, w, we) in totals.items():
+        print(f"{SPECIES_NAMES[s]:<8}{n:>12}{w:>14.1f}{(we / w if w > 0 else 0.0):>12.4f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read, subsample and histogram BremSim phase-space files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    info_parser = subparsers.add_parser("info", help="Print the number of records and weights per species")
+    info_parser.add_argument("file", help="Phase-space file (<output>_phsp.bin)")
+
+    sub_parser = subparsers.add_parser("subsample", help="Write a smaller, reweighted phase-space file")
+    sub_parser.add_argument("file", help="Phase-space file to read")
+    sub_parser.add_argument("output", help="Phase-space file to write")
+    sub_parser.add_argument("--fraction", type=float, required=True, help="Fraction of the records to keep")
+    sub_parser.add_argument("--species", type=int, nargs="+", default=None, help="Only keep these species (0 gamma, 1 e-, 2 e+)")
+    sub_parser.add_argument("--seed", type=int, default=42)
+
+    hist_parser = subparsers.add_parser("histogram", help="Histogram the energies per species, per primary")
+    hist_parser.add_argument("file", help="Phase-space file to read")
+    hist_parser.add_argument("--bins", default=None, help="bin_edges.npy to use (default: 2000 uniform bins up to 5.05 MeV)")
+    hist_parser.add_argument("--output", default="phase_space_spectra.npz", help="Where to save the spectra")
+
+    args = parser.parse_args()
+
+    if args.command == "info":
+        summary(args.file)
+    elif args.command == "subsample":
+        subsample(args.file, args.output, args.fraction, species=args.species, seed=args.seed)
+    elif args.command == "histogram":
+        bins = np.load(args.bins) if args.bins else np.linspace(0, 5.05, 2001)
+        spectra = histogram(args.file, bins)
+        np.savez(args.output, bin_edges=bins, **{SPECIES_NAMES[s]: c for s, c in spectra.items()})
+        logging.info(f"Saved {args.output}")
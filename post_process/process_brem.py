@@ -5,6 +5,8 @@ import uproot
 import pandas as pd
 import matplotlib.pyplot as plt
 
+import profiling
+
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
@@ -45,6 +47,7 @@ def flatten_multiindex_columns(df: pd.DataFrame) -> pd.DataFrame:
 	return df
 
 
+@profiling.profiled("process_brem.read")
 def process_root(file_path: str) -> pd.DataFrame:
 	if not os.path.exists(file_path):
 		logging.error("ROOT file not found: %s", file_path)
@@ -116,8 +119,9 @@ if __name__ == "__main__":
 	csv_path = os.path.splitext(file_path)[0] + "_dataset.csv"
 	pkl_path = os.path.splitext(file_path)[0] + "_dataset.pkl"
 	try:
-		df.to_csv(csv_path, index=False)
-		df.to_pickle(pkl_path)
+		with profiling.stage("process_brem.save", items=len(df)):
+			df.to_csv(csv_path, index=False)
+			df.to_pickle(pkl_path)
 		logging.info("Saved dataset CSV to: %s", csv_path)
 		logging.info("Saved dataset PKL to: %s", pkl_path)
 	except Exception:
@@ -125,34 +129,38 @@ if __name__ == "__main__":
 
 	# Plotting
 	if "AbsEnergy" in df.columns:
-		plt.figure(figsize=(10, 6))
+		with profiling.stage("process_brem.plot", items=len(df)):
+			plt.figure(figsize=(10, 6))
 		
-		# Check if ParticleID exists
-		if "ParticleID" in df.columns:
-			# Photons (ParticleID == 0)
-			photons = df[df["ParticleID"] == 0]["AbsEnergy"]
-			# Electrons (ParticleID == 1)
-			electrons = df[df["ParticleID"] == 1]["AbsEnergy"]
+			# Check if ParticleID exists
+			if "ParticleID" in df.columns:
+				# Photons (ParticleID == 0)
+				photons = df[df["ParticleID"] == 0]["AbsEnergy"]
+				# Electrons (ParticleID == 1)
+				electrons = df[df["ParticleID"] == 1]["AbsEnergy"]
+				# Statistical weights of biased (bremsstrahlung splitting) runs
+				w_photons = df[df["ParticleID"] == 0]["Weight"] if "Weight" in df.columns else None
+				w_electrons = df[df["ParticleID"] == 1]["Weight"] if "Weight" in df.columns else None
 			
-			plt.hist(photons, bins=100, log=True, histtype='stepfilled', alpha=0.5, label='Photons', color='blue')
-			plt.hist(electrons, bins=100, log=True, histtype='stepfilled', alpha=0.5, label='Electrons', color='red')
-			plt.legend()
-		else:
-			# Fallback if no ParticleID
-			plt.hist(df["AbsEnergy"], bins=100, log=True, histtype='stepfilled', alpha=0.7, label='All Particles')
+				plt.hist(photons, bins=100, weights=w_photons, log=True, histtype='stepfilled', alpha=0.5, label='Photons', color='blue')
+				plt.hist(electrons, bins=100, weights=w_electrons, log=True, histtype='stepfilled', alpha=0.5, label='Electrons', color='red')
+				plt.legend()
+			else:
+				# Fallback if no ParticleID
+				plt.hist(df["AbsEnergy"], bins=100, weights=df["Weight"] if "Weight" in df.columns else None, log=True, histtype='stepfilled', alpha=0.7, label='All Particles')
 			
-		plt.title("Particle Energy Spectrum")
-		plt.xlabel("Energy (MeV)")
-		plt.ylabel("Counts")
-		plt.grid(True, which="both", ls="--", alpha=0.5)
+			plt.title("Particle Energy Spectrum")
+			plt.xlabel("Energy (MeV)")
+			plt.ylabel("Counts")
+			plt.grid(True, which="both", ls="--", alpha=0.5)
 		
-		plot_path = os.path.join(os.path.dirname(file_path), "particle_spectrum.png")
-		local_plot_path = os.path.join(os.path.dirname(__file__), "particle_spectrum.png")
+			plot_path = os.path.join(os.path.dirname(file_path), "particle_spectrum.png")
+			local_plot_path = os.path.join(os.path.dirname(__file__), "particle_spectrum.png")
 		
-		try:
-			plt.savefig(local_plot_path)
-			logging.info("Saved plot to: %s", local_plot_path)
-		except Exception:
-			logging.exception("Failed to save plot to: %s", local_plot_path)
+			try:
+				plt.savefig(local_plot_path)
+				logging.info("Saved plot to: %s", local_plot_path)
+			except Exception:
+				logging.exception("Failed to save plot to: %s", local_plot_path)
 	else:
 		logging.warning("'AbsEnergy' column not found in DataFrame. Skipping plot.")
\ No newline at end of file
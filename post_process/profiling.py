@@ -0,0 +1,231 @@
+# Stage-level profiling of the post-processing scripts.
+#
+#     with profiling.stage("combine.histogram", items=n_files) as s:
+#         ...
+#         s.add(n_rows)
+#
+#     @profiling.profiled("train.load_data")
+#     def load_data(...): ...
+#
+# Enabled by BREMSIM_PROFILE=<report.jsonl> (or `bremsim_post.py --profile <report.jsonl>`).
+# Every finished stage appends one JSON line with wall time, CPU time, peak traced (tracemalloc) and
+# peak resident (/proc) memory and its item count, so worker processes of a pool report into the same file.
+# When disabled, stage() returns a shared no-op object and the decorator calls the function directly.
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import functools
+import threading
+import tracemalloc
+
+ENV_VAR = "BREMSIM_PROFILE"
+
+_report_path = os.environ.get(ENV_VAR) or None
+_write_lock = threading.Lock()
+_local = threading.local()
+
+def enabled():
+    return _report_path is not None
+
+def enable(report_path):
+    """
+    Turns profiling on for this process and (through the environment) for the processes it starts.
+    """
+    global _report_path
+    _report_path = os.path.abspath(report_path)
+    os.environ[ENV_VAR] = _report_path
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def _peak_rss_mb():
+    """
+    Peak resident set size (VmHWM) of this process, None where /proc is not available.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def _reset_peaks():
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    try:
+        # "5" resets VmHWM to the current RSS (Linux >= 4.0)
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def _max(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+class _NullStage:
+    items = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, n=1):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+class Stage:
+    """
+    One timed stage. Nested stages record their parent; the peaks of a parent include its children.
+    """
+
+    def __init__(self, name, items=0):
+        self.name = name
+        self.items = items
+        self.peak_traced = None
+        self.peak_rss = None
+
+    def add(self, n=1):
+        self.items += n
+
+    def _absorb_peaks(self):
+        if tracemalloc.is_tracing():
+            self.peak_traced = _max(self.peak_traced, tracemalloc.get_traced_memory()[1] / 1e6)
+        self.peak_rss = _max(self.peak_rss, _peak_rss_mb())
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        # the peaks are reset for this stage, keep what the parent has seen so far
+        if stack:
+            stack[-1]._absorb_peaks()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+
+        _reset_peaks()
+        self._start = time.time()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        self._absorb_peaks()
+
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].peak_traced = _max(stack[-1].peak_traced, self.peak_traced)
+            stack[-1].peak_rss = _max(stack[-1].peak_rss, self.peak_rss)
+
+        record = {
+            "stage": self.name,
+            "parent": self.parent,
+            "pid": os.getpid(),
+            "start": round(self._start, 6),
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+            "items": self.items,
+            "peak_traced_mb": None if self.peak_traced is None else round(self.peak_traced, 3),
+            "peak_rss_mb": None if self.peak_rss is None else round(self.peak_rss, 3),
+            "failed": exc_type is not None,
+        }
+        with _write_lock, open(_report_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        return False
+
+def stage(name, items=0):
+    """
+    Context manager timing a stage; a no-op unless profiling is enabled.
+    """
+    if _report_path is None:
+        return _NULL_STAGE
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return Stage(name, items)
+
+def profiled(name=None):
+    """
+    Decorator running the whole function as one stage (named after the function by default).
+    """
+    def decorator(func):
+        stage_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _report_path is None:
+                return func(*args, **kwargs)
+            with stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# --- reports ---
+
+def load_report(report_path):
+    with open(report_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def summarize(records):
+    """
+    Aggregates the records per stage name (over calls and processes).
+    Returns rows sorted by total wall time.
+    """
+    stages = {}
+    for r in records:
+        s = stages.setdefault(r["stage"], {"stage": r["stage"], "calls": 0, "processes": set(), "wall_s": 0.0,
+                                           "cpu_s": 0.0, "items": 0, "peak_traced_mb": None, "peak_rss_mb": None})
+        s["calls"] += 1
+        s["processes"].add(r["pid"])
+        s["wall_s"] += r["wall_s"]
+        s["cpu_s"] += r["cpu_s"]
+        s["items"] += r["items"]
+        s["peak_traced_mb"] = _max(s["peak_traced_mb"], r["peak_traced_mb"])
+        s["peak_rss_mb"] = _max(s["peak_rss_mb"], r["peak_rss_mb"])
+
+    rows = []
+    for s in stages.values():
+        s["processes"] = len(s["processes"])
+        s["items_per_s"] = s["items"] / s["wall_s"] if s["items"] and s["wall_s"] > 0 else None
+        rows.append(s)
+    return sorted(rows, key=lambda s: s["wall_s"], reverse=True)
+
+SUMMARY_FIELDS = ["stage", "calls", "processes", "wall_s", "cpu_s", "items", "items_per_s", "peak_traced_mb", "peak_rss_mb"]
+
+def write_csv(rows, csv_path):
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def _fmt(value, width, spec):
+    return f"{'-':>{width}}" if value is None else f"{value:>{width}{spec}}"
+
+def print_summary(rows, out=sys.stdout):
+    print(f"{'stage':<36}{'calls':>6}{'wall s':>10}{'cpu s':>10}{'items':>12}{'items/s':>12}{'traced MB':>11}{'RSS MB':>10}", file=out)
+    for s in rows:
+        print(f"{s['stage']:<36}{s['calls']:>6}{s['wall_s']:>10.3f}{s['cpu_s']:>10.3f}{s['items']:>12}"
+              f"{_fmt(s['items_per_s'], 12, '.4g')}{_fmt(s['peak_traced_mb'], 11, '.1f')}{_fmt(s['peak_rss_mb'], 10, '.1f')}", file=out)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize a BremSim post-processing profile (BREMSIM_PROFILE report).")
+    parser.add_argument("report", help="Profile report (.jsonl)")
+    parser.add_argument("--csv", default=None, help="Also write the per-stage summary as CSV")
+    args = parser.parse_args()
+
+    rows = summarize(load_report(args.report))
+    print_summary(rows)
+    if args.csv:
+        write_csv(rows, args.csv)
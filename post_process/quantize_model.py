@@ -0,0 +1,170 @@
+# Reduced-precision CPU variants of the trained BremSpecNet.
+#
+#     python post_process/quantize_model.py export --model-dir post_process            # int8 and bf16
+#     python post_process/quantize_model.py report --model-dir post_process --data-dir post_process/non_trained
+#
+# export writes brem_spec_net_int8.pth (dynamic quantization: int8 weights of the linear layers,
+# activations quantized per batch) and brem_spec_net_bf16.pth next to brem_spec_net.pth. Both are
+# loaded by load_resources(model_dir, precision), so every entry point of evaluate_model.py
+# (and `bremsim_post.py evaluate --precision`) runs them unchanged.
+# report compares each variant with fp32 on held-out spectra, per configuration, and measures
+# the forward-pass latency and throughput at several batch sizes, and writes both tables to the model directory.
+import os
+import time
+import logging
+import argparse
+import statistics
+import numpy as np
+import pandas as pd
+import torch
+
+import profiling
+from evaluate_model import (MODEL_FILES, convert_precision, load_resources, build_features, predict_spectra,
+                            model_bin_edges, nominal_scales, spectrum_metrics)
+from worker_dataset import histogram_campaign
+from catalog import campaign_configurations
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# rows per forward pass (one row per bin and spectrum)
+DEFAULT_BATCH_SIZES = (1, 256, 4096, 65536, 1_000_000)
+
+@profiling.profiled("quantize.export")
+def export(model_dir, precisions=("int8", "bf16")):
+    """
+    Writes the reduced-precision variants of the fp32 model in model_dir. Returns their paths.
+    """
+    paths = []
+    for precision in precisions:
+        model, _ = load_resources(model_dir, "fp32")
+        variant = convert_precision(model, precision)
+        path = os.path.join(model_dir, MODEL_FILES[precision])
+        torch.save(variant.state_dict(), path)
+        logging.info(f"Saved {precision} model to {path} ({os.path.getsize(path) / 1e3:.0f} kB, "
+                     f"fp32: {os.path.getsize(os.path.join(model_dir, MODEL_FILES['fp32'])) / 1e3:.0f} kB)")
+        paths.append(path)
+    return paths
+
+def forward_latency(model, X, repeats):
+    """
+    Median wall time of one forward pass over the rows of X.
+    """
+    X_tensor = torch.tensor(X, dtype=model.input_dtype)
+    times = []
+    with torch.no_grad():
+        model(X_tensor)
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(X_tensor)
+            times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+@profiling.profiled("quantize.report")
+def report(model_dir, data_dir, precisions=("int8", "bf16"), batch_sizes=DEFAULT_BATCH_SIZES, repeats=10,
+           binning_path=None, output_dir=None):
+    """
+    Accuracy of every variant against fp32 on the configurations of data_dir, then latency and throughput.
+    Writes quantization_accuracy.csv and quantization_speed.csv to output_dir (default model_dir, so no
+    artifacts end up among the simulation output the catalog scans).
+    Returns (accuracy, speed) DataFrames.
+    """
+    models = {}
+    for precision in ("fp32",) + tuple(precisions):
+        models[precision], meta = load_resources(model_dir, precision)
+    bin_edges = model_bin_edges(meta, binning_path)
+
+    configs = campaign_configurations(data_dir)
+    if not configs:
+        raise FileNotFoundError(f"No files found in {data_dir}")
+    n = len(configs)
+    energies = np.array([c["energy_mev"] for c in configs])
+    thicknesses = np.array([c["thickness_um"] for c in configs])
+
+    logging.info(f"Histogramming {n} configurations...")
+    with profiling.stage("quantize.ground_truth", items=n):
+        truth = histogram_campaign({c["logical"]: c["files"] for c in configs}, bin_edges)
+    # on the event scale of the model
+    scales = nominal_scales(meta, configs)[:, np.newaxis]
+
+    with profiling.stage("quantize.predict", items=2 * n * len(models)):
+        predictions = {name: predict_spectra(model, meta, np.tile(energies, 2), np.tile(thicknesses, 2), np.repeat([0, 1], n))
+                       for name, model in models.items()}
+
+    rows = []
+    for pid, species in ((0, "photons"), (1, "electrons")):
+        gt = np.array([truth[c["logical"]][pid] for c in configs]) * scales
+        reference = predictions["fp32"][pid * n:(pid + 1) * n]
+        reference_metrics = spectrum_metrics(gt, reference, bin_edges)
+        for name in precisions:
+            pred = predictions[name][pid * n:(pid + 1) * n]
+            metrics = spectrum_metrics(gt, pred, bin_edges)
+            # deviation from the fp32 prediction itself, relative to its peak
+            deviation = np.abs(pred - reference).max(axis=1) / np.maximum(reference.max(axis=1), 1e-12)
+            for i, c in enumerate(configs):
+                rows.append({"precision": name, "species": species, "file": os.path.basename(c["logical"]),
+                             "Energy_MeV": c["energy_mev"], "Thickness_um": c["thickness_um"],
+                             "max_dev_vs_fp32": deviation[i],
+                             **{f"{k}_delta": metrics[k][i] - reference_metrics[k][i] for k in metrics},
+                             **{k: metrics[k][i] for k in metrics}})
+    accuracy = pd.DataFrame(rows)
+
+    # latency on the real feature rows, repeated up to the largest batch
+    X = build_features(meta, energies, thicknesses, np.zeros(n))
+    X = np.resize(X, (max(batch_sizes), X.shape[1])).astype(np.float32)
+    speed_rows = []
+    with profiling.stage("quantize.latency", items=len(batch_sizes) * len(models)):
+        for batch_size in batch_sizes:
+            for name, model in models.items():
+                latency = forward_latency(model, X[:batch_size], repeats if batch_size < 100_000 else max(repeats // 5, 1))
+                speed_rows.append({"precision": name, "batch_size": batch_size, "latency_ms": latency * 1e3,
+                                   "rows_per_s": batch_size / latency})
+    speed = pd.DataFrame(speed_rows)
+    fp32_latency = speed[speed["precision"] == "fp32"].set_index("batch_size")["latency_ms"]
+    speed["speedup"] = fp32_latency.loc[speed["batch_size"]].values / speed["latency_ms"].values
+
+    print(f"{n} held-out configurations, {len(bin_edges) - 1} bins, {torch.get_num_threads()} threads, "
+          f"quantized engine {torch.backends.quantized.engine}")
+    print(f"{'':<6}{'species':>10}{'max dev':>10}{'d chi2/ndf':>12}{'d rel err':>11}{'d integral':>12}")
+    for (name, species), group in accuracy.groupby(["precision", "species"], sort=False):
+        print(f"{name:<6}{species:>10}{group['max_dev_vs_fp32'].max():>10.2e}{group['chi2_ndf_delta'].median():>12.3g}"
+              f"{group['rel_error_delta'].median():>11.2e}{group['integral_error_delta'].median():>12.2e}")
+    print("(max dev: worst configuration, deltas: medians against fp32)")
+    print(f"{'batch':>9}" + "".join(f"{name + ' ms':>12}{'x':>7}" for name in models))
+    for batch_size, group in speed.groupby("batch_size"):
+        group = group.set_index("precision")
+        print(f"{batch_size:>9}" + "".join(f"{group.at[name, 'latency_ms']:>12.3f}{group.at[name, 'speedup']:>7.2f}"
+                                         for name in models))
+
+    output_dir = output_dir or model_dir
+    accuracy.to_csv(os.path.join(output_dir, "quantization_accuracy.csv"), index=False)
+    speed.to_csv(os.path.join(output_dir, "quantization_speed.csv"), index=False)
+    logging.info(f"Saved quantization_accuracy.csv and quantization_speed.csv to {output_dir}")
+    return accuracy, speed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reduced-precision (int8, bf16) CPU variants of BremSpecNet.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("export", help="Write the int8 and bf16 variants next to the fp32 model")
+    p.add_argument("--model-dir", default=SCRIPT_DIR, help="Directory with brem_spec_net.pth and model_metadata.pkl")
+    p.add_argument("--precision", choices=["int8", "bf16"], action="append", default=None, help="Only this variant (repeatable)")
+
+    p = subparsers.add_parser("report", help="Accuracy and speed of the variants against fp32")
+    p.add_argument("--model-dir", default=SCRIPT_DIR, help="Directory with the exported models")
+    p.add_argument("--data-dir", default=os.path.join(SCRIPT_DIR, "non_trained"), help="Held-out output files")
+    p.add_argument("--precision", choices=["int8", "bf16"], action="append", default=None, help="Only this variant (repeatable)")
+    p.add_argument("--batch-sizes", type=int, nargs="+", default=list(DEFAULT_BATCH_SIZES), help="Rows per forward pass")
+    p.add_argument("--repeats", type=int, default=10, help="Runs per latency measurement")
+    p.add_argument("--binning", default=None, help="Binning artifact the model must have been trained with")
+    p.add_argument("--output-dir", default=None, help="Where to write the CSV files (default: the model directory)")
+
+    args = parser.parse_args()
+    precisions = tuple(args.precision or ("int8", "bf16"))
+
+    if args.command == "export":
+        export(args.model_dir, precisions)
+    else:
+        report(args.model_dir, args.data_dir, precisions, args.batch_sizes, args.repeats, args.binning, args.output_dir)
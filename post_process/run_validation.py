@@ -5,6 +5,8 @@ import re
 import csv
 import sys
 
+from bench_threads import load_thread_config
+
 def run_simulation(exe_path, macro_path, output_dir):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -20,9 +22,17 @@ def run_simulation(exe_path, macro_path, output_dir):
     
     start_time_global = time.time()
     
+    # Thread count measured by bench_threads.py on this node, all cores otherwise
+    thread_config = load_thread_config()
+    if thread_config is not None:
+        threads = thread_config["threads"]
+        print(f"Threads: {threads} (from thread_config.json, measured {thread_config['measured']} on {thread_config['host']})")
+    else:
+        threads = os.cpu_count()
+        print(f"Threads: {threads} (no thread_config.json, run bench_threads.py to tune)")
+
     # Run Command
-    # Note: Geant4 args might be positional.
-    cmd = [exe_path, macro_path, "-t", "48"]
+    cmd = [exe_path, "-m", macro_path, "-t", str(threads)]
     
     process = subprocess.Popen(
         cmd,
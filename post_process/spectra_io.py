@@ -0,0 +1,183 @@
+import os
+import logging
+import argparse
+import uproot
+import pandas as pd
+import numpy as np
+
+import profiling
+from catalog import campaign_configurations
+from binning import Binning
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+# H1 names written by BremSim in histogram scoring mode (/BremSim/output/scoringMode histogram).
+# They match the spectrum columns of combined_spectra_table.pkl.
+HISTOGRAM_NAMES = {
+    0: "Photon_Spectrum",
+    1: "Electron_Spectrum",
+    2: "Positron_Spectrum"
+}
+
+def is_histogram_file(file_path):
+    """
+    Returns True if the ROOT file was written in histogram scoring mode.
+    """
+    with uproot.open(file_path) as file:
+        return HISTOGRAM_NAMES[0] in file
+
+def read_histogram_spectra(file_path):
+    """
+    Reads the per-species energy histograms of a histogram-mode output file.
+    Returns (bin_edges, spectra) where spectra maps the histogram name to its counts,
+    or (None, None) if the file holds no histograms.
+    """
+    spectra = {}
+    bin_edges = None
+
+    with uproot.open(file_path) as file:
+        for name in HISTOGRAM_NAMES.values():
+            if name not in file:
+                continue
+            counts, edges = file[name].to_numpy()
+            if bin_edges is None:
+                bin_edges = edges
+            elif not np.allclose(edges, bin_edges):
+                raise ValueError(f"Inconsistent binning between histograms in {file_path}")
+            spectra[name] = counts
+
+    if bin_edges is None:
+        return None, None
+    return bin_edges, spectra
+
+def read_histogram_variances(file_path):
+    """
+    Returns the per-bin variances (sum of squared weights) of the species histograms.
+    Equal to the counts for unbiased runs, smaller per entry for bremsstrahlung splitting.
+    """
+    variances = {}
+    with uproot.open(file_path) as file:
+        for name in HISTOGRAM_NAMES.values():
+            if name in file:
+                variances[name] = file[name].variances()
+    return variances
+
+# /run/beamOn of the campaign macros. Runs stopped early by the convergence check are rescaled to it,
+# the networks and the grid emulator are trained on this scale and record it as "nominal_events".
+NOMINAL_EVENTS = 1000000
+
+def nominal_event_scale(n_events, nominal_events=NOMINAL_EVENTS):
+    """
+    Factor bringing the spectrum of a run of n_events primaries to nominal_events.
+    1 when the event count is unknown (files written before it was recorded).
+    """
+    if n_events is None or pd.isna(n_events) or n_events <= 0:
+        return 1.0
+    return nominal_events / n_events
+
+def per_nominal_events(df, nominal_events=NOMINAL_EVENTS):
+    """
+    Rescales the spectra of runs that stopped early to nominal_events primaries,
+    so every row of a combined table is on the same scale. Rows without N_Events are left as they are.
+    """
+    df = df.copy()
+    if "N_Events" not in df:
+        return df
+    for i, n_events in df["N_Events"].items():
+        scale = nominal_event_scale(n_events, nominal_events)
+        if scale == 1.0:
+            continue
+        for column in ("Photon_Spectrum", "Electron_Spectrum"):
+            df.at[i, column] = df.at[i, column] * scale
+        for column in ("Total_Photons", "Total_Electrons"):
+            df.at[i, column] = df.at[i, column] * scale
+    return df
+
+@profiling.profiled("combine_histograms")
+def combine_histograms(data_dir=".", output_pkl="combined_spectra_table.pkl"):
+    """
+    Builds the combined spectra table from histogram-mode output files.
+    Same layout as combine_datasets.combine_data, but no raw events are read:
+    the binning is the one BremSim was run with.
+    """
+    # histograms are always merged into the master file, even when ntuples are written per thread
+    configs = campaign_configurations(data_dir, require_events=False, require_histograms=True)
+    logging.info(f"Processing {len(configs)} histogram files...")
+
+    data_rows = []
+    bins = None
+
+    for config in configs:
+        f = config["logical"]
+        energy, thickness = config["energy_mev"], config["thickness_um"]
+
+        try:
+            edges, spectra = read_histogram_spectra(f)
+        except Exception as e:
+            logging.warning(f"Error processing {f}: {e}")
+            continue
+
+        if edges is None:
+            logging.warning(f"No histograms in {f} (was it written in ntuple mode?)")
+            continue
+
+        if bins is None:
+            bins = edges
+        elif len(edges) != len(bins) or not np.allclose(edges, bins):
+            logging.warning(f"Skipping {f}: binning differs from the rest of the campaign")
+            continue
+
+        photons = spectra.get("Photon_Spectrum", np.zeros(len(bins) - 1))
+        electrons = spectra.get("Electron_Spectrum", np.zeros(len(bins) - 1))
+        n_events = config["n_events"]
+
+        data_rows.append({
+            "Energy_MeV": energy,
+            "Thickness_um": thickness,
+            "N_Events": np.nan if n_events is None else n_events,
+            "Total_Photons": photons.sum(),
+            "Total_Electrons": electrons.sum(),
+            "Photon_Spectrum": photons,
+            "Electron_Spectrum": electrons
+        })
+
+    if not data_rows:
+        logging.error(f"No histogram files found in {data_dir}")
+        return None
+
+    df_final = pd.DataFrame(data_rows)
+    df_final = df_final.sort_values(by=["Thickness_um", "Energy_MeV"]).reset_index(drop=True)
+
+    binning = Binning(bins, "bremsim_histogram", source={"data_dir": os.path.abspath(data_dir)})
+    df_final.attrs["binning_sha256"] = binning.hash
+    df_final.to_pickle(output_pkl)
+    logging.info(f"Saved combined data table to {os.path.abspath(output_pkl)}")
+
+    edges_path = os.path.join(os.path.dirname(output_pkl), "bin_edges.npy")
+    np.save(edges_path, bins)
+    logging.info(f"Saved {edges_path}")
+    binning.save(os.path.join(os.path.dirname(output_pkl), "binning.json"))
+
+    return df_final
+
+def export_bin_edges(npy_path, txt_path):
+    """
+    Writes bin edges (MeV) as text, one per line, for /BremSim/output/binEdgesFile.
+    """
+    bins = np.load(npy_path)
+    np.savetxt(txt_path, bins, fmt="%.10g", header="BremSim bin edges (MeV)")
+    logging.info(f"Wrote {len(bins)} bin edges to {txt_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read BremSim histogram-mode output files.")
+    parser.add_argument("data_dir", nargs="?", default=".", help="Directory containing histogram-mode ROOT files")
+    parser.add_argument("--output", default="combined_spectra_table.pkl", help="Combined table to write")
+    parser.add_argument("--export-edges", metavar="NPY", default=None,
+                        help="Convert a bin_edges.npy file to bin_edges.txt for the BremSim macro instead")
+    args = parser.parse_args()
+
+    if args.export_edges:
+        export_bin_edges(args.export_edges, os.path.splitext(args.export_edges)[0] + ".txt")
+    else:
+        combine_histograms(args.data_dir, args.output)
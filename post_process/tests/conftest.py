@@ -0,0 +1,5 @@
+# The post_process scripts import each other by module name, as when they are run from that directory.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
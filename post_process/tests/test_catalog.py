@@ -0,0 +1,51 @@
+# Catalog selection of per-thread output (/BremSim/output/mergeNtuples false).
+import os
+
+import numpy as np
+import pytest
+
+uproot = pytest.importorskip("uproot")
+
+from catalog import campaign_configurations
+
+EDGES = np.linspace(0, 5.05, 11)
+
+def write_master(path, n_events):
+    with uproot.recreate(path) as f:
+        f["Photon_Spectrum"] = (np.ones(len(EDGES) - 1), EDGES)
+        f["Event_Count"] = (np.array([float(n_events)]), np.array([0.0, 1.0]))
+
+def write_events(path, n_rows, seed):
+    rng = np.random.default_rng(seed)
+    with uproot.recreate(path) as f:
+        f["Absolute Energies"] = {"AbsEnergy": rng.uniform(0, 5, n_rows), "ParticleID": rng.integers(0, 2, n_rows).astype(np.int32)}
+
+@pytest.fixture
+def campaign(tmp_path):
+    # 5 MeV on 1 mm written per thread: the master holds histograms only
+    write_master(tmp_path / "output_E_5.0MeV_T_1mm.root", 2000)
+    for thread in range(2):
+        write_events(tmp_path / f"output_E_5.0MeV_T_1mm_t{thread}.root", 1000, thread)
+    # 5 MeV on 50 um merged
+    write_events(tmp_path / "output_E_5.0MeV_T_50um.root", 500, 2)
+    return str(tmp_path)
+
+def test_exact_pattern_selects_worker_files(campaign):
+    [config] = campaign_configurations(campaign, "output_E_5.0MeV_T_1mm.root")
+    assert os.path.basename(config["logical"]) == "output_E_5.0MeV_T_1mm.root"
+    assert [os.path.basename(f) for f in config["files"]] == ["output_E_5.0MeV_T_1mm_t0.root", "output_E_5.0MeV_T_1mm_t1.root"]
+    assert config["entries"] == 2000 and config["n_events"] == 2000
+
+def test_worker_pattern_selects_the_whole_configuration(campaign):
+    [config] = campaign_configurations(campaign, "output_E_5.0MeV_T_1mm_t1.root")
+    assert len(config["files"]) == 2 and config["n_events"] == 2000
+
+def test_wildcard_pattern(campaign):
+    configs = campaign_configurations(campaign, "output_E_5.0MeV_*.root")
+    assert [c["thickness_um"] for c in configs] == [50.0, 1000.0]
+
+def test_reference_bin_width_uses_only_the_reference(campaign):
+    from combine_datasets import campaign_bin_width
+    width, used = campaign_bin_width(campaign, ["output_E_5.0MeV_T_1mm.root", "output_E_5.0MeV_*.root"])
+    assert [os.path.basename(f) for f in used] == ["output_E_5.0MeV_T_1mm.root"]
+    assert width > 0
@@ -0,0 +1,109 @@
+# Work queue tests, with fake_bremsim.py standing in for the BremSim executable.
+import os
+import sys
+import time
+import subprocess
+
+import pytest
+
+import work_queue
+from work_queue import WorkQueue, run_job, work
+
+POST_PROCESS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_BREMSIM = os.path.join(POST_PROCESS_DIR, "fake_bremsim.py")
+
+def fake_exe(seconds_per_mevent=0.0, fail_rate=0.0):
+    return f'"{sys.executable}" "{FAKE_BREMSIM}" --seconds-per-mevent {seconds_per_mevent} --fail-rate {fail_rate}'
+
+@pytest.fixture
+def queue(tmp_path):
+    q = WorkQueue(str(tmp_path / "queue.sqlite"))
+    yield q
+    q.close()
+
+def test_claim_takes_each_job_once(queue):
+    assert queue.add([0.1, 0.2], [25.0], events=1000) == 2
+    # already queued configurations are not added again
+    assert queue.add([0.1], [25.0], events=1000) == 0
+
+    first = queue.claim("host-a")
+    second = queue.claim("host-b")
+    assert {first["output"], second["output"]} == {"output_E_0.1MeV_T_25um.root", "output_E_0.2MeV_T_25um.root"}
+    assert first["attempts"] == second["attempts"] == 1
+    assert queue.claim("host-c") is None
+    assert queue.counts() == {"running": 2}
+
+def test_expired_lease_is_reclaimed(queue):
+    queue.add([0.1], [25.0], events=1000)
+    stale = queue.claim("host-a", lease_s=0.05)
+    assert queue.claim("host-b") is None
+    time.sleep(0.1)
+
+    job = queue.claim("host-b")
+    assert job["id"] == stale["id"] and job["attempts"] == 2 and job["token"] != stale["token"]
+    # the first worker can neither renew nor record its result any more
+    assert not queue.renew(stale)
+    assert queue.finish(stale, 0) is None
+    assert queue.finish(job, 0) == "done"
+
+    outcomes = [tuple(r) for r in queue.connection.execute("SELECT host, outcome FROM attempts ORDER BY started")]
+    assert outcomes == [("host-a", "expired"), ("host-b", "done")]
+
+def test_retry_limit(tmp_path, queue):
+    queue.add([0.1], [25.0], events=1000, max_attempts=2)
+    work(queue.db_path, fake_exe(fail_rate=1.0), str(tmp_path / "out"), threads=1)
+
+    [job] = queue.jobs()
+    assert job["status"] == "failed" and job["attempts"] == 2
+    assert job["message"].startswith("exit code 1")
+
+    assert queue.retry_failed() == 1
+    work(queue.db_path, fake_exe(), str(tmp_path / "out"), threads=1)
+    assert queue.counts() == {"done": 1}
+
+def test_expired_last_attempt_fails(queue):
+    queue.add([0.1], [25.0], events=1000, max_attempts=1)
+    queue.claim("host-a", lease_s=0.05)
+    time.sleep(0.1)
+    assert queue.claim("host-b") is None
+    assert queue.jobs()[0]["status"] == "failed"
+
+def test_lost_lease_stops_bremsim(tmp_path, queue, monkeypatch):
+    monkeypatch.setattr(work_queue, "POLL_CHILD_S", 0.05)
+    queue.add([0.1], [25.0], events=1000000)
+    job = queue.claim("host-a", lease_s=0.3)
+    # another worker takes the job over, the next renewal fails
+    queue.connection.execute("UPDATE jobs SET token = 'other' WHERE id = ?", (job["id"],))
+
+    start = time.time()
+    assert run_job(queue, job, fake_exe(seconds_per_mevent=60), str(tmp_path), 1, lease_s=0.3) is None
+    assert time.time() - start < 10
+    assert not os.path.exists(tmp_path / job["output"])
+    [outcome] = queue.connection.execute("SELECT outcome FROM attempts").fetchone()
+    assert outcome == "expired"
+
+@pytest.mark.parametrize("config_host, expected", [("this-host", 3), ("other-host", os.cpu_count())])
+def test_thread_config_of_this_host_only(tmp_path, queue, monkeypatch, config_host, expected):
+    monkeypatch.setattr(work_queue.socket, "gethostname", lambda: "this-host")
+    monkeypatch.setattr(work_queue, "load_thread_config", lambda: {"host": config_host, "threads": 3})
+    used = []
+    monkeypatch.setattr(work_queue, "run_job", lambda queue, job, exe, output_dir, threads, lease_s: used.append(threads))
+    queue.add([0.1], [25.0], events=1000)
+    work(queue.db_path, fake_exe(), str(tmp_path / "out"), max_jobs=1)
+    assert used == [expected]
+
+def test_concurrent_workers(tmp_path, queue):
+    energies = [round(0.1 * i, 1) for i in range(1, 9)]
+    queue.add(energies, [25.0, 1000.0], events=10000)
+    output_dir = tmp_path / "out"
+
+    workers = [subprocess.Popen([sys.executable, os.path.join(POST_PROCESS_DIR, "work_queue.py"), "work", queue.db_path,
+                                 "--exe", fake_exe(seconds_per_mevent=2), "--output-dir", str(output_dir), "--threads", "1"],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for _ in range(4)]
+    assert all(w.wait(120) == 0 for w in workers)
+
+    assert queue.counts() == {"done": 16}
+    # every job ran exactly once, no job was claimed by two workers
+    rows = queue.connection.execute("SELECT job_id, COUNT(*) FROM attempts GROUP BY job_id").fetchall()
+    assert len(rows) == 16 and all(n == 1 for _, n in rows)
+    assert all(os.path.exists(output_dir / j["output"]) for j in queue.jobs())
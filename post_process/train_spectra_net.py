@@ -9,22 +9,35 @@ from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler, MinMaxScaler
 import os
 
+import profiling
+from spectra_io import per_nominal_events, NOMINAL_EVENTS
+from binning import Binning
+
 # Set device
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 print(f"Using device: {device}")
 
+@profiling.profiled("train.load_data")
 def load_data(pickle_path, bin_edges_path):
     print(f"Loading data from {pickle_path}...")
     with open(pickle_path, 'rb') as f:
         data = pickle.load(f)
+
+    # counts of early-stopped runs on the scale of full runs
+    data = per_nominal_events(data, NOMINAL_EVENTS)
         
+    # binning artifact (binning.json) or legacy bin_edges.npy, checked against the table
     print(f"Loading bin edges from {bin_edges_path}...")
-    bin_edges = np.load(bin_edges_path)
+    binning = Binning.load(bin_edges_path, expected_hash=data.attrs.get("binning_sha256"))
+    binning.check_spectra(data['Photon_Spectrum'], "Photon spectra")
+    print(f"Binning: {binning.scheme}, {binning.n_bins} bins ({binning.hash[:12]})")
+
     # Calculate bin centers
-    bin_centers = (bin_edges[:-1] + bin_edges[1:]) / 2
+    bin_centers = binning.centers
     
-    return data, bin_centers
+    return data, bin_centers, binning
 
+@profiling.profiled("train.features")
 def prepare_pointwise_data(data, bin_centers):
     """
     Explodes the dataset so each bin becomes a sample.
@@ -120,8 +133,9 @@ class BremSpecNet(nn.Module):
     def forward(self, x):
         return self.net(x)
 
-def train_model(pickle_path, bin_edges_path):
-    data, bin_centers = load_data(pickle_path, bin_edges_path)
+@profiling.profiled("train")
+def train_model(pickle_path, bin_edges_path, output_dir="."):
+    data, bin_centers, binning = load_data(pickle_path, bin_edges_path)
     X, y, num_points = prepare_pointwise_data(data, bin_centers)
     
     # Filter out zero-value bins to reduce noise? 
@@ -133,21 +147,22 @@ def train_model(pickle_path, bin_edges_path):
     # Thickness: 5 - 2000 (Huge range!) -> Log scale might be better for thickness
     # Bin E: 0 - 5.0
     
-    # Let's log-transform Thickness for the scaler
-    X[:, 1] = np.log10(X[:, 1] + 1e-6) # Log thickness
+    with profiling.stage("train.scalers", items=len(X)):
+        # Let's log-transform Thickness for the scaler
+        X[:, 1] = np.log10(X[:, 1] + 1e-6) # Log thickness
     
-    scaler_X = StandardScaler()
-    X_scaled = scaler_X.fit_transform(X)
+        scaler_X = StandardScaler()
+        X_scaled = scaler_X.fit_transform(X)
     
-    # Normalize Targets
-    # Spectra counts vary by orders of magnitude (0 to 100,000)
-    # Log-transforming targets is CRITICAL for spectra
-    # We add +1 to handle zeros safely
-    y_log = np.log1p(y)
+        # Normalize Targets
+        # Spectra counts vary by orders of magnitude (0 to 100,000)
+        # Log-transforming targets is CRITICAL for spectra
+        # We add +1 to handle zeros safely
+        y_log = np.log1p(y)
     
-    # We can further scale the log-values to approx [0,1] or standardization
-    scaler_y = MinMaxScaler()
-    y_scaled = scaler_y.fit_transform(y_log.reshape(-1, 1))
+        # We can further scale the log-values to approx [0,1] or standardization
+        scaler_y = MinMaxScaler()
+        y_scaled = scaler_y.fit_transform(y_log.reshape(-1, 1))
     
     print(f"Input Features (post-scaling) mean: {np.mean(X_scaled, axis=0)}")
     print(f"Target (post-scaling) max: {np.max(y_scaled)}")
@@ -181,38 +196,39 @@ def train_model(pickle_path, bin_edges_path):
     val_losses = []
     
     print(f"Starting training on {train_points} samples...")
-    for epoch in range(epochs):
-        model.train()
-        epoch_loss = 0
+    with profiling.stage("train.optimizer", items=epochs * train_points):
+        for epoch in range(epochs):
+            model.train()
+            epoch_loss = 0
         
-        # Shuffle indices
-        indices = torch.randperm(train_points)
+            # Shuffle indices
+            indices = torch.randperm(train_points)
         
-        for i in range(num_batches):
-            idx = indices[i*batch_size : (i+1)*batch_size]
-            batch_X = X_train_tensor[idx]
-            batch_y = y_train_tensor[idx]
+            for i in range(num_batches):
+                idx = indices[i*batch_size : (i+1)*batch_size]
+                batch_X = X_train_tensor[idx]
+                batch_y = y_train_tensor[idx]
             
-            optimizer.zero_grad()
-            outputs = model(batch_X)
-            loss = criterion(outputs, batch_y)
-            loss.backward()
-            optimizer.step()
+                optimizer.zero_grad()
+                outputs = model(batch_X)
+                loss = criterion(outputs, batch_y)
+                loss.backward()
+                optimizer.step()
             
-            epoch_loss += loss.item()
+                epoch_loss += loss.item()
         
-        avg_train_loss = epoch_loss / num_batches
+            avg_train_loss = epoch_loss / num_batches
         
-        # Validation
-        model.eval()
-        with torch.no_grad():
-            val_outputs = model(X_test_tensor)
-            val_loss = criterion(val_outputs, y_test_tensor)
+            # Validation
+            model.eval()
+            with torch.no_grad():
+                val_outputs = model(X_test_tensor)
+                val_loss = criterion(val_outputs, y_test_tensor)
         
-        train_losses.append(avg_train_loss)
-        val_losses.append(val_loss.item())
+            train_losses.append(avg_train_loss)
+            val_losses.append(val_loss.item())
         
-        print(f'Epoch [{epoch+1}/{epochs}], Train Loss: {avg_train_loss:.6f}, Val Loss: {val_loss.item():.6f}')
+            print(f'Epoch [{epoch+1}/{epochs}], Train Loss: {avg_train_loss:.6f}, Val Loss: {val_loss.item():.6f}')
             
     # Plotting results
     plt.figure(figsize=(10, 5))
@@ -223,20 +239,27 @@ def train_model(pickle_path, bin_edges_path):
     plt.ylabel('MSE Loss')
     plt.legend()
     plt.grid(True)
-    plt.savefig('training_loss.png')
+    plt.savefig(os.path.join(output_dir, 'training_loss.png'))
     print("Saved training_loss.png")
     
-    # Save Model
-    torch.save(model.state_dict(), 'brem_spec_net.pth')
-    
-    # Save Scalers for inference
-    with open('model_metadata.pkl', 'wb') as f:
-        pickle.dump({
-            'scaler_X': scaler_X,
-            'scaler_y': scaler_y,
-            'bin_centers': bin_centers
-        }, f)
-    print("Saved model and metadata.")
+    with profiling.stage("train.save"):
+        # Save Model
+        torch.save(model.state_dict(), os.path.join(output_dir, 'brem_spec_net.pth'))
+    
+        # Save Scalers for inference
+        with open(os.path.join(output_dir, 'model_metadata.pkl'), 'wb') as f:
+            pickle.dump({
+                'scaler_X': scaler_X,
+                'scaler_y': scaler_y,
+                'bin_centers': bin_centers,
+                # exact edges, so evaluation never has to rebuild them from the centers
+                'bin_edges': binning.edges,
+                'binning_sha256': binning.hash,
+                'binning_scheme': binning.scheme,
+                # event count the predicted spectra are normalised to
+                'nominal_events': NOMINAL_EVENTS
+            }, f)
+        print("Saved model and metadata.")
 
 if __name__ == "__main__":
     base_dir = "C:\\Geant4_Projects\\BremSim\\post_process"
@@ -0,0 +1,227 @@
+# Post-processing that runs alongside the simulation campaign.
+#
+#     python post_process/watch_outputs.py <data_dir> --binning binning.json --until-idle 600
+#
+# The campaign directory is polled through its catalog (catalog.py). A configuration is taken once
+# BremSim has closed all of its files. In MT the master opens <name>.root at the start of the run, so
+# its presence alone says nothing; the end of the run is recognised by the performance counters
+# (/BremSim/perf/enable): the master writes <name>_perf.json after it has closed the output, so a perf
+# file newer than every file of the configuration marks it complete. Without one, every file must
+# open cleanly and none may have changed size or modification time for --settle seconds. The settle
+# time matters because ROOT autosaves trees, so a file that is still being written can already open
+# with part of its entries.
+# Ready configurations are histogrammed file by file in a background process pool at the fine
+# resolution of the master store (master_spectra.py) and appended to it. With --binning the combined
+# spectra table is rewritten after every batch, with --plots the per-configuration plots of analyze_campaign.py
+# are made in the same pool.
+# The master store is the only state: it is replaced atomically, and after a restart the configurations
+# it already holds are skipped and the others are picked up again.
+import os
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+
+import profiling
+from catalog import open_catalog
+from worker_dataset import _histogram_file, sum_file_histograms
+from master_spectra import MasterSpectra, save_table, SPECIES, DEFAULT_MASTER_PATH, DEFAULT_FINE_WIDTH
+from binning import Binning, MAX_ENERGY
+from aggregate_perf import PERF_SUFFIX
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+DEFAULT_POLL_S = 10.0
+DEFAULT_SETTLE_S = 30.0
+
+def run_finished(logical, files):
+    """
+    True if the perf file of the configuration, which the master writes after closing the output,
+    is newer than all of its files.
+    """
+    perf_path = os.path.splitext(logical)[0] + PERF_SUFFIX
+    return os.path.exists(perf_path) and os.path.getmtime(perf_path) >= max(r["mtime"] for r in files)
+
+def ready_configurations(catalog, data_dir, settle_s, now=None):
+    """
+    The configurations of the (updated) catalog whose files BremSim has closed, see the top of the file.
+    """
+    now = time.time() if now is None else now
+    rows = {}
+    for row in catalog.files(data_dir):
+        rows.setdefault(row["logical"], []).append(row)
+
+    closed = set()
+    for logical, files in rows.items():
+        if not any(r["path"] == logical for r in files):
+            continue
+        if any(r["error"] for r in files):
+            continue
+        if not run_finished(logical, files) and any(now - r["mtime"] < settle_s for r in files):
+            continue
+        closed.add(logical)
+
+    return [c for c in catalog.configurations(data_dir) if c["logical"] in closed]
+
+class OutputWatcher:
+    """
+    Polls a campaign directory and appends every closed configuration to the master store.
+    """
+
+    def __init__(self, data_dir, master_path=DEFAULT_MASTER_PATH, binning=None, output_dir=".", plots=False,
+                 settle_s=DEFAULT_SETTLE_S, fine_width=DEFAULT_FINE_WIDTH, max_workers=None):
+        self.data_dir = data_dir
+        self.master_path = master_path
+        self.binning = binning
+        self.output_dir = output_dir
+        self.plots = plots
+        self.settle_s = settle_s
+
+        if os.path.exists(master_path):
+            self.master = MasterSpectra.load(master_path)
+            logging.info(f"Resuming with {len(self.master)} configurations from {master_path}")
+        else:
+            self.master = MasterSpectra(np.arange(0, MAX_ENERGY + fine_width, fine_width))
+
+        self.max_workers = max_workers
+        self.pool = None
+        # logical path -> {"config", "futures", "signature"} of the configurations being histogrammed
+        self.pending = {}
+        # configurations that were skipped or failed, retried only when one of their files changes
+        self.skipped = {}
+        self.plot_futures = []
+
+    def _signature(self, config):
+        signature = []
+        for f in config["files"]:
+            if os.path.exists(f):
+                stat = os.stat(f)
+                signature.append((f, stat.st_size, stat.st_mtime))
+        return tuple(signature)
+
+    def poll(self):
+        """
+        Submits the newly closed configurations. Returns the number submitted.
+        """
+        known = set(self.master.sources)
+        with open_catalog(self.data_dir) as catalog:
+            configs = ready_configurations(catalog, self.data_dir, self.settle_s)
+
+        submitted = 0
+        for config in configs:
+            logical = config["logical"]
+            if os.path.basename(logical) in known or logical in self.pending:
+                continue
+            signature = self._signature(config)
+            if self.skipped.get(logical) == signature:
+                continue
+            if config["entries"] == 0:
+                logging.warning(f"Skipping {os.path.basename(logical)}: no ntuple rows")
+                self.skipped[logical] = signature
+                continue
+
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            futures = [self.pool.submit(_histogram_file, f, "Absolute Energies", self.master.fine_edges,
+                                        tuple(SPECIES), "100 MB") for f in config["files"]]
+            self.pending[logical] = {"config": config, "futures": futures, "signature": signature}
+            if self.plots:
+                # imported here, matplotlib is only needed with --plots
+                from analyze_campaign import process_configuration
+                self.plot_futures.append(self.pool.submit(process_configuration, logical, config["files"]))
+            submitted += 1
+
+        if submitted:
+            logging.info(f"Submitted {submitted} configuration(s), {len(self.pending)} in progress")
+        return submitted
+
+    def collect(self, timeout=0):
+        """
+        Appends the configurations whose files are all histogrammed, then saves the store (and table) once.
+        Returns the number appended.
+        """
+        futures = [f for p in self.pending.values() for f in p["futures"]] or self.plot_futures
+        if futures:
+            wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+
+        added = 0
+        for logical, p in list(self.pending.items()):
+            if not all(f.done() for f in p["futures"]):
+                continue
+            del self.pending[logical]
+            config = p["config"]
+            try:
+                counts, _ = sum_file_histograms([f.result() for f in p["futures"]], len(self.master.fine_edges) - 1,
+                                                tuple(SPECIES))
+            except Exception as e:
+                logging.warning(f"Error processing {logical}: {e}")
+                self.skipped[logical] = p["signature"]
+                continue
+            if self._signature(config) != p["signature"]:
+                # rewritten while it was read (a rerun of the same configuration), taken again once it settles
+                logging.warning(f"{os.path.basename(logical)} changed while it was histogrammed, retrying")
+                continue
+            self.master.add(os.path.basename(logical), config["energy_mev"], config["thickness_um"],
+                            config["n_events"], counts)
+            added += 1
+
+        for f in [f for f in self.plot_futures if f.done()]:
+            self.plot_futures.remove(f)
+            if f.exception() is not None:
+                logging.warning(f"Plotting failed: {f.exception()}")
+
+        if added:
+            with profiling.stage("watch.save", items=added):
+                self.master.save(self.master_path)
+                if self.binning is not None:
+                    save_table(self.master, self.binning, self.output_dir)
+        return added
+
+    def run(self, poll_s=DEFAULT_POLL_S, until_idle=None):
+        """
+        Polls until interrupted, or until nothing new closed for until_idle seconds and all work is done.
+        """
+        last_activity = time.time()
+        try:
+            while True:
+                with profiling.stage("watch.poll") as s:
+                    s.add(self.poll())
+                # collect results until the next poll is due
+                deadline = time.time() + poll_s
+                while (self.pending or self.plot_futures) and time.time() < deadline:
+                    if self.collect(timeout=deadline - time.time()):
+                        last_activity = time.time()
+                time.sleep(max(deadline - time.time(), 0))
+
+                if self.pending or self.plot_futures:
+                    last_activity = time.time()
+                if until_idle is not None and time.time() - last_activity >= until_idle:
+                    logging.info(f"No new output for {until_idle:g} s, stopping")
+                    break
+        except KeyboardInterrupt:
+            logging.info("Interrupted, unfinished configurations are taken up again on the next start")
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown(cancel_futures=True)
+        return self.master
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Histogram BremSim output files as the campaign writes them.")
+    parser.add_argument("data_dir", nargs="?", default=".", help="Directory BremSim writes its output files to")
+    parser.add_argument("--master", default=DEFAULT_MASTER_PATH, help="Master store to create or extend")
+    parser.add_argument("--binning", default=None, help="Also rewrite combined_spectra_table.pkl in this binning (binning.json)")
+    parser.add_argument("--output-dir", default=".", help="Where to write the table")
+    parser.add_argument("--plots", action="store_true", help="Also plot every configuration (analyze_campaign.py)")
+    parser.add_argument("--poll", type=float, default=DEFAULT_POLL_S, help="Seconds between directory scans")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_S, help="Seconds a file must be unchanged to count as closed")
+    parser.add_argument("--until-idle", type=float, default=None, help="Stop after this many seconds without new output")
+    parser.add_argument("--fine-width", type=float, default=DEFAULT_FINE_WIDTH, help="Base resolution in MeV (new stores only)")
+    parser.add_argument("--workers", type=int, default=None, help="Histogramming processes")
+    args = parser.parse_args()
+
+    binning = Binning.load(args.binning) if args.binning else None
+    watcher = OutputWatcher(args.data_dir, args.master, binning, args.output_dir, args.plots,
+                            args.settle, args.fine_width, args.workers)
+    watcher.run(args.poll, args.until_idle)
@@ -0,0 +1,416 @@
+# Work queue for spreading a campaign over several hosts that share a filesystem, without a scheduler service.
+#
+#     python post_process/work_queue.py add   queue.sqlite --energies 0.1:5.0:0.1 --thicknesses 25um 1mm
+#     python post_process/work_queue.py work  queue.sqlite --exe build/BremSim --output-dir campaign/   (on every host)
+#     python post_process/work_queue.py status queue.sqlite
+#
+# Each job is one (E, T) configuration. A worker claims a job under a time-limited lease, renews the lease
+# while BremSim runs, and records the outcome. Jobs whose worker died are claimed again once their lease
+# expires; failed jobs are retried until max_attempts. All state lives in one SQLite file, every change
+# is a short IMMEDIATE transaction. (SQLite locking needs a filesystem with working POSIX locks, NFSv4 or
+# a local disk mounted on all hosts; not NFSv3 without lockd.)
+import os
+import time
+import uuid
+import shlex
+import socket
+import sqlite3
+import logging
+import argparse
+import threading
+import subprocess
+
+from bench_threads import load_thread_config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+DEFAULT_LEASE_S = 600
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_EVENTS = 1000000
+
+# how often a running job checks its lease, and how long BremSim gets to exit after SIGTERM
+POLL_CHILD_S = 1.0
+TERMINATE_TIMEOUT_S = 10.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    energy_mev REAL NOT NULL,
+    thickness_um REAL NOT NULL,
+    events INTEGER NOT NULL,
+    output TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    host TEXT,
+    token TEXT,
+    lease_expires REAL,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+CREATE TABLE IF NOT EXISTS attempts (
+    job_id INTEGER NOT NULL,
+    host TEXT NOT NULL,
+    pid INTEGER,
+    started REAL NOT NULL,
+    finished REAL,
+    exit_code INTEGER,
+    events INTEGER,
+    outcome TEXT
+);
+"""
+
+def energy_label(energy):
+    # 0.1MeV ... 5.0MeV, the names of the campaign macros
+    return f"{energy:.1f}" if abs(energy * 10 - round(energy * 10)) < 1e-9 else f"{energy:g}"
+
+def thickness_label(thickness_um):
+    return f"{thickness_um / 1000:g}mm" if thickness_um >= 1000 else f"{thickness_um:g}um"
+
+def output_name(energy, thickness_um):
+    return f"output_E_{energy_label(energy)}MeV_T_{thickness_label(thickness_um)}.root"
+
+def parse_thickness(text):
+    """
+    "25um", "1.5mm" or a bare number in um.
+    """
+    text = text.strip().replace(" ", "")
+    if text.endswith("mm"):
+        return float(text[:-2]) * 1000
+    if text.endswith("um"):
+        return float(text[:-2])
+    return float(text)
+
+def parse_energies(specs):
+    """
+    Energies from values and start:stop:step ranges (stop included).
+    """
+    energies = []
+    for spec in specs:
+        if ":" in spec:
+            start, stop, step = (float(x) for x in spec.split(":"))
+            n = int(round((stop - start) / step)) + 1
+            energies.extend(round(start + i * step, 6) for i in range(n))
+        else:
+            energies.append(float(spec))
+    return energies
+
+def job_macro(job):
+    """
+    Macro running a single configuration, in the layout of macros/full_run.mac.
+    """
+    thickness = job["thickness_um"]
+    return (
+        "/run/initialize\n"
+        "/run/verbose 0\n"
+        "/event/verbose 0\n"
+        "/tracking/verbose 0\n\n"
+        f"/BremSim/det/setFoilThickness {thickness:g} um\n"
+        "/run/reinitializeGeometry\n\n"
+        f"/gun/energy {energy_label(job['energy_mev'])} MeV\n"
+        f"/analysis/setFileName {job['output']}\n"
+        f"/run/beamOn {job['events']}\n"
+    )
+
+class WorkQueue:
+    def __init__(self, db_path, timeout=60):
+        self.db_path = db_path
+        # isolation_level=None: transactions are opened explicitly with BEGIN IMMEDIATE
+        self.connection = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def _transaction(self):
+        return _Immediate(self.connection)
+
+    def add(self, energies, thicknesses, events=DEFAULT_EVENTS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        Queues every (E, T) combination, configurations already in the queue are left alone.
+        Returns the number of new jobs.
+        """
+        rows = [(e, t, events, output_name(e, t), max_attempts) for t in thicknesses for e in energies]
+        with self._transaction() as c:
+            before = c.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+            c.executemany("INSERT OR IGNORE INTO jobs (energy_mev, thickness_um, events, output, max_attempts) "
+                          "VALUES (?, ?, ?, ?, ?)", rows)
+            return c.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] - before
+
+    def claim(self, host, lease_s=DEFAULT_LEASE_S):
+        """
+        Claims the next pending job, or a running one whose lease expired. Returns the job as a dict, or None.
+        """
+        now = time.time()
+        with self._transaction() as c:
+            # attempts whose worker vanished (the lease expired) are closed
+            c.execute("UPDATE attempts SET finished = ?, outcome = 'expired' WHERE finished IS NULL AND job_id IN "
+                      "(SELECT id FROM jobs WHERE status = 'running' AND lease_expires < ?)", (now, now))
+            # a job whose worker vanished on its last attempt is failed, not claimed again
+            c.execute("UPDATE jobs SET status = 'failed', token = NULL, message = 'lease expired' "
+                      "WHERE status = 'running' AND lease_expires < ? AND attempts >= max_attempts", (now,))
+            row = c.execute("SELECT * FROM jobs WHERE status = 'pending' OR (status = 'running' AND lease_expires < ?) "
+                            "ORDER BY attempts, id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            token = uuid.uuid4().hex
+            c.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, host = ?, token = ?, "
+                      "lease_expires = ?, message = NULL WHERE id = ?", (host, token, now + lease_s, row["id"]))
+            c.execute("INSERT INTO attempts (job_id, host, pid, started) VALUES (?, ?, ?, ?)",
+                      (row["id"], host, os.getpid(), now))
+            job = dict(row)
+            job.update(token=token, attempts=row["attempts"] + 1, attempt_id=c.execute("SELECT last_insert_rowid()").fetchone()[0])
+            return job
+
+    def renew(self, job, lease_s=DEFAULT_LEASE_S):
+        """
+        Extends the lease. Returns False if the job was taken over by another worker.
+        """
+        with self._transaction() as c:
+            updated = c.execute("UPDATE jobs SET lease_expires = ? WHERE id = ? AND token = ?",
+                                (time.time() + lease_s, job["id"], job["token"])).rowcount
+        return updated == 1
+
+    def finish(self, job, exit_code, message=None):
+        """
+        Records the outcome of an attempt: done, pending again (retry) or failed after max_attempts.
+        Returns the new status, or None if the lease had been lost.
+        """
+        now = time.time()
+        succeeded = exit_code == 0 and message is None
+        if succeeded:
+            status = "done"
+        elif job["attempts"] < job["max_attempts"]:
+            status = "pending"
+        else:
+            status = "failed"
+
+        with self._transaction() as c:
+            updated = c.execute("UPDATE jobs SET status = ?, token = NULL, lease_expires = NULL, message = ? "
+                                "WHERE id = ? AND token = ?", (status, message, job["id"], job["token"])).rowcount
+            if updated == 0:
+                # another worker took the job over after the lease expired, this attempt does not count
+                c.execute("UPDATE attempts SET finished = COALESCE(finished, ?), exit_code = ?, events = 0, outcome = 'expired' "
+                          "WHERE rowid = ?", (now, exit_code, job["attempt_id"]))
+                return None
+            c.execute("UPDATE attempts SET finished = ?, exit_code = ?, events = ?, outcome = ? WHERE rowid = ?",
+                      (now, exit_code, job["events"] if succeeded else 0, "done" if succeeded else "failed", job["attempt_id"]))
+        return status
+
+    def retry_failed(self, extra_attempts=1):
+        """
+        Puts failed jobs back in the queue with extra_attempts more attempts.
+        """
+        with self._transaction() as c:
+            return c.execute("UPDATE jobs SET status = 'pending', max_attempts = attempts + ?, message = NULL "
+                             "WHERE status = 'failed'", (extra_attempts,)).rowcount
+
+    def counts(self):
+        rows = self.connection.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def host_stats(self):
+        """
+        Per host: finished and failed attempts, running jobs, simulated events, busy time and throughput.
+        """
+        rows = self.connection.execute("""
+            SELECT host,
+                   SUM(outcome = 'done') AS done,
+                   SUM(outcome IN ('failed', 'expired')) AS failed,
+                   SUM(finished IS NULL) AS running,
+                   COALESCE(SUM(events), 0) AS events,
+                   COALESCE(SUM(CASE WHEN outcome = 'done' THEN finished - started END), 0) AS busy_s,
+                   MIN(started) AS first_start,
+                   MAX(COALESCE(finished, started)) AS last_seen
+            FROM attempts GROUP BY host ORDER BY host""").fetchall()
+        stats = []
+        for row in rows:
+            s = dict(row)
+            s["events_per_s"] = s["events"] / s["busy_s"] if s["busy_s"] > 0 else 0.0
+            s["jobs_per_h"] = s["done"] / (s["last_seen"] - s["first_start"]) * 3600 if s["last_seen"] > s["first_start"] else 0.0
+            stats.append(s)
+        return stats
+
+    def jobs(self, status=None):
+        query = "SELECT * FROM jobs" + (" WHERE status = ?" if status else "") + " ORDER BY id"
+        return [dict(row) for row in self.connection.execute(query, (status,) if status else ())]
+
+class _Immediate:
+    """
+    BEGIN IMMEDIATE ... COMMIT, so two workers can never claim the same job.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, tb):
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+def _keep_lease(db_path, job, lease_s, stop, lost):
+    """
+    Renews the lease every third of its length until stop is set (own connection, runs in a thread).
+    """
+    queue = WorkQueue(db_path)
+    try:
+        while not stop.wait(lease_s / 3):
+            try:
+                if not queue.renew(job, lease_s):
+                    lost.set()
+                    return
+            except sqlite3.OperationalError as e:
+                logging.warning(f"Could not renew the lease of job {job['id']}: {e}")
+    finally:
+        queue.close()
+
+def run_job(queue, job, exe, output_dir, threads, lease_s):
+    """
+    Runs BremSim for one job in output_dir and records the outcome.
+    """
+    macro_path = os.path.join(output_dir, f".queue_job_{job['id']}_{job['token'][:8]}.mac")
+    log_path = os.path.join(output_dir, os.path.splitext(job["output"])[0] + ".log")
+    with open(macro_path, "w") as f:
+        f.write(job_macro(job))
+
+    stop, lost = threading.Event(), threading.Event()
+    heartbeat = threading.Thread(target=_keep_lease, args=(queue.db_path, job, lease_s, stop, lost), daemon=True)
+    heartbeat.start()
+
+    cmd = shlex.split(exe) + ["-m", macro_path, "-t", str(threads)]
+    start = time.time()
+    try:
+        with open(log_path, "w") as log:
+            proc = subprocess.Popen(cmd, cwd=output_dir, stdout=log, stderr=subprocess.STDOUT)
+            while proc.poll() is None:
+                # once another worker may have claimed the job, this run must not keep writing its output
+                if lost.wait(POLL_CHILD_S):
+                    logging.warning(f"Lost the lease of job {job['id']}, stopping BremSim (pid {proc.pid})")
+                    proc.terminate()
+                    try:
+                        proc.wait(TERMINATE_TIMEOUT_S)
+                    except subprocess.TimeoutExpired:
+                        proc.kill()
+                        proc.wait()
+            exit_code = proc.returncode
+        message = None
+        if exit_code != 0:
+            message = f"exit code {exit_code}, see {os.path.basename(log_path)}"
+        elif not os.path.exists(os.path.join(output_dir, job["output"])) and not os.path.exists(
+                os.path.join(output_dir, os.path.splitext(job["output"])[0] + "_t0.root")):
+            message = "no output file written"
+    except OSError as e:
+        exit_code, message = -1, str(e)
+    finally:
+        stop.set()
+        heartbeat.join()
+        os.remove(macro_path)
+
+    # finish() only records the attempt (as expired) when the lease was lost
+    status = queue.finish(job, exit_code, message)
+    if lost.is_set() or status is None:
+        logging.warning(f"Lost the lease of job {job['id']} while it ran, its result is not recorded")
+        return None
+    logging.info(f"{job['output']}: {status} after {time.time() - start:.1f} s (attempt {job['attempts']}/{job['max_attempts']})"
+                 + (f", {message}" if message else ""))
+    return status
+
+def work(db_path, exe, output_dir, threads=None, lease_s=DEFAULT_LEASE_S, wait=False, poll_s=30, max_jobs=None):
+    """
+    Claims and runs jobs until the queue is empty (or, with wait, forever).
+    """
+    host = socket.gethostname()
+    if threads is None:
+        # thread count measured by bench_threads.py on this node; the config may sit on a shared
+        # filesystem and have been written by another host, so all cores otherwise
+        thread_config = load_thread_config()
+        if thread_config is not None and thread_config.get("host") == host:
+            threads = thread_config["threads"]
+        else:
+            threads = os.cpu_count()
+    os.makedirs(output_dir, exist_ok=True)
+
+    queue = WorkQueue(db_path)
+    n_jobs = 0
+    try:
+        while max_jobs is None or n_jobs < max_jobs:
+            job = queue.claim(host, lease_s)
+            if job is None:
+                if not wait:
+                    break
+                time.sleep(poll_s)
+                continue
+            logging.info(f"{host}: running {job['output']} ({job['events']} events, {threads} threads)")
+            run_job(queue, job, exe, output_dir, threads, lease_s)
+            n_jobs += 1
+    finally:
+        queue.close()
+    logging.info(f"{host}: ran {n_jobs} job(s)")
+    return n_jobs
+
+def print_status(db_path, show_failed=False):
+    queue = WorkQueue(db_path)
+    try:
+        counts = queue.counts()
+        total = sum(counts.values())
+        done = counts.get("done", 0)
+        print(f"{done}/{total} done, " + ", ".join(f"{counts.get(s, 0)} {s}" for s in ("running", "pending", "failed")))
+
+        stats = queue.host_stats()
+        if stats:
+            print(f"{'host':<24}{'done':>6}{'failed':>8}{'running':>9}{'events/s':>12}{'jobs/h':>9}")
+            for s in stats:
+                print(f"{s['host']:<24}{s['done']:>6}{s['failed']:>8}{s['running']:>9}{s['events_per_s']:>12.1f}{s['jobs_per_h']:>9.1f}")
+
+        if show_failed:
+            for job in queue.jobs("failed"):
+                print(f"failed: {job['output']} after {job['attempts']} attempt(s) on {job['host']}: {job['message']}")
+    finally:
+        queue.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite work queue for running a BremSim campaign on several hosts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("add", help="Queue (E, T) configurations")
+    p.add_argument("queue", help="Queue file on the shared filesystem")
+    p.add_argument("--energies", nargs="+", required=True, help="Energies in MeV, values or start:stop:step")
+    p.add_argument("--thicknesses", nargs="+", required=True, help="Thicknesses, e.g. 25um 1.5mm")
+    p.add_argument("--events", type=int, default=DEFAULT_EVENTS, help="/run/beamOn per configuration")
+    p.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS, help="Attempts before a job is marked failed")
+
+    p = subparsers.add_parser("work", help="Claim and run jobs until the queue is empty")
+    p.add_argument("queue", help="Queue file on the shared filesystem")
+    p.add_argument("--exe", required=True, help="BremSim executable (or any command taking -m <macro> -t <threads>)")
+    p.add_argument("--output-dir", default=".", help="Shared directory the output files are written to")
+    p.add_argument("--threads", type=int, default=None, help="Threads per job (default: thread_config.json or all cores)")
+    p.add_argument("--lease", type=float, default=DEFAULT_LEASE_S, help="Lease length in seconds, renewed while a job runs")
+    p.add_argument("--wait", action="store_true", help="Keep polling for new jobs instead of exiting when the queue is empty")
+    p.add_argument("--max-jobs", type=int, default=None, help="Exit after this many jobs")
+
+    p = subparsers.add_parser("status", help="Show progress and throughput per host")
+    p.add_argument("queue", help="Queue file")
+    p.add_argument("--failed", action="store_true", help="List the failed jobs")
+
+    p = subparsers.add_parser("retry", help="Put failed jobs back in the queue")
+    p.add_argument("queue", help="Queue file")
+    p.add_argument("--attempts", type=int, default=1, help="Extra attempts per job")
+
+    args = parser.parse_args()
+
+    if args.command == "add":
+        n = WorkQueue(args.queue).add(parse_energies(args.energies), [parse_thickness(t) for t in args.thicknesses],
+                                      args.events, args.max_attempts)
+        logging.info(f"Queued {n} new job(s) in {args.queue}")
+    elif args.command == "work":
+        work(args.queue, args.exe, os.path.abspath(args.output_dir), args.threads, args.lease, args.wait, max_jobs=args.max_jobs)
+    elif args.command == "status":
+        print_status(args.queue, args.failed)
+    elif args.command == "retry":
+        n = WorkQueue(args.queue).retry_failed(args.attempts)
+        logging.info(f"{n} failed job(s) queued again")
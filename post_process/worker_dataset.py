@@ -0,0 +1,268 @@
+import os
+import re
+import glob
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import uproot
+import numpy as np
+
+import profiling
+from quantile_sketch import QuantileSketch
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+# With /BremSim/output/mergeNtuples false every worker thread writes <name>_t<N>.root
+# next to the master file <name>.root (which then only holds histograms).
+worker_file_pattern = re.compile(r"^(?P<stem>.+)_t(?P<thread>\d+)\.root$")
+
+def is_worker_file(file_path):
+    return worker_file_pattern.match(os.path.basename(file_path)) is not None
+
+def find_worker_files(file_path):
+    """
+    Returns the per-thread files belonging to the logical output file_path, sorted by thread.
+    Falls back to [file_path] for merged output.
+    """
+    stem = os.path.splitext(file_path)[0]
+    workers = [f for f in glob.glob(glob.escape(stem) + "_t*.root") if is_worker_file(f)]
+    if workers:
+        return sorted(workers, key=lambda f: int(worker_file_pattern.match(os.path.basename(f)).group("thread")))
+    return [file_path]
+
+def group_campaign(data_dir, pattern="output_E_*_T_*.root"):
+    """
+    Groups the output files of a campaign by configuration.
+    Returns {logical_path: [files]}, where logical_path is the merged file name BremSim was given.
+    """
+    groups = {}
+    for f in glob.glob(os.path.join(data_dir, pattern)):
+        match = worker_file_pattern.match(os.path.basename(f))
+        logical = os.path.join(os.path.dirname(f), match.group("stem") + ".root") if match else f
+        groups.setdefault(logical, []).append(f)
+
+    for logical, files in groups.items():
+        workers = [f for f in files if is_worker_file(f)]
+        # the master file of an unmerged run carries no ntuple rows
+        groups[logical] = sorted(workers) if workers else files
+    return dict(sorted(groups.items()))
+
+# Single-bin H1 holding the number of events BremSim simulated (written in every scoring mode).
+# Runs stopped early by /BremSim/convergence/enable have fewer events than their /run/beamOn.
+EVENT_COUNT_NAME = "Event_Count"
+
+def read_event_count(file_path):
+    """
+    Returns the number of simulated events of a (master or merged) output file,
+    or None for files written before the event count was recorded.
+    """
+    with uproot.open(file_path) as file:
+        if EVENT_COUNT_NAME not in file:
+            return None
+        return int(round(file[EVENT_COUNT_NAME].values().sum()))
+
+# Per-row statistical weight, written when bremsstrahlung splitting is active (/BremSim/phys/bremSplitting)
+WEIGHT_BRANCH = "Weight"
+
+def event_branches(tree, branches=("AbsEnergy", "ParticleID")):
+    """
+    Returns the branches to read from an "Absolute Energies" tree, plus the weight branch if it has one.
+    """
+    branches = list(branches)
+    if WEIGHT_BRANCH in tree.keys():
+        branches.append(WEIGHT_BRANCH)
+    return branches
+
+def _histogram_file(file_path, tree_name, bins, particle_ids, step_size):
+    """
+    Histograms AbsEnergy per ParticleID for a single file, chunk by chunk.
+    Rows are weighted by the Weight branch when present.
+    Returns (counts, totals, weighted).
+    """
+    counts = {pid: np.zeros(len(bins) - 1) for pid in particle_ids}
+    totals = {pid: 0.0 for pid in particle_ids}
+    weighted = False
+
+    with uproot.open(file_path) as file:
+        if tree_name not in file:
+            return counts, totals, weighted
+        tree = file[tree_name]
+        branches = event_branches(tree)
+        weighted = WEIGHT_BRANCH in branches
+        chunks = tree.iterate(branches, step_size=step_size, library="np")
+        while True:
+            # decompression and conversion to numpy happen when the next chunk is requested
+            with profiling.stage("histogram.read") as s:
+                chunk = next(chunks, None)
+                s.add(0 if chunk is None else len(chunk["AbsEnergy"]))
+            if chunk is None:
+                break
+            energies = chunk["AbsEnergy"]
+            pids = chunk["ParticleID"]
+            weights = chunk.get(WEIGHT_BRANCH)
+            for pid in particle_ids:
+                with profiling.stage("histogram.mask"):
+                    mask = pids == pid
+                    w = weights[mask] if weights is not None else None
+                    selected = energies[mask]
+                with profiling.stage("histogram.np_histogram", items=len(selected)):
+                    hist, _ = np.histogram(selected, bins=bins, weights=w)
+                counts[pid] += hist
+                totals[pid] += w.sum() if w is not None else mask.sum()
+
+    return counts, totals, weighted
+
+def _sketch_file(file_path, tree_name, particle_ids, relative_accuracy, step_size):
+    """
+    Streams AbsEnergy per ParticleID of a single file into quantile sketches, weighted for biased runs.
+    Returns {pid: QuantileSketch}.
+    """
+    sketches = {pid: QuantileSketch(relative_accuracy) for pid in particle_ids}
+
+    with uproot.open(file_path) as file:
+        if tree_name not in file:
+            return sketches
+        tree = file[tree_name]
+        for chunk in tree.iterate(event_branches(tree), step_size=step_size, library="np"):
+            weights = chunk.get(WEIGHT_BRANCH)
+            for pid in particle_ids:
+                mask = chunk["ParticleID"] == pid
+                sketches[pid].update(chunk["AbsEnergy"][mask], weights[mask] if weights is not None else None)
+
+    return sketches
+
+def sum_file_histograms(results, n_bins, particle_ids=(0, 1)):
+    """
+    Adds up the per-file results of _histogram_file into ({pid: counts}, {pid: total entries}).
+    Integer counts unless one of the files was weighted.
+    """
+    counts = {pid: np.zeros(n_bins) for pid in particle_ids}
+    totals = {pid: 0.0 for pid in particle_ids}
+
+    any_weighted = False
+    for file_counts, file_totals, weighted in results:
+        any_weighted |= weighted
+        for pid in particle_ids:
+            counts[pid] += file_counts[pid]
+            totals[pid] += file_totals[pid]
+
+    if not any_weighted:
+        counts = {pid: c.astype(np.int64) for pid, c in counts.items()}
+        totals = {pid: int(t) for pid, t in totals.items()}
+
+    return counts, totals
+
+class WorkerDataset:
+    """
+    One configuration written as per-thread files, read as a single logical dataset.
+    No merged file is ever written; files are read chunk by chunk or histogrammed in parallel.
+    """
+
+    def __init__(self, file_path, tree_name="Absolute Energies", files=None):
+        self.path = file_path
+        self.tree_name = tree_name
+        # the files of a catalog configuration (see catalog.py) are taken as they are
+        self.files = list(files) if files else find_worker_files(file_path)
+
+    @property
+    def num_entries(self):
+        total = 0
+        for f in self.files:
+            with uproot.open(f) as file:
+                if self.tree_name in file:
+                    total += file[self.tree_name].num_entries
+        return total
+
+    def iterate(self, branches=("AbsEnergy", "ParticleID"), step_size="100 MB"):
+        """
+        Yields dicts of numpy arrays, chunk by chunk over all worker files.
+        """
+        sources = [f"{f}:{self.tree_name}" for f in self.files]
+        yield from uproot.iterate(sources, list(branches), step_size=step_size, library="np")
+
+    def arrays(self, branches=("AbsEnergy", "ParticleID")):
+        """
+        Loads the given branches of all worker files into memory (concatenated).
+        """
+        chunks = list(self.iterate(branches))
+        if not chunks:
+            return {b: np.array([]) for b in branches}
+        return {b: np.concatenate([c[b] for c in chunks]) for b in branches}
+
+    def histogram(self, bins, particle_ids=(0, 1), step_size="100 MB", max_workers=None, executor=None):
+        """
+        Histograms AbsEnergy per particle ID, one process per worker file.
+        Pass an existing executor to reuse one process pool across configurations.
+        Weighted files give float sums of weights, unweighted ones integer counts.
+        Returns ({pid: counts}, {pid: total entries}).
+        """
+        n = len(self.files)
+        args = (self.files, [self.tree_name] * n, [bins] * n, [particle_ids] * n, [step_size] * n)
+
+        if executor is not None:
+            results = list(executor.map(_histogram_file, *args))
+        elif n == 1:
+            results = [_histogram_file(self.files[0], self.tree_name, bins, particle_ids, step_size)]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                results = list(pool.map(_histogram_file, *args))
+
+        return sum_file_histograms(results, len(bins) - 1, particle_ids)
+
+    def sketch(self, particle_ids=(0,), relative_accuracy=0.005, step_size="100 MB", max_workers=None, executor=None):
+        """
+        Streams AbsEnergy per particle ID into mergeable quantile sketches, one process per worker file.
+        Memory stays bounded however large the files are (see QuantileSketch for the error bound).
+        Returns {pid: QuantileSketch}.
+        """
+        n = len(self.files)
+        args = (self.files, [self.tree_name] * n, [particle_ids] * n, [relative_accuracy] * n, [step_size] * n)
+
+        if executor is not None:
+            results = list(executor.map(_sketch_file, *args))
+        elif n == 1:
+            results = [_sketch_file(self.files[0], self.tree_name, particle_ids, relative_accuracy, step_size)]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                results = list(pool.map(_sketch_file, *args))
+
+        sketches = {pid: QuantileSketch(relative_accuracy) for pid in particle_ids}
+        for file_sketches in results:
+            for pid in particle_ids:
+                sketches[pid].merge(file_sketches[pid])
+        return sketches
+
+def histogram_campaign(file_paths, bins, particle_ids=(0, 1), step_size="100 MB", max_workers=None, tree_name="Absolute Energies"):
+    """
+    Histograms many configurations at once: the worker files of all of them are queued on one
+    process pool, so small configurations do not wait for each other.
+    file_paths are logical paths, or {logical path: files} for configurations from the catalog
+    (then no directory is searched again). Returns {file_path: {pid: counts}} for the logical paths.
+    """
+    groups = file_paths if isinstance(file_paths, dict) else dict.fromkeys(file_paths)
+    datasets = [WorkerDataset(f, tree_name, files=files) for f, files in groups.items()]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [[pool.submit(_histogram_file, f, tree_name, bins, particle_ids, step_size) for f in d.files]
+                   for d in datasets]
+
+        results = {}
+        for dataset, dataset_futures in zip(datasets, futures):
+            counts = {pid: np.zeros(len(bins) - 1) for pid in particle_ids}
+            for future in dataset_futures:
+                file_counts, _, _ = future.result()
+                for pid in particle_ids:
+                    counts[pid] += file_counts[pid]
+            results[dataset.path] = counts
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize per-thread BremSim output files as logical datasets.")
+    parser.add_argument("data_dir", nargs="?", default=".", help="Directory containing ROOT files")
+    args = parser.parse_args()
+
+    groups = group_campaign(args.data_dir)
+    logging.info(f"Found {len(groups)} configurations in {args.data_dir}")
+    for logical, files in groups.items():
+        dataset = WorkerDataset(logical)
+        logging.info(f"{os.path.basename(logical)}: {len(files)} file(s), {dataset.num_entries} entries")
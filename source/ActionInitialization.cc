@@ -3,6 +3,8 @@
 #include "PrimaryGeneratorAction.hh"
 #include "RunAction.hh"
 #include "SteppingAction.hh"
+#include "EventAction.hh"
+#include "StackingAction.hh"
 
 
 namespace BremSim
@@ -13,8 +15,13 @@ namespace BremSim
 
 		// set Geant4 Actions
 		SetUserAction(new PrimaryGeneratorAction);
-		SetUserAction(new RunAction());
-		SetUserAction(new SteppingAction());
+
+		// the stepping action fills the output booked by the run action of the same thread
+		auto runAction = new RunAction();
+		SetUserAction(runAction);
+		SetUserAction(new SteppingAction(runAction));
+		SetUserAction(new EventAction(runAction));
+		SetUserAction(new StackingAction());
 	};
 
 	void ActionInitialization::BuildForMaster() const{
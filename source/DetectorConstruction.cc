@@ -8,6 +8,9 @@
 #include "G4SystemOfUnits.hh"
 #include "G4NistManager.hh"
 #include "G4LogicalVolume.hh"
+#include "G4Region.hh"
+#include "G4RegionStore.hh"
+#include "G4UserLimits.hh"
 
 
 namespace BremSim
@@ -23,6 +26,7 @@ namespace BremSim
 	DetectorConstruction::~DetectorConstruction()
 	{
 		delete fMessenger;
+		delete fFoilLimits;
 	}
 
 	void DetectorConstruction::DefineCommands()
@@ -34,6 +38,13 @@ namespace BremSim
 		thicknessCmd.SetParameterName("thickness", true);
 		thicknessCmd.SetRange("thickness>0.");
 		thicknessCmd.SetDefaultValue("0.05");
+
+		// Command to limit the step length in the foil (production cuts: /run/setCutForRegion FoilRegion <cut>)
+		auto& maxStepCmd = fMessenger->DeclarePropertyWithUnit("setFoilMaxStep", "um", fFoilMaxStep,
+			"Set the maximum step length in the foil (0 = no limit). Applied at the next /run/reinitializeGeometry");
+		maxStepCmd.SetParameterName("maxStep", true);
+		maxStepCmd.SetRange("maxStep>=0.");
+		maxStepCmd.SetDefaultValue("0.");
 	}
 
 	G4VPhysicalVolume* DetectorConstruction::Construct()
@@ -63,6 +74,17 @@ namespace BremSim
 		G4LogicalVolume* logicDetector = new G4LogicalVolume(solidDetector, detector_mat, "logicDetector");
 		new G4PVPlacement(0, detector_pos, logicDetector, "physDetector", logicWorld, false, 0, true);
 	
+		// step limit in the foil
+		if (fBremsVolume != nullptr) { fBremsVolume->SetUserLimits(nullptr); }
+		delete fFoilLimits;
+		fFoilLimits = (fFoilMaxStep > 0.) ? new G4UserLimits(fFoilMaxStep) : nullptr;
+		logicFoil->SetUserLimits(fFoilLimits);
+
+		// the foil gets its own region so it can have its own production cuts
+		G4Region* foilRegion = G4RegionStore::GetInstance()->FindOrCreateRegion("FoilRegion");
+		if (fBremsVolume != nullptr) { foilRegion->RemoveRootLogicalVolume(fBremsVolume); }
+		foilRegion->AddRootLogicalVolume(logicFoil);
+
 		// set the brems volume
 		fBremsVolume = logicFoil;
 	
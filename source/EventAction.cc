@@ -0,0 +1,16 @@
+#include "EventAction.hh"
+
+
+namespace BremSim
+{
+	EventAction::EventAction(RunAction* runAction)
+		: fRunAction(runAction)
+	{}
+
+
+	void EventAction::EndOfEventAction(const G4Event*)
+	{
+		// convergence-based early stop, checked every /BremSim/convergence/checkInterval events
+		if (fRunAction->IsConvergenceEnabled()) { fRunAction->EndOfEvent(); }
+	}
+}
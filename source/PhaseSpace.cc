@@ -0,0 +1,88 @@
+#include "PhaseSpace.hh"
+
+#include "G4AutoLock.hh"
+#include "G4Exception.hh"
+
+#include <cstring>
+
+
+namespace BremSim
+{
+	void PhaseSpaceWriter::Open(const G4String& fileName)
+	{
+		G4AutoLock lock(&fMutex);
+
+		fFile.open(fileName, std::ios::binary | std::ios::trunc);
+		if (!fFile.is_open())
+		{
+			G4ExceptionDescription msg;
+			msg << "Cannot open phase-space file " << fileName << " for writing";
+			G4Exception("PhaseSpaceWriter::Open()", "BremSim009", FatalException, msg);
+		}
+
+		// placeholder, rewritten with the number of primaries on close
+		PhaseSpaceHeader header;
+		fFile.write(reinterpret_cast<const char*>(&header), sizeof(header));
+	}
+
+
+	void PhaseSpaceWriter::Write(const std::vector<PhaseSpaceRecord>& records)
+	{
+		if (records.empty()) { return; }
+
+		G4AutoLock lock(&fMutex);
+		if (!fFile.is_open()) { return; }
+		fFile.write(reinterpret_cast<const char*>(records.data()), records.size() * sizeof(PhaseSpaceRecord));
+	}
+
+
+	void PhaseSpaceWriter::Close(G4long primaries)
+	{
+		G4AutoLock lock(&fMutex);
+		if (!fFile.is_open()) { return; }
+
+		PhaseSpaceHeader header;
+		header.primaries = primaries;
+		fFile.seekp(0);
+		fFile.write(reinterpret_cast<const char*>(&header), sizeof(header));
+		fFile.close();
+	}
+
+
+	void PhaseSpaceReader::Open(const G4String& fileName)
+	{
+		G4AutoLock lock(&fMutex);
+
+		// every worker sets the file, only the first one opens it (or starts over once it is exhausted)
+		if (fileName == fFileName && fFile.is_open() && fFile.good()) { return; }
+
+		if (fFile.is_open()) { fFile.close(); }
+		fFile.clear();
+		fFile.open(fileName, std::ios::binary);
+		if (!fFile.is_open())
+		{
+			G4ExceptionDescription msg;
+			msg << "Cannot open phase-space file " << fileName;
+			G4Exception("PhaseSpaceReader::Open()", "BremSim009", FatalException, msg);
+		}
+
+		PhaseSpaceHeader expected;
+		fFile.read(reinterpret_cast<char*>(&fHeader), sizeof(fHeader));
+		if (!fFile || std::memcmp(fHeader.magic, expected.magic, 4) != 0 || fHeader.recordSize != expected.recordSize)
+		{
+			G4ExceptionDescription msg;
+			msg << fileName << " is not a BremSim phase-space file (version " << expected.version << ")";
+			G4Exception("PhaseSpaceReader::Open()", "BremSim010", FatalException, msg);
+		}
+
+		fFileName = fileName;
+	}
+
+
+	G4bool PhaseSpaceReader::Next(PhaseSpaceRecord& record)
+	{
+		G4AutoLock lock(&fMutex);
+		if (!fFile.is_open()) { return false; }
+		return static_cast<G4bool>(fFile.read(reinterpret_cast<char*>(&record), sizeof(record)));
+	}
+}
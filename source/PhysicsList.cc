@@ -14,6 +14,14 @@
 #include "G4EmStandardPhysicsSS.hh"
 #include "G4EmStandardPhysicsGS.hh"
 
+// step limits in the foil (G4UserLimits set by the detector construction)
+#include "G4StepLimiterPhysics.hh"
+
+// variance reduction
+#include "G4EmParameters.hh"
+#include "G4SystemOfUnits.hh"
+#include "G4Threading.hh"
+
 
 namespace BremSim
 {
@@ -21,6 +29,72 @@ namespace BremSim
 	{
 		// Register the high-accuracy EM physics package (accurate electron bremmstrahlung and photon interaction)
 		RegisterPhysics(new G4EmStandardPhysics());
+
+		// only limits steps in volumes with user limits (/BremSim/det/setFoilMaxStep)
+		RegisterPhysics(new G4StepLimiterPhysics());
+
+		fBremSplittingEnergyLimit = 100. * MeV; // above every beam energy of the campaign
+
+		DefineCommands();
+	}
+
+	PhysicsList::~PhysicsList()
+	{
+		delete fMessenger;
+	}
+
+	void PhysicsList::DefineCommands()
+	{
+		fMessenger = new G4GenericMessenger(this, "/BremSim/phys/", "Physics list control");
+
+		// EM constructor, replaces the default G4EmStandardPhysics
+		auto& emCmd = fMessenger->DeclareMethod("emPhysics", &PhysicsList::SetEmPhysics,
+			"Select the EM physics constructor. Set before /run/initialize.");
+		emCmd.SetParameterName("name", true);
+		emCmd.SetCandidates("standard option1 option2 option3 option4 livermore penelope wvi ss gs");
+		emCmd.SetDefaultValue("standard");
+		emCmd.SetStates(G4State_PreInit);
+
+		// every bremsstrahlung photon is split into N photons of weight 1/N
+		auto& splitCmd = fMessenger->DeclareProperty("bremSplitting", fBremSplittingFactor,
+			"Bremsstrahlung splitting factor (1 = unbiased). Set before /run/initialize.");
+		splitCmd.SetParameterName("factor", true);
+		splitCmd.SetRange("factor>=1");
+		splitCmd.SetDefaultValue("1");
+		splitCmd.SetStates(G4State_PreInit);
+
+		auto& limitCmd = fMessenger->DeclarePropertyWithUnit("bremSplittingEnergyLimit", "MeV", fBremSplittingEnergyLimit,
+			"Only split bremsstrahlung of electrons below this energy. Set before /run/initialize.");
+		limitCmd.SetParameterName("energyLimit", true);
+		limitCmd.SetDefaultValue("100.");
+		limitCmd.SetStates(G4State_PreInit);
+	}
+
+	void PhysicsList::SetEmPhysics(G4String name)
+	{
+		if (name == fEmPhysicsName) { return; }
+
+		// all EM constructors share the electromagnetic physics type, so the current one is replaced
+		if (name == "standard") { ReplacePhysics(new G4EmStandardPhysics()); }
+		else if (name == "option1") { ReplacePhysics(new G4EmStandardPhysics_option1()); }
+		else if (name == "option2") { ReplacePhysics(new G4EmStandardPhysics_option2()); }
+		else if (name == "option3") { ReplacePhysics(new G4EmStandardPhysics_option3()); }
+		else if (name == "option4") { ReplacePhysics(new G4EmStandardPhysics_option4()); }
+		else if (name == "livermore") { ReplacePhysics(new G4EmLivermorePhysics()); }
+		else if (name == "penelope") { ReplacePhysics(new G4EmPenelopePhysics()); }
+		else if (name == "wvi") { ReplacePhysics(new G4EmStandardPhysicsWVI()); }
+		else if (name == "ss") { ReplacePhysics(new G4EmStandardPhysicsSS()); }
+		else if (name == "gs") { ReplacePhysics(new G4EmStandardPhysicsGS()); }
+		else
+		{
+			G4ExceptionDescription msg;
+			msg << "Unknown EM physics \"" << name << "\", keeping " << fEmPhysicsName;
+			G4Exception("PhysicsList::SetEmPhysics()", "BremSim007", JustWarning, msg);
+			return;
+		}
+
+		fEmPhysicsName = name;
+		G4cout << "### EM physics constructor: " << fEmPhysicsName << G4endl;
 	}
 
 	void PhysicsList::ConstructParticle()
@@ -30,6 +104,21 @@ namespace BremSim
 
 	void PhysicsList::ConstructProcess()
 	{
+		// the biasing definitions are picked up when the EM processes are initialised.
+		// G4EmParameters is shared, it can only be changed from the master thread.
+		// Biasing only acts in the named regions: the foil has its own region (see DetectorConstruction),
+		// the world region covers the detector and the air around it.
+		if (fBremSplittingFactor > 1 && G4Threading::IsMasterThread())
+		{
+			for (const char* region : { "FoilRegion", "DefaultRegionForTheWorld" })
+			{
+				G4EmParameters::Instance()->SetSecondaryBiasing("eBrem", region,
+					fBremSplittingFactor, fBremSplittingEnergyLimit);
+			}
+			G4cout << "### Bremsstrahlung splitting factor " << fBremSplittingFactor
+				<< " below " << fBremSplittingEnergyLimit / MeV << " MeV" << G4endl;
+		}
+
 		G4VModularPhysicsList::ConstructProcess();
 	}
 }
@@ -9,10 +9,13 @@
 #include "Randomize.hh"
 
 #include "G4UnitsTable.hh"
+#include "G4RunManager.hh"
 
 
 namespace BremSim
 {
+	PhaseSpaceReader PrimaryGeneratorAction::fPhaseSpaceReader;
+
 	PrimaryGeneratorAction::PrimaryGeneratorAction()
 	{
 		// set up the gun
@@ -27,14 +30,94 @@ namespace BremSim
 		fParticleGun->SetParticleMomentumDirection(G4ThreeVector(0., 0., 1.)); 			// shoot along the z-axis
 		fParticleGun->SetParticleEnergy(5.0 * MeV); 									// Hardcode Energy of the beam and we'll change it in the mac files
 
+		// species of the phase-space records
+		fSpecies[0] = particleTable->FindParticle("gamma");
+		fSpecies[1] = particleTable->FindParticle("e-");
+		fSpecies[2] = particleTable->FindParticle("e+");
+
+		DefineCommands();
 	}
 
 	
-	PrimaryGeneratorAction::~PrimaryGeneratorAction(){ delete fParticleGun; }
+	PrimaryGeneratorAction::~PrimaryGeneratorAction()
+	{
+		delete fParticleGun;
+		delete fMessenger;
+	}
+
+
+	void PrimaryGeneratorAction::DefineCommands()
+	{
+		fMessenger = new G4GenericMessenger(this, "/BremSim/gun/", "Primary generator");
+
+		auto& replayCmd = fMessenger->DeclareMethod("phaseSpaceFile", &PrimaryGeneratorAction::SetPhaseSpaceFile,
+			"Replay a phase-space file (one record per event) instead of the electron beam. "
+			"Consecutive runs continue through the file, it starts over once it has been exhausted. Use \"none\" for the beam.");
+		replayCmd.SetParameterName("file", true);
+		replayCmd.SetDefaultValue("none");
+	}
+
+
+	void PrimaryGeneratorAction::SetPhaseSpaceFile(G4String fileName)
+	{
+		G4bool replay = !(fileName.empty() || fileName == "none");
+
+		// replayed records overwrite the gun, the beam settings are kept for the runs after the replay
+		if (replay && !fReplay)
+		{
+			fBeamParticle = fParticleGun->GetParticleDefinition();
+			fBeamDirection = fParticleGun->GetParticleMomentumDirection();
+			fBeamEnergy = fParticleGun->GetParticleEnergy();
+		}
+		else if (!replay && fReplay)
+		{
+			fParticleGun->SetParticleDefinition(fBeamParticle);
+			fParticleGun->SetParticleMomentumDirection(fBeamDirection);
+			fParticleGun->SetParticleEnergy(fBeamEnergy);
+		}
+		fReplay = replay;
+
+		// the reader is shared, the first worker opens the file
+		if (fReplay) { fPhaseSpaceReader.Open(fileName); }
+	}
 
 
 	void PrimaryGeneratorAction::GeneratePrimaries(G4Event* event) // generate primary particles
 	{
+		if (fReplay)
+		{
+			PhaseSpaceRecord record;
+			if (!fPhaseSpaceReader.Next(record))
+			{
+				// no records left, this event stays empty and the run stops
+				G4ExceptionDescription msg;
+				msg << "Phase-space file " << fPhaseSpaceReader.GetFileName() << " exhausted, stopping the run";
+				G4Exception("PrimaryGeneratorAction::GeneratePrimaries()", "BremSim011", JustWarning, msg);
+				G4RunManager::GetRunManager()->AbortRun(true);
+				return;
+			}
+
+			G4ParticleDefinition* species = (record.species >= 0 && record.species < 3) ? fSpecies[record.species] : nullptr;
+			if (species == nullptr)
+			{
+				G4ExceptionDescription msg;
+				msg << "Phase-space file " << fPhaseSpaceReader.GetFileName() << " holds a record with species "
+					<< record.species << " (expected 0 gamma, 1 e-, 2 e+)";
+				G4Exception("PrimaryGeneratorAction::GeneratePrimaries()", "BremSim012", FatalException, msg);
+				return;
+			}
+
+			fParticleGun->SetParticleDefinition(species);
+			fParticleGun->SetParticleEnergy(record.energy * MeV);
+			fParticleGun->SetParticlePosition(G4ThreeVector(record.x * mm, record.y * mm, record.z * mm));
+			fParticleGun->SetParticleMomentumDirection(G4ThreeVector(record.dx, record.dy, record.dz));
+			fParticleGun->GeneratePrimaryVertex(event);
+
+			// the weight of the vertex is carried by every track of the event
+			event->GetPrimaryVertex()->SetWeight(record.weight);
+			return;
+		}
+
 		// randomize starting position of each electron within a 1 mm diameter in the xy plane
 		G4double radius = .5*mm;
 		double x,y;
@@ -1,10 +1,63 @@
 #include "RunAction.hh"
+#include "PhysicsList.hh"
 #include "G4ThreeVector.hh"
 #include "G4UnitsTable.hh"
+#include "G4SystemOfUnits.hh"
+#include "G4RunManager.hh"
+#include "G4Run.hh"
+#include "G4Step.hh"
+#include "G4LogicalVolume.hh"
+#include "G4ParticleDefinition.hh"
+#include "G4AutoLock.hh"
+
+#include <fstream>
+#include <sstream>
+#include <algorithm>
+#include <cmath>
+#include <iomanip>
+#include <filesystem>
 
 
 namespace BremSim
 {
+	namespace
+	{
+		// JSON string literal: output paths may hold backslashes (C:\...) or quotes
+		std::string JsonString(const std::string& text)
+		{
+			std::ostringstream out;
+			out << '"';
+			for (const unsigned char c : text)
+			{
+				switch (c)
+				{
+					case '"': out << "\\\""; break;
+					case '\\': out << "\\\\"; break;
+					case '\n': out << "\\n"; break;
+					case '\r': out << "\\r"; break;
+					case '\t': out << "\\t"; break;
+					default:
+						if (c < 0x20) { out << "\\u" << std::hex << std::setw(4) << std::setfill('0') << static_cast<int>(c) << std::dec; }
+						else { out << c; }
+				}
+			}
+			out << '"';
+			return out.str();
+		}
+	}
+
+	std::vector<RunAction::PerfRecord> RunAction::fPerfRecords;
+	std::map<std::pair<G4String, G4String>, RunAction::StepCounts> RunAction::fPerfStepCounts;
+	G4Mutex RunAction::fPerfMutex = G4MUTEX_INITIALIZER;
+
+	std::vector<G4double> RunAction::fSharedSumW;
+	std::vector<G4double> RunAction::fSharedSumW2;
+	std::vector<G4long> RunAction::fSharedEntries;
+	std::atomic<G4bool> RunAction::fConverged{false};
+	G4Mutex RunAction::fConvergenceMutex = G4MUTEX_INITIALIZER;
+
+	PhaseSpaceWriter RunAction::fPhaseSpaceWriter;
+
 	RunAction::RunAction()
 	{
 		// set up analysis nTuples and output files
@@ -13,54 +66,544 @@ namespace BremSim
 
 		// set default settings
 		analysisManager->SetDefaultFileType("root");
-		analysisManager->SetNtupleMerging(true);
 		analysisManager->SetVerboseLevel(1);
 		analysisManager->SetFileName("output");
 
-		// create nTuple to store the absolute energies
-		const G4int ntupleID1 = analysisManager->CreateNtuple("Absolute Energies", "Gamma Energies");
-		analysisManager->CreateNtupleDColumn(ntupleID1, "AbsEnergy");
-		analysisManager->CreateNtupleIColumn(ntupleID1, "ParticleID"); // 0 for gamma, 1 for electron
-		analysisManager->FinishNtuple(ntupleID1);
+		// only write the objects used by the selected scoring mode
+		analysisManager->SetActivation(true);
+
+		fMaxEnergy = 5.05 * MeV; // slightly above the highest beam energy of the campaign
 
-		// create nTuple for the relative energies
-		const G4int ntupleId2 = analysisManager->CreateNtuple("Relative Energies", "Gamma Energies");
-		analysisManager->CreateNtupleDColumn(ntupleId2, "RelEnergy");
-		analysisManager->FinishNtuple(ntupleId2);
+		DefineCommands();
 	}
 
 
 	RunAction::~RunAction()
 	{
+		delete fMessenger;
+		delete fPerfMessenger;
+		delete fConvergenceMessenger;
+		delete fPhaseSpaceMessenger;
+	}
+
+
+	void RunAction::DefineCommands()
+	{
+		fMessenger = new G4GenericMessenger(this, "/BremSim/output/", "Output control");
+
+		// ntuple rows per secondary, or histograms filled during the run
+		auto& modeCmd = fMessenger->DeclareMethod("scoringMode", &RunAction::SetScoringMode,
+			"Scoring mode: ntuple (one row per secondary), histogram (binned energy spectra) or both");
+		modeCmd.SetParameterName("mode", true);
+		modeCmd.SetCandidates("ntuple histogram both");
+		modeCmd.SetDefaultValue("ntuple");
+
+		auto& dirCmd = fMessenger->DeclareProperty("directory", fOutputDirectory,
+			"Directory the output files are written to (relative file names only)");
+		dirCmd.SetParameterName("directory", true);
+		dirCmd.SetDefaultValue("");
+
+		// ntuple schema
+		auto& absCmd = fMessenger->DeclareProperty("absNtuple", fAbsNtuple, "Write the \"Absolute Energies\" ntuple");
+		absCmd.SetParameterName("enable", true);
+		absCmd.SetDefaultValue("true");
+
+		auto& relCmd = fMessenger->DeclareProperty("relNtuple", fRelNtuple, "Write the \"Relative Energies\" ntuple");
+		relCmd.SetParameterName("enable", true);
+		relCmd.SetDefaultValue("true");
+
+		auto& floatCmd = fMessenger->DeclareProperty("floatEnergies", fFloatEnergies,
+			"Store energies as float instead of double (must be set before the first run)");
+		floatCmd.SetParameterName("enable", true);
+		floatCmd.SetDefaultValue("false");
+
+		auto& mergeCmd = fMessenger->DeclareProperty("mergeNtuples", fMergeNtuples,
+			"Merge worker ntuples into one file at end of run, or write one file per worker thread (must be set before the first run)");
+		mergeCmd.SetParameterName("merge", true);
+		mergeCmd.SetDefaultValue("true");
+
+		// uniform binning of the spectrum histograms
+		auto& nBinsCmd = fMessenger->DeclareProperty("histBins", fNBins, "Number of uniform histogram bins");
+		nBinsCmd.SetParameterName("histBins", true);
+		nBinsCmd.SetRange("histBins>0");
+		nBinsCmd.SetDefaultValue("2000");
+
+		auto& minCmd = fMessenger->DeclarePropertyWithUnit("histMinEnergy", "MeV", fMinEnergy, "Lower edge of the uniform histogram binning");
+		minCmd.SetParameterName("histMinEnergy", true);
+		minCmd.SetDefaultValue("0.");
+
+		auto& maxCmd = fMessenger->DeclarePropertyWithUnit("histMaxEnergy", "MeV", fMaxEnergy, "Upper edge of the uniform histogram binning");
+		maxCmd.SetParameterName("histMaxEnergy", true);
+		maxCmd.SetDefaultValue("5.05");
+
+		// variable binning, overrides the uniform binning when set
+		auto& edgesCmd = fMessenger->DeclareProperty("binEdgesFile", fBinEdgesFile,
+			"Text file with one bin edge per line in MeV (overrides histBins/histMinEnergy/histMaxEnergy). Use \"none\" to clear.");
+		edgesCmd.SetParameterName("file", true);
+		edgesCmd.SetDefaultValue("none");
+
+		// performance counters, written to <output>_perf.json
+		fPerfMessenger = new G4GenericMessenger(this, "/BremSim/perf/", "Performance counters");
+
+		auto& perfCmd = fPerfMessenger->DeclareProperty("enable", fPerfEnabled,
+			"Count events, ntuple rows, steps and tracks per volume and species, and write them next to the output file");
+		perfCmd.SetParameterName("enable", true);
+		perfCmd.SetDefaultValue("true");
+
+		// stop the run once the photon spectrum is known well enough
+		fConvergenceMessenger = new G4GenericMessenger(this, "/BremSim/convergence/", "Convergence-based early stop");
+
+		auto& convCmd = fConvergenceMessenger->DeclareProperty("enable", fConvergenceEnabled,
+			"Abort the run once the relative error of every photon spectrum bin above peakFraction of the peak bin is below the target");
+		convCmd.SetParameterName("enable", true);
+		convCmd.SetDefaultValue("true");
+
+		auto& intervalCmd = fConvergenceMessenger->DeclareProperty("checkInterval", fCheckInterval,
+			"Events each worker simulates between two convergence checks");
+		intervalCmd.SetParameterName("events", true);
+		intervalCmd.SetRange("events>0");
+		intervalCmd.SetDefaultValue("10000");
+
+		auto& targetCmd = fConvergenceMessenger->DeclareProperty("targetError", fTargetError,
+			"Target relative statistical error (sqrt(sum w^2) / sum w) of the bins above peakFraction of the peak");
+		targetCmd.SetParameterName("error", true);
+		targetCmd.SetRange("error>0.");
+		targetCmd.SetDefaultValue("0.01");
+
+		auto& minEntriesCmd = fConvergenceMessenger->DeclareProperty("minBinEntries", fMinBinEntries,
+			"Entries a bin needs to count as populated (keeps the sparse endpoint bins out of the check)");
+		minEntriesCmd.SetParameterName("entries", true);
+		minEntriesCmd.SetRange("entries>0");
+		minEntriesCmd.SetDefaultValue("100");
+
+		auto& peakCmd = fConvergenceMessenger->DeclareProperty("peakFraction", fPeakFraction,
+			"Only bins whose weighted content is at least this fraction of the peak bin are checked");
+		peakCmd.SetParameterName("fraction", true);
+		peakCmd.SetRange("fraction>0. && fraction<=1.");
+		peakCmd.SetDefaultValue("0.1");
+
+		// particles leaving the foil downstream, for replay with /BremSim/gun/phaseSpaceFile
+		fPhaseSpaceMessenger = new G4GenericMessenger(this, "/BremSim/phaseSpace/", "Phase-space recording at the foil exit");
+
+		auto& recordCmd = fPhaseSpaceMessenger->DeclareProperty("record", fPhaseSpaceRecording,
+			"Write the gammas, electrons and positrons crossing the downstream foil face to <output>_phsp.bin");
+		recordCmd.SetParameterName("enable", true);
+		recordCmd.SetDefaultValue("true");
 
+		auto& bufferCmd = fPhaseSpaceMessenger->DeclareProperty("bufferSize", fPhaseSpaceBufferSize,
+			"Records each thread buffers before writing them to the shared file");
+		bufferCmd.SetParameterName("records", true);
+		bufferCmd.SetRange("records>0");
+		bufferCmd.SetDefaultValue("65536");
+	}
+
+
+	void RunAction::SetScoringMode(G4String mode)
+	{
+		fScoringMode = mode;
+		fNtupleScoring = (mode == "ntuple" || mode == "both");
+		fHistogramScoring = (mode == "histogram" || mode == "both");
+	}
+
+
+	std::vector<G4double> RunAction::GetBinEdges() const
+	{
+		std::vector<G4double> edges;
+
+		if (fBinEdgesFile.empty() || fBinEdgesFile == "none")
+		{
+			// uniform binning
+			G4double width = (fMaxEnergy - fMinEnergy) / fNBins;
+			for (G4int i = 0; i <= fNBins; i++) { edges.push_back(fMinEnergy + i * width); }
+			return edges;
+		}
+
+		// bin edges file, e.g. written with np.savetxt from bin_edges.npy
+		std::ifstream edgesFile(fBinEdgesFile);
+		if (!edgesFile.is_open())
+		{
+			G4ExceptionDescription msg;
+			msg << "Cannot open bin edges file " << fBinEdgesFile;
+			G4Exception("RunAction::GetBinEdges()", "BremSim001", FatalException, msg);
+		}
+
+		std::string line;
+		while (std::getline(edgesFile, line))
+		{
+			if (line.empty() || line[0] == '#') { continue; }
+			std::istringstream values(line);
+			G4double edge;
+			while (values >> edge) { edges.push_back(edge * MeV); }
+		}
+
+		for (std::size_t i = 1; i < edges.size(); i++)
+		{
+			if (edges[i] <= edges[i - 1])
+			{
+				G4ExceptionDescription msg;
+				msg << "Bin edges in " << fBinEdgesFile << " are not strictly increasing";
+				G4Exception("RunAction::GetBinEdges()", "BremSim002", FatalException, msg);
+			}
+		}
+
+		if (edges.size() < 2)
+		{
+			G4ExceptionDescription msg;
+			msg << "Bin edges file " << fBinEdgesFile << " needs at least two edges";
+			G4Exception("RunAction::GetBinEdges()", "BremSim003", FatalException, msg);
+		}
+
+		return edges;
+	}
+
+
+	void RunAction::Book()
+	{
+		auto analysisManager = G4AnalysisManager::Instance();
+		std::vector<G4double> edges = GetBinEdges();
+
+		if (!fBooked)
+		{
+			// has to be decided before the first file is opened
+			analysisManager->SetNtupleMerging(fMergeNtuples);
+			fMergeNtuplesBooked = fMergeNtuples;
+
+			// biased runs need the per-row weight to be histogrammed correctly
+			const auto physicsList = static_cast<const PhysicsList*>(G4RunManager::GetRunManager()->GetUserPhysicsList());
+			fWeightColumnBooked = physicsList->GetBremSplittingFactor() > 1;
+
+			// create nTuple to store the absolute energies
+			// ParticleID stays an int column: Geant4 ntuples have no narrower integer type,
+			// but the 0/1/2 values compress to a fraction of a byte per row in the ROOT file
+			const G4int ntupleID1 = analysisManager->CreateNtuple("Absolute Energies", "Gamma Energies");
+			if (fFloatEnergies) { analysisManager->CreateNtupleFColumn(ntupleID1, "AbsEnergy"); }
+			else { analysisManager->CreateNtupleDColumn(ntupleID1, "AbsEnergy"); }
+			analysisManager->CreateNtupleIColumn(ntupleID1, "ParticleID"); // 0 for gamma, 1 for electron
+			if (fWeightColumnBooked) { analysisManager->CreateNtupleDColumn(ntupleID1, "Weight"); }
+			analysisManager->FinishNtuple(ntupleID1);
+
+			// create nTuple for the relative energies
+			const G4int ntupleId2 = analysisManager->CreateNtuple("Relative Energies", "Gamma Energies");
+			if (fFloatEnergies) { analysisManager->CreateNtupleFColumn(ntupleId2, "RelEnergy"); }
+			else { analysisManager->CreateNtupleDColumn(ntupleId2, "RelEnergy"); }
+			if (fWeightColumnBooked) { analysisManager->CreateNtupleDColumn(ntupleId2, "Weight"); }
+			analysisManager->FinishNtuple(ntupleId2);
+			fFloatEnergiesBooked = fFloatEnergies;
+
+			// energy spectra per particle species, named like the columns of the combined spectra table
+			fSpeciesH1Ids[0] = analysisManager->CreateH1("Photon_Spectrum", "Photon energy spectrum", edges, "MeV");
+			fSpeciesH1Ids[1] = analysisManager->CreateH1("Electron_Spectrum", "Electron energy spectrum", edges, "MeV");
+			fSpeciesH1Ids[2] = analysisManager->CreateH1("Positron_Spectrum", "Positron energy spectrum", edges, "MeV");
+
+			// events actually simulated (runs may stop early), written in every scoring mode
+			fEventCountH1Id = analysisManager->CreateH1("Event_Count", "Number of simulated events", 1, 0., 1.);
+
+			fBooked = true;
+		}
+		else
+		{
+			// binning may have changed between runs
+			for (G4int id : fSpeciesH1Ids) { analysisManager->SetH1(id, edges, "MeV"); }
+
+			if (fFloatEnergies != fFloatEnergiesBooked)
+			{
+				G4ExceptionDescription msg;
+				msg << "/BremSim/output/floatEnergies only takes effect before the first run, keeping "
+					<< (fFloatEnergiesBooked ? "float" : "double") << " energy columns";
+				G4Exception("RunAction::Book()", "BremSim004", JustWarning, msg);
+				fFloatEnergies = fFloatEnergiesBooked;
+			}
+
+			if (fMergeNtuples != fMergeNtuplesBooked)
+			{
+				G4ExceptionDescription msg;
+				msg << "/BremSim/output/mergeNtuples only takes effect before the first run, keeping "
+					<< (fMergeNtuplesBooked ? "merged" : "per-thread") << " ntuple files";
+				G4Exception("RunAction::Book()", "BremSim006", JustWarning, msg);
+				fMergeNtuples = fMergeNtuplesBooked;
+			}
+		}
+
+		// only the objects of the selected scoring mode end up in the file
+		analysisManager->SetNtupleActivation(0, IsAbsNtupleActive());
+		analysisManager->SetNtupleActivation(1, IsRelNtupleActive());
+		for (G4int id : fSpeciesH1Ids) { analysisManager->SetH1Activation(id, fHistogramScoring); }
+
+		// binning of the convergence check
+		fSpectrumEdges = edges;
+	}
+
+
+	G4String RunAction::GetOutputFileName() const
+	{
+		G4String fileName = G4AnalysisManager::Instance()->GetFileName();
+
+		// is_absolute follows the platform: /data/... on Linux, C:\... on Windows
+		if (fOutputDirectory.empty() || fileName.empty() || std::filesystem::path(std::string(fileName)).is_absolute()) { return fileName; }
+
+		// the analysis manager keeps the name of the last opened file, don't prefix it twice
+		G4String prefix = fOutputDirectory + "/";
+		if (fileName.compare(0, prefix.size(), prefix) == 0) { return fileName; }
+
+		return prefix + fileName;
+	}
+
+
+	G4String RunAction::GetOutputStem() const
+	{
+		G4String stem = GetOutputFileName();
+		if (stem.size() > 5 && stem.compare(stem.size() - 5, 5, ".root") == 0) { stem = stem.substr(0, stem.size() - 5); }
+		return stem;
+	}
+
+
+	void RunAction::RecordPhaseSpace(const PhaseSpaceRecord& record)
+	{
+		fPhaseSpaceBuffer.push_back(record);
+		if (fPhaseSpaceBuffer.size() >= static_cast<std::size_t>(fPhaseSpaceBufferSize))
+		{
+			fPhaseSpaceWriter.Write(fPhaseSpaceBuffer);
+			fPhaseSpaceBuffer.clear();
+		}
+	}
+
+
+	void RunAction::CountStep(const G4Step* step)
+	{
+		const G4Track* track = step->GetTrack();
+		auto key = std::make_pair(step->GetPreStepPoint()->GetTouchableHandle()->GetVolume()->GetLogicalVolume(),
+			track->GetParticleDefinition());
+
+		StepCounts& counts = fStepCounts[key];
+		counts.steps++;
+		if (track->GetCurrentStepNumber() == 1) { counts.tracks++; } // counted in the volume the track starts in
+	}
+
+
+	void RunAction::CollectPerf(const G4Run* run)
+	{
+		PerfRecord record;
+		record.threadId = G4Threading::G4GetThreadId();
+		record.events = run->GetNumberOfEvent();
+		record.seconds = fTimer.GetRealElapsed();
+		record.ntupleRows[0] = fNtupleRows[0];
+		record.ntupleRows[1] = fNtupleRows[1];
+
+		G4AutoLock lock(&fPerfMutex);
+		fPerfRecords.push_back(record);
+
+		// volumes may be rebuilt before the next run, keep the names only
+		for (const auto& [key, counts] : fStepCounts)
+		{
+			StepCounts& total = fPerfStepCounts[std::make_pair(key.first->GetName(), key.second->GetParticleName())];
+			total.steps += counts.steps;
+			total.tracks += counts.tracks;
+		}
+	}
+
+
+	void RunAction::WritePerf(const G4Run* run)
+	{
+		G4String rootFileName = GetOutputFileName();
+		G4String perfFileName = GetOutputStem() + "_perf.json";
+
+		G4AutoLock lock(&fPerfMutex);
+
+		std::ofstream perfFile(perfFileName);
+		if (!perfFile.is_open())
+		{
+			G4ExceptionDescription msg;
+			msg << "Cannot write performance counters to " << perfFileName;
+			G4Exception("RunAction::WritePerf()", "BremSim008", JustWarning, msg);
+		}
+		else
+		{
+			G4double seconds = fTimer.GetRealElapsed();
+			G4int events = run->GetNumberOfEvent();
+
+			perfFile << "{\n";
+			perfFile << "  \"output\": " << JsonString(rootFileName) << ",\n";
+			perfFile << "  \"run_id\": " << run->GetRunID() << ",\n";
+			perfFile << "  \"events\": " << events << ",\n";
+			perfFile << "  \"seconds\": " << seconds << ",\n";
+			perfFile << "  \"events_per_s\": " << (seconds > 0. ? events / seconds : 0.) << ",\n";
+
+			perfFile << "  \"threads\": [";
+			for (std::size_t i = 0; i < fPerfRecords.size(); i++)
+			{
+				const PerfRecord& r = fPerfRecords[i];
+				perfFile << (i ? ",\n" : "\n")
+					<< "    {\"thread\": " << r.threadId
+					<< ", \"events\": " << r.events
+					<< ", \"seconds\": " << r.seconds
+					<< ", \"events_per_s\": " << (r.seconds > 0. ? r.events / r.seconds : 0.)
+					<< ", \"abs_ntuple_rows\": " << r.ntupleRows[0]
+					<< ", \"rel_ntuple_rows\": " << r.ntupleRows[1] << "}";
+			}
+			perfFile << "\n  ],\n";
+
+			perfFile << "  \"steps\": [";
+			G4bool first = true;
+			for (const auto& [key, counts] : fPerfStepCounts)
+			{
+				perfFile << (first ? "\n" : ",\n")
+					<< "    {\"volume\": " << JsonString(key.first)
+					<< ", \"species\": " << JsonString(key.second)
+					<< ", \"steps\": " << counts.steps
+					<< ", \"tracks\": " << counts.tracks << "}";
+				first = false;
+			}
+			perfFile << "\n  ]\n";
+			perfFile << "}\n";
+		}
+
+		fPerfRecords.clear();
+		fPerfStepCounts.clear();
+	}
+
+
+	void RunAction::ScoreConvergence(G4double energy, G4double weight)
+	{
+		auto it = std::upper_bound(fSpectrumEdges.begin(), fSpectrumEdges.end(), energy);
+		if (it == fSpectrumEdges.begin() || it == fSpectrumEdges.end()) { return; } // outside the binning
+
+		std::size_t bin = (it - fSpectrumEdges.begin()) - 1;
+		fSumW[bin] += weight;
+		fSumW2[bin] += weight * weight;
+		fEntries[bin]++;
+	}
+
+
+	void RunAction::EndOfEvent()
+	{
+		if (!fConverged && ++fEventsSinceCheck >= fCheckInterval)
+		{
+			fEventsSinceCheck = 0;
+			if (CheckConvergence()) { fConverged = true; }
+		}
+
+		// another thread may have reached the target, finish the current event and stop
+		if (fConverged) { G4RunManager::GetRunManager()->AbortRun(true); }
+	}
+
+
+	G4bool RunAction::CheckConvergence()
+	{
+		G4AutoLock lock(&fConvergenceMutex);
+
+		// hand the statistics of this thread over
+		for (std::size_t i = 0; i < fSumW.size(); i++)
+		{
+			fSharedSumW[i] += fSumW[i];
+			fSharedSumW2[i] += fSumW2[i];
+			fSharedEntries[i] += fEntries[i];
+		}
+		std::fill(fSumW.begin(), fSumW.end(), 0.);
+		std::fill(fSumW2.begin(), fSumW2.end(), 0.);
+		std::fill(fEntries.begin(), fEntries.end(), 0);
+
+		// Largest relative error over the bins holding at least fPeakFraction of the peak bin. The spectrum
+		// falls off continuously towards the endpoint, so a check over every populated bin would always find
+		// a tail bin short of the target and never stop. With the defaults (1 %, 0.1) the peak bin needs
+		// about 10^5 entries, and the tail below 10 % of the peak is left to the full /run/beamOn.
+		if (fSharedSumW.empty()) { return false; }
+		const G4double peak = *std::max_element(fSharedSumW.begin(), fSharedSumW.end());
+		G4double maxError = -1.;
+		for (std::size_t i = 0; i < fSharedSumW.size(); i++)
+		{
+			if (fSharedEntries[i] < fMinBinEntries || fSharedSumW[i] <= 0. || fSharedSumW[i] < fPeakFraction * peak) { continue; }
+			maxError = std::max(maxError, std::sqrt(fSharedSumW2[i]) / fSharedSumW[i]);
+		}
+
+		if (maxError < 0. || maxError > fTargetError) { return false; }
+
+		G4cout << "Photon spectrum converged: largest relative error of the bins above " << fPeakFraction
+			<< " of the peak " << maxError << " <= " << fTargetError << ", stopping the run" << G4endl;
+		return true;
 	}
 
 
 	void RunAction::BeginOfRunAction(const G4Run* run)
 	{
-		// start time 
+		// start time
 		fTimer.Start();
 
+		// counters start from zero every run
+		fNtupleRows[0] = fNtupleRows[1] = 0;
+		fStepCounts.clear();
+
 		auto analysisManager = G4AnalysisManager::Instance();
 
+		// book ntuples/histograms for the current scoring mode
+		Book();
+
+		// convergence statistics start from empty, the master resets the shared ones before the workers start
+		if (fConvergenceEnabled)
+		{
+			std::size_t nBins = fSpectrumEdges.size() - 1;
+			fSumW.assign(nBins, 0.);
+			fSumW2.assign(nBins, 0.);
+			fEntries.assign(nBins, 0);
+			fEventsSinceCheck = 0;
+
+			if (IsMaster())
+			{
+				G4AutoLock lock(&fConvergenceMutex);
+				fSharedSumW.assign(nBins, 0.);
+				fSharedSumW2.assign(nBins, 0.);
+				fSharedEntries.assign(nBins, 0);
+				fConverged = false;
+			}
+		}
+
 		// open the file at the start of the run
-		analysisManager->OpenFile();
+		analysisManager->OpenFile(GetOutputFileName());
+
+		// the master opens the shared phase-space file before the workers start
+		fPhaseSpaceBuffer.clear();
+		if (fPhaseSpaceRecording && IsMaster()) { fPhaseSpaceWriter.Open(GetOutputStem() + "_phsp.bin"); }
 	}
 
 
 	void RunAction::EndOfRunAction(const G4Run* run)
 	{
 		auto analysisManager = G4AnalysisManager::Instance();
+		G4bool eventLoopThread = !IsMaster() || !G4Threading::IsMultithreadedApplication();
+
+		// events simulated by this thread, summed over the workers by the histogram merge
+		if (eventLoopThread) { analysisManager->FillH1(fEventCountH1Id, 0.5, run->GetNumberOfEvent()); }
 
-		// write to output file 
+		// the workers finish before the master, which closes the phase-space file with the total number of primaries
+		if (fPhaseSpaceRecording)
+		{
+			if (eventLoopThread)
+			{
+				fPhaseSpaceWriter.Write(fPhaseSpaceBuffer);
+				fPhaseSpaceBuffer.clear();
+			}
+			if (IsMaster()) { fPhaseSpaceWriter.Close(run->GetNumberOfEvent()); }
+		}
+
+		// write to output file (histograms are merged into the master here)
 		analysisManager->Write();
 		analysisManager->CloseFile();
 
+		// histograms are accumulated per run, start the next run from empty
+		if (fHistogramScoring) { analysisManager->Reset(); }
+		else { analysisManager->GetH1(fEventCountH1Id)->reset(); }
+
 		// end time
 		fTimer.Stop();
 
-		// print out the time it took 
+		// print out the time it took
 		if(IsMaster()){ PrintTime(); }
+
+		// workers (or the only thread of a serial run) hand their counters over, the master writes them
+		if (fPerfEnabled)
+		{
+			if (eventLoopThread) { CollectPerf(run); }
+			if (IsMaster()) { WritePerf(run); }
+		}
 	}
 
 
@@ -68,10 +611,10 @@ namespace BremSim
 	{
 		auto time = fTimer.GetRealElapsed();
 
-		G4cout 
+		G4cout
 			<< "Elapsed time: "
 			<< time
 			<< " Seconds."
 			<< G4endl;
 	}
-}
\ No newline at end of file
+}
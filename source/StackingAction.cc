@@ -0,0 +1,60 @@
+#include "StackingAction.hh"
+#include "DetectorConstruction.hh"
+
+#include "G4Track.hh"
+#include "G4RunManager.hh"
+#include "G4Gamma.hh"
+#include "G4Positron.hh"
+
+
+namespace BremSim
+{
+	StackingAction::StackingAction()
+	{
+		DefineCommands();
+	}
+
+	StackingAction::~StackingAction()
+	{
+		delete fMessenger;
+	}
+
+	void StackingAction::DefineCommands()
+	{
+		fMessenger = new G4GenericMessenger(this, "/BremSim/stack/", "Track stacking control");
+
+		// photons and positrons are scored when they are created; delta electrons in the foil are
+		// still tracked, their bremsstrahlung and deltas are part of the spectra
+		auto& secondariesCmd = fMessenger->DeclareProperty("killSecondaries", fKillSecondaries,
+			"Kill secondaries that cannot add to the scored spectra once they are scored: photons and positrons, and everything created outside the foil");
+		secondariesCmd.SetParameterName("kill", true);
+		secondariesCmd.SetDefaultValue("true");
+
+		// secondaries created in the air or the detector are never scored
+		auto& outsideCmd = fMessenger->DeclareProperty("killOutsideFoil", fKillOutsideFoil,
+			"Kill secondaries created outside the foil");
+		outsideCmd.SetParameterName("kill", true);
+		outsideCmd.SetDefaultValue("true");
+	}
+
+	G4ClassificationOfNewTrack StackingAction::ClassifyNewTrack(const G4Track* track)
+	{
+		// always track primaries
+		if (track->GetParentID() == 0) { return fUrgent; }
+
+		if (fKillSecondaries)
+		{
+			const G4ParticleDefinition* particle = track->GetParticleDefinition();
+			if (particle == G4Gamma::Definition() || particle == G4Positron::Definition()) { return fKill; }
+		}
+
+		if (fKillOutsideFoil || fKillSecondaries)
+		{
+			const auto detConstruction = static_cast<const DetectorConstruction*>(G4RunManager::GetRunManager()->GetUserDetectorConstruction());
+			G4VPhysicalVolume* volume = track->GetVolume();
+			if (volume != nullptr && volume->GetLogicalVolume() != detConstruction->GetBremsVolume()) { return fKill; }
+		}
+
+		return fUrgent;
+	}
+}
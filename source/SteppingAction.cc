@@ -8,13 +8,95 @@
 #include "G4RunManager.hh"
 
 #include "G4UnitsTable.hh"
+#include "G4SystemOfUnits.hh"
+
+#include <sstream>
 
 
 namespace BremSim
 {
-	SteppingAction::SteppingAction(){}
+	SteppingAction::SteppingAction(RunAction* runAction)
+		: fRunAction(runAction)
+	{
+		DefineCommands();
+	}
 	
-	SteppingAction::~SteppingAction(){}
+	SteppingAction::~SteppingAction(){ delete fMessenger; }
+
+	void SteppingAction::DefineCommands()
+	{
+		fMessenger = new G4GenericMessenger(this, "/BremSim/step/", "Scoring filters");
+
+		// e.g. drop low-energy delta electrons
+		auto& minEnergyCmd = fMessenger->DeclarePropertyWithUnit("minEnergy", "keV", fMinEnergy, "Do not score secondaries below this kinetic energy");
+		minEnergyCmd.SetParameterName("minEnergy", true);
+		minEnergyCmd.SetRange("minEnergy>=0.");
+		minEnergyCmd.SetDefaultValue("0.");
+
+		auto& speciesCmd = fMessenger->DeclareMethod("species", &SteppingAction::SetScoredSpecies,
+			"Comma separated list of scored secondaries (gamma,e-,e+) or all");
+		speciesCmd.SetParameterName("species", true);
+		speciesCmd.SetDefaultValue("all");
+
+		auto& killCmd = fMessenger->DeclareProperty("killOnFoilExit", fKillOnFoilExit,
+			"Kill every track (primary or secondary) when it leaves the foil");
+		killCmd.SetParameterName("kill", true);
+		killCmd.SetDefaultValue("true");
+	}
+
+	void SteppingAction::SetScoredSpecies(G4String species)
+	{
+		if (species == "all")
+		{
+			for (G4bool& score : fScoreSpecies) { score = true; }
+			return;
+		}
+
+		for (G4bool& score : fScoreSpecies) { score = false; }
+
+		std::istringstream list(species);
+		std::string name;
+		while (std::getline(list, name, ','))
+		{
+			if (name == "gamma") { fScoreSpecies[0] = true; }
+			else if (name == "e-") { fScoreSpecies[1] = true; }
+			else if (name == "e+") { fScoreSpecies[2] = true; }
+			else
+			{
+				G4ExceptionDescription msg;
+				msg << "Unknown species \"" << name << "\" in /BremSim/step/species, expected gamma, e- or e+";
+				G4Exception("SteppingAction::SetScoredSpecies()", "BremSim005", JustWarning, msg);
+			}
+		}
+	}
+
+	void SteppingAction::RecordFoilExit(const G4Step* step, G4double foilThickness)
+	{
+		const G4StepPoint* postStep = step->GetPostStepPoint();
+		if (postStep->GetStepStatus() != fGeomBoundary) { return; }
+
+		// the foil is centred at the origin, its downstream face is at z = +T/2
+		const G4ThreeVector& position = postStep->GetPosition();
+		const G4ThreeVector& direction = postStep->GetMomentumDirection();
+		if (direction.z() <= 0. || position.z() < 0.5 * foilThickness - 1. * nm) { return; }
+
+		G4String particleName = step->GetTrack()->GetParticleDefinition()->GetParticleName();
+		PhaseSpaceRecord record;
+		if (particleName == "gamma") { record.species = 0; }
+		else if (particleName == "e-") { record.species = 1; }
+		else if (particleName == "e+") { record.species = 2; }
+		else { return; }
+
+		record.energy = postStep->GetKineticEnergy() / MeV;
+		record.x = position.x() / mm;
+		record.y = position.y() / mm;
+		record.z = position.z() / mm;
+		record.dx = direction.x();
+		record.dy = direction.y();
+		record.dz = direction.z();
+		record.weight = step->GetTrack()->GetWeight();
+		fRunAction->RecordPhaseSpace(record);
+	}
 
 	void SteppingAction::UserSteppingAction(const G4Step* step)
 	{
@@ -26,8 +108,25 @@ namespace BremSim
 			step->GetPreStepPoint()->GetTouchableHandle()
 			->GetVolume()->GetLogicalVolume();
 
+		// steps and tracks in every volume, before anything outside the foil is skipped
+		if (fRunAction->IsPerfEnabled()) { fRunAction->CountStep(step); }
+
 		if (currentVolume != fBremsVolume){ return; }
 
+		// phase space: particles leaving through the downstream face of the foil
+		if (fRunAction->IsPhaseSpaceRecording()) { RecordFoilExit(step, detConstruction->GetFoilThickness()); }
+
+		// score-and-kill: nothing outside the foil is scored, stop tracking at the exit.
+		// Secondaries of this step are still scored below.
+		if (fKillOnFoilExit && step->GetPostStepPoint()->GetStepStatus() == fGeomBoundary)
+		{
+			G4VPhysicalVolume* nextVolume = step->GetPostStepPoint()->GetPhysicalVolume();
+			if (nextVolume == nullptr || nextVolume->GetLogicalVolume() != fBremsVolume)
+			{
+				step->GetTrack()->SetTrackStatus(fStopAndKill);
+			}
+		}
+
 		// ntuples for analysis 
 		G4int absNTupleID = 0;
 		G4int relNTupleID = 1;
@@ -62,16 +161,38 @@ namespace BremSim
 				else if (particleName == "e-") { particleID = 1; }
 				else if (particleName == "e+") { particleID = 2; }
 
+				// scoring filters
+				if (!fScoreSpecies[particleID] || energy < fMinEnergy) { continue; }
+
+				// statistical weight, below 1 for split bremsstrahlung photons
+				G4double weight = track->GetWeight();
+
+				// running photon statistics for the convergence-based early stop
+				if (particleID == 0 && fRunAction->IsConvergenceEnabled()) { fRunAction->ScoreConvergence(energy, weight); }
+
+				// histogram scoring: bin the energy directly instead of writing a row
+				if (fRunAction->IsHistogramScoring()) {
+					analysisManager->FillH1(fRunAction->GetSpeciesH1Id(particleID), energy, weight);
+				}
+
 				// total energy
-				analysisManager->FillNtupleDColumn(absNTupleID, 0, energy);
-				analysisManager->FillNtupleIColumn(absNTupleID, 1, particleID);
-				analysisManager->AddNtupleRow(absNTupleID);
+				if (fRunAction->IsAbsNtupleActive()) {
+					if (fRunAction->HasFloatEnergies()) { analysisManager->FillNtupleFColumn(absNTupleID, 0, energy); }
+					else { analysisManager->FillNtupleDColumn(absNTupleID, 0, energy); }
+					analysisManager->FillNtupleIColumn(absNTupleID, 1, particleID);
+					if (fRunAction->HasWeightColumn()) { analysisManager->FillNtupleDColumn(absNTupleID, 2, weight); }
+					analysisManager->AddNtupleRow(absNTupleID);
+					if (fRunAction->IsPerfEnabled()) { fRunAction->CountNtupleRow(absNTupleID); }
+				}
 
 				// relative energy to incident electron
-				if (particleName == "gamma") {
+				if (particleName == "gamma" && fRunAction->IsRelNtupleActive()) {
 					G4double relEnergy = energy/electronEnergy;
-					analysisManager->FillNtupleDColumn(relNTupleID, 0, relEnergy);
+					if (fRunAction->HasFloatEnergies()) { analysisManager->FillNtupleFColumn(relNTupleID, 0, relEnergy); }
+					else { analysisManager->FillNtupleDColumn(relNTupleID, 0, relEnergy); }
+					if (fRunAction->HasWeightColumn()) { analysisManager->FillNtupleDColumn(relNTupleID, 1, weight); }
 					analysisManager->AddNtupleRow(relNTupleID);
+					if (fRunAction->IsPerfEnabled()) { fRunAction->CountNtupleRow(relNTupleID); }
 				}
 			}
 		}